@@ -2,18 +2,28 @@
 """
 Google Colab Batch Processor for Faster-Whisper
 This script is designed to run in Google Colab with GPU acceleration
-SEPARATE module - does not interfere with existing project!
+Uses the project's src package (file discovery, sharding, run reports), so the
+repository is copied to Colab with it, e.g. git clone into /content
 """
 
 import os
 import sys
-import glob
+import json
 import time
 from pathlib import Path
 
+# Add path to src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.file_discovery import iter_audio_files
+from src.autotune import model_kwargs
+from src.sharding import (parse_shard, select_shard, relative_key, shard_manifest_name,
+                          merge_shard_manifests, file_md5, SHARD_STRATEGIES)
+from src.run_report import RunReport, report_enabled, stage_timer, summary_lines
+
 # Try to import faster-whisper
 try:
-    from faster_whisper import WhisperModel
+    from faster_whisper import WhisperModel, decode_audio
     FASTER_WHISPER_AVAILABLE = True
 except ImportError:
     print("faster-whisper not installed. Install with: !pip install faster-whisper")
@@ -66,41 +76,72 @@ def get_colab_faster_whisper_model(device="cuda", compute_type="float16"):
         _colab_model = WhisperModel(
             "small",  # You can change to "medium" for better quality
             device=device,
-            compute_type=compute_type
+            **model_kwargs("small", device, compute_type, parallel=False)
         )
         print("✅ Model loaded successfully!")
     
     return _colab_model
 
-def transcribe_audio_colab(file_path, device="cuda", compute_type="float16"):
-    """Transcribe audio using faster-whisper in Colab"""
+def transcribe_audio_colab(file_path, device="cuda", compute_type="float16", timings=None):
+    """Transcribe audio using faster-whisper in Colab
+
+    timings (a dict) receives decode_seconds, inference_seconds and the audio duration.
+    """
+    timings = timings if timings is not None else {}
     try:
         print(f"🎵 Processing: {os.path.basename(file_path)}")
         
         # Get model
         model = get_colab_faster_whisper_model(device, compute_type)
         
-        # Transcribe directly (no WAV conversion needed in Colab)
-        segments, info = model.transcribe(
-            file_path, 
-            language=None,  # Auto language detection
-            beam_size=1,    # Faster
-            best_of=1,      # Faster
-            temperature=0   # More stable results
-        )
+        # Decoded separately (no WAV conversion needed in Colab) so the report can tell the stages apart
+        with stage_timer(timings, 'decode'):
+            audio = decode_audio(file_path)
+        timings["duration"] = len(audio) / 16000
         
-        # Collect text from segments
-        transcription = ""
-        for segment in segments:
-            transcription += segment.text + " "
+        with stage_timer(timings, 'inference'):
+            segments, info = model.transcribe(
+                audio, 
+                language=None,  # Auto language detection
+                beam_size=1,    # Faster
+                best_of=1,      # Faster
+                temperature=0   # More stable results
+            )
+            
+            # Collect text from segments
+            transcription = ""
+            for segment in segments:
+                transcription += segment.text + " "
             
         return transcription.strip(), None
         
     except Exception as e:
         return None, str(e)
 
-def process_batch_colab(source_dir=None, output_dir=None):
-    """Process batch of audio files in Google Colab"""
+def write_manifest(output_dir, output_files, manifest_name='manifest.json', extra=None):
+    """List the produced files with MD5 checksums, written last so fetchers know the run is done"""
+    entries = [
+        {"name": os.path.basename(output_file), "md5": file_md5(output_file)}
+        for output_file in output_files
+    ]
+
+    manifest_path = os.path.join(output_dir, manifest_name)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"files": entries, "created": time.strftime('%Y-%m-%dT%H:%M:%S'), **(extra or {})}, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    print(f"📋 Manifest written: {manifest_path} ({len(entries)} files)")
+    return manifest_path
+
+def process_batch_colab(source_dir=None, output_dir=None, shard=None, shard_strategy='hash'):
+    """Process batch of audio files in Google Colab
+    
+    Args:
+        shard (str): 'i/N' - process only shard i of N (0-based), for running
+                     several Colab sessions or machines on one source folder
+        shard_strategy (str): 'hash' - stable hash of the relative path,
+                              'duration' - balance total audio duration per shard
+    """
     if not FASTER_WHISPER_AVAILABLE:
         print("❌ Install faster-whisper first: !pip install faster-whisper")
         return
@@ -126,6 +167,8 @@ def process_batch_colab(source_dir=None, output_dir=None):
     print(f"📁 Output directory: {output_dir}")
     print(f"🖥️  Device: {device}")
     print(f"⚡ Compute type: {compute_type}")
+    if shard:
+        print(f"🧩 Shard: {shard} ({shard_strategy})")
     print("=" * 80)
     
     # Check if source directory exists
@@ -133,47 +176,63 @@ def process_batch_colab(source_dir=None, output_dir=None):
         print(f"❌ ERROR: Source directory not found: {source_dir}")
         return
     
-    # Find all audio files
-    audio_extensions = ['*.m4a', '*.ogg', '*.wav', '*.mp3', '*.flac', '*.aac']
-    audio_files = []
-    
-    for ext in audio_extensions:
-        pattern = os.path.join(source_dir, '**', ext)
-        files = glob.glob(pattern, recursive=True)
-        audio_files.extend(files)
+    audio_files = iter_audio_files(source_dir)
+    if shard:
+        shard_index, shard_count = parse_shard(shard)
+        audio_files = select_shard(audio_files, source_dir, shard_index, shard_count, shard_strategy)
     
-    if not audio_files:
-        print(f"❌ No audio files found in {source_dir}")
-        return
-    
-    print(f"📊 Found {len(audio_files)} audio files")
-    
-    # Process files
+    # Process audio files as they are found
     success_count = 0
     error_count = 0
+    total_files = 0
+    output_files = []
+    inputs = []
+    failed_inputs = []
+    report = None
+    if report_enabled():
+        # Shards share the output folder
+        report = RunReport(output_dir, f"run_report_shard{shard_index}" if shard else 'run_report')
     
     start_time = time.time()
     
     for i, file_path in enumerate(audio_files, 1):
-        print(f"\n[{i}/{len(audio_files)}] ", end="")
+        total_files = i
+        print(f"\n[{i}] ", end="")
         
         file_start = time.time()
+        inputs.append(relative_key(file_path, source_dir))
         
         # Transcribe
-        transcription, error = transcribe_audio_colab(file_path, device, compute_type)
+        timings = {}
+        transcription, error = transcribe_audio_colab(file_path, device, compute_type, timings)
         
         if error:
             print(f"❌ Error: {error}")
             error_count += 1
+            failed_inputs.append(inputs[-1])
+            if report is not None:
+                report.add(file_path, 'error', timings.get("duration"), "small", timings,
+                           time.time() - file_start, error)
             continue
         
         if transcription and transcription.strip():
-            # Generate output filename
-            base_name = os.path.splitext(os.path.basename(file_path))[0]
+            # Generate output filename from the relative path, so same-named files in
+            # different folders (or shards sharing the output folder) do not collide
+            base_name = os.path.splitext(inputs[-1].replace('/', '_'))[0]
             output_file = os.path.join(output_dir, f"{base_name}_COLAB_transcription.txt")
+            if output_file in output_files:
+                # e.g. a.mp3 and a.wav in one folder
+                error = f"Output name already used in this run: {os.path.basename(output_file)}"
+                print(f"❌ Error: {error}")
+                error_count += 1
+                failed_inputs.append(inputs[-1])
+                if report is not None:
+                    report.add(file_path, 'error', timings.get("duration"), "small", timings,
+                               time.time() - file_start, error)
+                continue
             
             # Save transcription
-            with open(output_file, 'w', encoding='utf-8') as f:
+            with stage_timer(timings, 'write'), open(output_file, 'w', encoding='utf-8') as f:
                 f.write(f"Source file: {file_path}\n")
                 f.write("Method: Faster-Whisper (Google Colab)\n")
                 f.write(f"Device: {device}\n")
@@ -181,15 +240,28 @@ def process_batch_colab(source_dir=None, output_dir=None):
                 f.write("=" * 60 + "\n\n")
                 f.write(transcription)
             
+            output_files.append(output_file)
             print(f"✅ Saved: {output_file}")
             print(f"📝 Text: {transcription[:100]}...")
             success_count += 1
         else:
             print("❌ Empty transcription")
             error_count += 1
+            failed_inputs.append(inputs[-1])
         
         file_end = time.time()
         print(f"⏱️ Time: {file_end - file_start:.1f}s")
+        if report is not None:
+            status = 'ok' if transcription and transcription.strip() else 'empty'
+            report.add(file_path, status, timings.get("duration"), "small", timings, file_end - file_start)
+    
+    if total_files == 0:
+        print(f"❌ No audio files found in {source_dir}")
+        if shard:
+            # An empty shard still reports, so the merge step can account for it
+            write_manifest(output_dir, [], shard_manifest_name(shard_index, shard_count),
+                           {"shard": shard, "strategy": shard_strategy, "inputs": [], "failed": []})
+        return
     
     end_time = time.time()
     total_time = end_time - start_time
@@ -200,12 +272,43 @@ def process_batch_colab(source_dir=None, output_dir=None):
     print("=" * 80)
     print(f"✅ Successfully processed: {success_count}")
     print(f"❌ Errors: {error_count}")
-    print(f"📊 Total files processed: {len(audio_files)}")
+    print(f"📊 Total files processed: {total_files}")
     print(f"⏱️ Total time: {total_time:.1f}s")
     if success_count > 0:
-        print(f"⚡ Average time per file: {total_time/len(audio_files):.1f}s")
+        print(f"⚡ Average time per file: {total_time/total_files:.1f}s")
     print(f"📂 Output directory: {output_dir}")
     print("Files saved with '_COLAB_' prefix")
+    
+    if report is not None:
+        for line in summary_lines(report.aggregates()):
+            print(f"📊 {line}")
+        report_path = report.write()
+        if report_path:
+            # Listed in the manifest so result fetchers download it with the transcriptions
+            output_files.extend([report_path[:-len('.json')] + '.csv', report_path])
+            print(f"📋 Run report: {report_path}")
+    
+    if shard:
+        write_manifest(output_dir, output_files, shard_manifest_name(shard_index, shard_count),
+                       {"shard": shard, "strategy": shard_strategy, "inputs": inputs, "failed": failed_inputs})
+    else:
+        write_manifest(output_dir, output_files)
+
+def merge_shards(output_dir, shard_count, source_dir=None):
+    """Combine the shard manifests into manifest.json after all shards finished"""
+    expected_inputs = None
+    if source_dir:
+        expected_inputs = [relative_key(path, source_dir) for path in iter_audio_files(source_dir)]
+    
+    problems = merge_shard_manifests(output_dir, shard_count, expected_inputs)
+    if problems:
+        print(f"❌ Shard merge failed with {len(problems)} problem(s):")
+        for problem in problems:
+            print(f"   - {problem}")
+        return False
+    
+    print(f"✅ All {shard_count} shards merged into {os.path.join(output_dir, 'manifest.json')}")
+    return True
 
 # Example usage function for Colab
 def colab_example():
@@ -213,7 +316,7 @@ def colab_example():
     print("""
     🚀 GOOGLE COLAB USAGE EXAMPLE:
     
-    1. Upload this script to Colab
+    1. Upload this script and the src/ folder to Colab
     2. Install faster-whisper: !pip install faster-whisper
     3. Mount Google Drive: 
        from google.colab import drive
@@ -224,5 +327,29 @@ def colab_example():
     That's it! GPU acceleration included! 🚀
     """)
 
+def main():
+    """Command line entry point"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Colab/worker batch processor')
+    parser.add_argument('--source', '-s', help='Source directory (default: GOOGLE_DRIVE_PATH)')
+    parser.add_argument('--output', '-o', help='Output directory (default: /content/output)')
+    parser.add_argument('--shard', help='Process only shard i/N of the files (0-based, e.g. 0/4)')
+    parser.add_argument('--shard-strategy', default='hash', choices=SHARD_STRATEGIES,
+                        help='hash - stable hash of the path, duration - balance audio duration (default: hash)')
+    parser.add_argument('--merge', type=int, metavar='N',
+                        help='Validate and merge the manifests of N shards in the output directory')
+    
+    args = parser.parse_args()
+    
+    if args.merge:
+        ok = merge_shards(args.output or "/content/output", args.merge, args.source)
+        sys.exit(0 if ok else 1)
+    
+    process_batch_colab(args.source, args.output, args.shard, args.shard_strategy)
+
 if __name__ == "__main__":
-    colab_example()
+    if len(sys.argv) > 1:
+        main()
+    else:
+        colab_example()
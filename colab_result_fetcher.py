@@ -5,18 +5,22 @@ Colab Result Fetcher
 - Saves them to the local output directory
 - Logs the start and end time of the transfer
 - Preserves file names as in Colab
+
+Only files changed since the last poll are listed (modifiedTime watermark),
+downloads run in parallel in resumable chunks and are verified by MD5, and the
+run is complete when every file listed in the manifest written by
+colab_batch_processor has been fetched.
 """
 
 import os
+import json
 import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
-# pip install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from google.oauth2 import service_account
-
 
 # Settings
 GOOGLE_DRIVE_OUTPUT_FOLDER_ID = os.getenv('GOOGLE_DRIVE_OUTPUT_FOLDER_ID')  # Output folder ID for results
@@ -25,83 +29,218 @@ LOCAL_OUTPUT_PATH = os.getenv('OUTPUT_DIR', './output')  # Local output folder
 SERVICE_ACCOUNT_FILE = os.getenv('GOOGLE_SERVICE_ACCOUNT', 'service_account.json')  # Service account JSON key
 SCOPES = ['https://www.googleapis.com/auth/drive']
 
+MANIFEST_NAME = 'manifest.json'  # Written by colab_batch_processor when a run is finished
+EXPECTED_FILES = int(os.getenv('EXPECTED_FILES', '0'))  # Fallback when no manifest is written
+POLL_INTERVAL = float(os.getenv('FETCH_POLL_INTERVAL', '30'))
+DOWNLOAD_WORKERS = int(os.getenv('FETCH_WORKERS', '4'))
+CHUNK_SIZE = int(os.getenv('FETCH_CHUNK_SIZE', str(8 * 1024 * 1024)))
+MAX_DOWNLOAD_ATTEMPTS = int(os.getenv('FETCH_MAX_ATTEMPTS', '3'))
+# Give up when nothing new arrived for this long (0 = wait forever)
+IDLE_TIMEOUT = float(os.getenv('FETCH_IDLE_TIMEOUT', '3600'))
+
 def get_drive_service():
+    # pip install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib
+    from googleapiclient.discovery import build
+    from google.oauth2 import service_account
+
     creds = service_account.Credentials.from_service_account_file(
         SERVICE_ACCOUNT_FILE, scopes=SCOPES)
     service = build('drive', 'v3', credentials=creds)
     return service
 
-def list_files_in_folder(service, folder_id):
-    query = f"'{folder_id}' in parents and trashed=false"
-    # Also get mimeType to skip Google Docs files
-    results = service.files().list(q=query, fields='files(id, name, modifiedTime, mimeType)').execute()
-    return results.get('files', [])
-
-def download_file(service, file_id, file_name, local_path):
-    request = service.files().get_media(fileId=file_id)
-    local_file = os.path.join(local_path, file_name)
-    fh = open(local_file, 'wb')
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-    fh.close()
-    print(f"✅ Downloaded: {file_name}")
-
-
 
-def fetch_colab_results():
+class DriveClient:
+    """Drive access used by the fetcher
+
+    Anything with the same two methods (list_files, download_range) can be
+    passed to fetch_colab_results instead, e.g. a local fake for testing.
+    """
+
+    def __init__(self, service_factory=get_drive_service):
+        # Drive service objects are not thread-safe, so each thread gets its own
+        self.service_factory = service_factory
+        self._local = threading.local()
+
+    @property
+    def service(self):
+        if not hasattr(self._local, 'service'):
+            self._local.service = self.service_factory()
+        return self._local.service
+
+    def list_files(self, folder_id, modified_after=None):
+        """All files in the folder (every page), optionally only modified since a timestamp"""
+        query = f"'{folder_id}' in parents and trashed=false"
+        if modified_after:
+            query += f" and modifiedTime >= '{modified_after}'"
+
+        files = []
+        page_token = None
+        while True:
+            # Also get mimeType to skip Google Docs files
+            results = self.service.files().list(
+                q=query,
+                fields='nextPageToken, files(id, name, modifiedTime, mimeType, md5Checksum, size)',
+                pageSize=1000,
+                pageToken=page_token
+            ).execute()
+            files.extend(results.get('files', []))
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return files
+
+    def download_range(self, file_id, start, end):
+        """Bytes start..end (inclusive) of a file"""
+        request = self.service.files().get_media(fileId=file_id)
+        request.headers['Range'] = f'bytes={start}-{end}'
+        return request.execute()
+
+
+def file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+def download_file(client, file_info, local_path, expected_md5=None):
+    """Download in chunks into a .part file (resumed if present), verify and rename"""
+    local_file = os.path.join(local_path, file_info['name'])
+    expected_md5 = expected_md5 or file_info.get('md5Checksum')
+    size = int(file_info.get('size', 0))
+
+    if os.path.exists(local_file) and expected_md5 and file_md5(local_file) == expected_md5:
+        return True
+
+    part_file = local_file + '.part'
+    for attempt in range(1, MAX_DOWNLOAD_ATTEMPTS + 1):
+        offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+        try:
+            with open(part_file, 'ab') as fh:
+                while offset < size:
+                    data = client.download_range(file_info['id'], offset, min(offset + CHUNK_SIZE, size) - 1)
+                    if not data:
+                        break
+                    fh.write(data)
+                    offset += len(data)
+        except Exception as e:
+            print(f"⚠️ Download interrupted ({attempt}/{MAX_DOWNLOAD_ATTEMPTS}): {file_info['name']}: {e}")
+            continue
+        if offset < size:
+            # The .part file is kept, the next attempt resumes from here
+            print(f"⚠️ Download ended early at {offset}/{size} bytes ({attempt}/{MAX_DOWNLOAD_ATTEMPTS}): "
+                  f"{file_info['name']}")
+            continue
+
+        if os.path.getsize(part_file) != size:
+            print(f"⚠️ Size mismatch ({attempt}/{MAX_DOWNLOAD_ATTEMPTS}): {file_info['name']}")
+            os.remove(part_file)
+            continue
+        if expected_md5 and file_md5(part_file) != expected_md5:
+            print(f"⚠️ Checksum mismatch ({attempt}/{MAX_DOWNLOAD_ATTEMPTS}): {file_info['name']}")
+            os.remove(part_file)
+            continue
+
+        os.replace(part_file, local_file)
+        print(f"✅ Downloaded: {file_info['name']}")
+        return True
+
+    print(f"❌ Failed to download: {file_info['name']}")
+    return False
+
+def load_manifest(client, file_info):
+    """Read the manifest: {"files": [{"name": ..., "md5": ...}, ...]}"""
+    size = int(file_info.get('size', 0))
+    data = client.download_range(file_info['id'], 0, size - 1) if size else b''
+    return json.loads(data.decode('utf-8'))
+
+
+def fetch_colab_results(client=None, folder_id=None, local_path=None, poll_interval=None, idle_timeout=None):
     print("🚀 Starting Colab Result Fetcher...")
     start_time = datetime.now()
     print(f"⏱️ Start: {start_time}")
 
-    if not GOOGLE_DRIVE_OUTPUT_FOLDER_ID:
+    folder_id = folder_id or GOOGLE_DRIVE_OUTPUT_FOLDER_ID
+    if not folder_id:
         print("❌ GOOGLE_DRIVE_OUTPUT_FOLDER_ID is not set in the environment!")
         return
 
-    service = get_drive_service()
-    folder_id = GOOGLE_DRIVE_OUTPUT_FOLDER_ID
+    client = client or DriveClient()
+    local_path = local_path or LOCAL_OUTPUT_PATH
+    poll_interval = POLL_INTERVAL if poll_interval is None else poll_interval
+    idle_timeout = IDLE_TIMEOUT if idle_timeout is None else idle_timeout
 
-    Path(LOCAL_OUTPUT_PATH).mkdir(parents=True, exist_ok=True)
+    Path(local_path).mkdir(parents=True, exist_ok=True)
 
-    already_downloaded = set()
     print(f"📁 Monitoring Google Drive output folder ID: {folder_id}")
-    print(f"📂 Local output: {LOCAL_OUTPUT_PATH}")
-
-    # Wait for all 24 files to appear in the output folder
-    print("🔎 Waiting for all expected files to appear in Google Drive output folder...")
-    while True:
-        files = list_files_in_folder(service, folder_id)
-        ready_files = [f for f in files if not f['mimeType'].startswith('application/vnd.google-apps.')]
-        if len(ready_files) >= 24:
-            colab_finish_time = datetime.now()
-            print(f"✅ All expected files found in Google Drive output folder at: {colab_finish_time}")
-            print(f"⏳ Time from start to all files ready: {colab_finish_time - start_time}")
-            break
-        else:
-            print(f"⏳ Waiting... {len(ready_files)}/24 files present.")
-        time.sleep(30)
-
-    # Now download all files
-    while True:
-        files = list_files_in_folder(service, folder_id)
-        new_files = [f for f in files if f['name'] not in already_downloaded and not f['mimeType'].startswith('application/vnd.google-apps.')]
-        if new_files:
-            for f in new_files:
-                download_file(service, f['id'], f['name'], LOCAL_OUTPUT_PATH)
-                already_downloaded.add(f['name'])
-        else:
-            print("⏳ Waiting for new files...")
-        # Stop if all 24 files are downloaded
-        if len(already_downloaded) >= 24:
-            break
-        time.sleep(30)  # Check every 30 seconds
+    print(f"📂 Local output: {local_path}")
+
+    # name -> latest file info seen on Drive
+    remote_files = {}
+    downloaded = {}
+    manifest = None
+    manifest_version = None
+    watermark = None
+    complete = False
+    last_progress = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        while True:
+            # Only files changed since the newest modifiedTime seen so far. Once the
+            # manifest is known, the full listing also catches late files with older timestamps
+            changed = [
+                f for f in client.list_files(folder_id, modified_after=None if manifest else watermark)
+                if not f['mimeType'].startswith('application/vnd.google-apps.')
+            ]
+            for f in changed:
+                remote_files[f['name']] = f
+                watermark = max(watermark or f['modifiedTime'], f['modifiedTime'])
+
+            manifest_info = remote_files.get(MANIFEST_NAME)
+            if manifest_info and manifest_info['modifiedTime'] != manifest_version:
+                manifest = load_manifest(client, manifest_info)
+                manifest_version = manifest_info['modifiedTime']
+                print(f"📋 Manifest found: {len(manifest['files'])} files expected")
+
+            expected_md5 = {entry['name']: entry.get('md5') for entry in manifest['files']} if manifest else {}
+            new_files = [
+                f for name, f in remote_files.items()
+                if name != MANIFEST_NAME and not name.endswith('.tmp')
+                and downloaded.get(name) != f['modifiedTime']
+            ]
+            futures = {
+                f['name']: (f, pool.submit(download_file, client, f, local_path, expected_md5.get(f['name'])))
+                for f in new_files
+            }
+            for name, (f, future) in futures.items():
+                if future.result():
+                    downloaded[name] = f['modifiedTime']
+                    last_progress = time.monotonic()
+
+            if manifest is not None:
+                missing = [name for name in expected_md5 if name not in downloaded]
+                if not missing:
+                    complete = True
+                    break
+                print(f"⏳ Waiting... {len(expected_md5) - len(missing)}/{len(expected_md5)} manifest files fetched.")
+            elif EXPECTED_FILES and len(downloaded) >= EXPECTED_FILES:
+                complete = True
+                break
+            else:
+                print(f"⏳ Waiting for manifest... {len(downloaded)} files fetched so far.")
+            if idle_timeout and time.monotonic() - last_progress > idle_timeout:
+                print(f"⚠️ Nothing new for {idle_timeout:.0f}s, giving up")
+                break
+            time.sleep(poll_interval)
 
     end_time = datetime.now()
     print(f"⏱️ End: {end_time}")
     print(f"⏳ Total time: {end_time - start_time}")
-    print(f"📊 Files downloaded: {len(already_downloaded)}")
-    print("🏁 All results fetched!")
+    print(f"📊 Files downloaded: {len(downloaded)}")
+    if complete:
+        print("🏁 All results fetched!")
+    else:
+        print("❌ Run not complete, fetch again to resume")
+    return downloaded
 
 if __name__ == "__main__":
     fetch_colab_results()
@@ -4,13 +4,13 @@ Direct file processing script - uses the same logic as app.py but without web se
 """
 import os
 import sys
-import glob
 from pathlib import Path
 
 # Add path to src
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.transformer import transcribe_audio
+from src.file_discovery import iter_audio_files
 
 def process_single_audio_file(file_path, output_dir):
     """Process single audio file using the same logic as app.py"""
@@ -72,40 +72,31 @@ def main():
         print(f"❌ ERROR: Source directory not found: {source_dir}")
         return
     
-    # Find all audio files
-    audio_extensions = ['*.m4a', '*.ogg', '*.wav', '*.mp3', '*.flac', '*.aac']
-    audio_files = []
-    
-    for ext in audio_extensions:
-        pattern = os.path.join(source_dir, '**', ext)
-        files = glob.glob(pattern, recursive=True)
-        audio_files.extend(files)
-    
-    if not audio_files:
-        print(f"❌ No audio files found in {source_dir}")
-        return
-    
-    print(f"Found {len(audio_files)} audio files")
-    
-    # Process files
+    # Process audio files as they are found
     success_count = 0
     error_count = 0
+    total_files = 0
     
-    for i, file_path in enumerate(audio_files, 1):
-        print(f"\n[{i}/{len(audio_files)}] ", end="")
+    for i, file_path in enumerate(iter_audio_files(source_dir), 1):
+        total_files = i
+        print(f"\n[{i}] ", end="")
         
         if process_single_audio_file(file_path, output_dir):
             success_count += 1
         else:
             error_count += 1
     
+    if total_files == 0:
+        print(f"❌ No audio files found in {source_dir}")
+        return
+    
     # Final statistics
     print("\n" + "=" * 80)
     print("PROCESSING COMPLETED")
     print("=" * 80)
     print(f"✅ Successfully processed: {success_count}")
     print(f"❌ Errors: {error_count}")
-    print(f"📁 Total files: {len(audio_files)}")
+    print(f"📁 Total files: {total_files}")
     print(f"📂 Output directory: {output_dir}")
 
 if __name__ == "__main__":
@@ -4,7 +4,9 @@ Script for running batch audio file processing
 """
 import os
 import sys
+import signal
 import asyncio
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -49,11 +51,43 @@ async def main():
         import traceback
         traceback.print_exc()
 
+def watch_main():
+    """Daemon mode: keep transcribing new files until SIGTERM/SIGINT"""
+    processor = BatchAudioProcessor()
+    save_mode = os.getenv('SAVE_MODE', 'both')
+    
+    print("=" * 80)
+    print("WATCH MODE AUDIO FILE PROCESSING")
+    print("=" * 80)
+    print(f"Source directory: {processor.source_dir}")
+    print(f"Output directory: {processor.output_dir}")
+    print(f"Save mode: {save_mode}")
+    print("=" * 80)
+    
+    if not os.path.exists(processor.source_dir):
+        print(f"❌ ERROR: Source directory not found: {processor.source_dir}")
+        return
+    
+    stop_event = threading.Event()
+    
+    def request_stop(signum, frame):
+        print("\n⚠️ Stopping after the current file...")
+        stop_event.set()
+    
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+    
+    processor.watch(save_mode, stop_event)
+    print("\n✅ Watch mode stopped")
+
 if __name__ == "__main__":
     # Check that we are running from the correct directory
     if not os.path.exists('src'):
         print("❌ ERROR: Run the script from the project root directory")
         sys.exit(1)
     
-    # Run asynchronous processing
-    asyncio.run(main())
+    if '--watch' in sys.argv or os.getenv('WATCH_MODE', '0') == '1':
+        watch_main()
+    else:
+        # Run asynchronous processing
+        asyncio.run(main())
@@ -6,9 +6,15 @@ Just works on any Linux/Windows without complexity
 
 import os
 import sys
-import glob
 import time
 
+# Add path to src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.file_discovery import iter_audio_files
+from src.autotune import model_kwargs
+from src.run_report import RunReport, report_enabled, stage_timer, summary_lines
+
 # Try to load .env file
 try:
     from dotenv import load_dotenv
@@ -20,7 +26,7 @@ except ImportError:
 
 # Try to import faster-whisper
 try:
-    from faster_whisper import WhisperModel
+    from faster_whisper import WhisperModel, decode_audio
     print("✅ faster-whisper available")
 except ImportError:
     print("❌ Install faster-whisper: pip install faster-whisper")
@@ -42,18 +48,24 @@ except ImportError:
     device = "cpu"
     compute_type = "int8"
 
-def simple_transcribe(file_path, model_size="small"):
-    """Simple transcription function"""
+def simple_transcribe(file_path, model_size="small", timings=None):
+    """Simple transcription function, timings (a dict) receives the stage times and duration"""
+    timings = timings if timings is not None else {}
     try:
         print(f"Loading {model_size} model...")
-        model = WhisperModel(model_size, device=device, compute_type=compute_type)
+        model = WhisperModel(model_size, device=device, **model_kwargs(model_size, device, compute_type, parallel=False))
         
         print(f"🎵 Processing: {os.path.basename(file_path)}")
-        segments, _ = model.transcribe(file_path, language=None, beam_size=1, best_of=1, temperature=0)
+        with stage_timer(timings, 'decode'):
+            audio = decode_audio(file_path)
+        timings["duration"] = len(audio) / 16000
         
-        transcription = ""
-        for segment in segments:
-            transcription += segment.text + " "
+        with stage_timer(timings, 'inference'):
+            segments, _ = model.transcribe(audio, language=None, beam_size=1, best_of=1, temperature=0)
+            
+            transcription = ""
+            for segment in segments:
+                transcription += segment.text + " "
         
         return transcription.strip()
         
@@ -68,34 +80,29 @@ def process_folder(source_dir, output_dir=None):
     
     os.makedirs(output_dir, exist_ok=True)
     
-    # Find audio files
-    audio_files = []
-    for ext in ['*.m4a', '*.mp3', '*.wav', '*.ogg', '*.flac']:
-        audio_files.extend(glob.glob(os.path.join(source_dir, '**', ext), recursive=True))
-    
-    if not audio_files:
-        print(f"❌ No audio files found in {source_dir}")
-        return
-    
-    print(f"📊 Found {len(audio_files)} files")
     print(f"📁 Output: {output_dir}")
     print("=" * 50)
     
+    # Process audio files as they are found
     success = 0
+    total_files = 0
+    report = RunReport(output_dir) if report_enabled() else None
     start_time = time.time()
     
-    for i, file_path in enumerate(audio_files, 1):
-        print(f"\n[{i}/{len(audio_files)}] ", end="")
+    for i, file_path in enumerate(iter_audio_files(source_dir), 1):
+        total_files = i
+        print(f"\n[{i}] ", end="")
         
         file_start = time.time()
-        transcription = simple_transcribe(file_path)
+        timings = {}
+        transcription = simple_transcribe(file_path, timings=timings)
         
         if transcription:
             # Save result
             base_name = os.path.splitext(os.path.basename(file_path))[0]
             output_file = os.path.join(output_dir, f"{base_name}_transcription.txt")
             
-            with open(output_file, 'w', encoding='utf-8') as f:
+            with stage_timer(timings, 'write'), open(output_file, 'w', encoding='utf-8') as f:
                 f.write(f"Source: {file_path}\n")
                 f.write(f"Device: {device}\n")
                 f.write("=" * 50 + "\n\n")
@@ -107,15 +114,30 @@ def process_folder(source_dir, output_dir=None):
         
         file_end = time.time()
         print(f"⏱️ Time: {file_end - file_start:.1f}s")
+        if report is not None:
+            # Model loading is part of every file here, so it is in total_seconds
+            report.add(file_path, 'ok' if transcription else 'error', timings.get("duration"), "small",
+                       timings, file_end - file_start)
+    
+    if total_files == 0:
+        print(f"❌ No audio files found in {source_dir}")
+        return
     
     total_time = time.time() - start_time
     
     print("\n" + "=" * 50)
     print("🏁 COMPLETED")
     print(f"✅ Success: {success}")
-    print(f"📊 Total: {len(audio_files)}")
+    print(f"📊 Total: {total_files}")
     print(f"⏱️ Total time: {total_time:.1f}s")
-    print(f"⚡ Avg per file: {total_time/len(audio_files):.1f}s")
+    print(f"⚡ Avg per file: {total_time/total_files:.1f}s")
+    
+    if report is not None:
+        for line in summary_lines(report.aggregates()):
+            print(f"📊 {line}")
+        report_path = report.write()
+        if report_path:
+            print(f"📋 Run report: {report_path}")
 
 if __name__ == "__main__":
     print("🎤 SIMPLE AUDIO PROCESSOR")
@@ -1,15 +1,58 @@
 # app.py
 import sys
 import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
 import netifaces
+from urllib.parse import urlparse
 from fastapi import FastAPI, HTTPException, Request, UploadFile, Form, File
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from transformer import handle_file_upload, transcribe_audio
+from cpu_topology import pin_server_worker, pinning_enabled, plan_layout, report_layout
+
+# Hypercorn's spawned workers first run this script as __mp_main__ and then
+# import it as 'app'; only that copy serves requests and gets the side effects
+SERVING = __name__ not in ("__main__", "__mp_main__")
+
+# Workers are pinned before torch is imported, so its thread pool and the
+# model memory follow the CPU set. The __mp_main__ copy runs first and imports
+# torch below, so it pins; the 'app' copy gets the slot already held
+if __name__ != "__main__":
+    pin_server_worker(int(os.getenv('WORKERS', '4')), scope=os.getenv('BIND', '0.0.0.0:8338'))
+
+from transformer import (
+    handle_file_upload, transcribe_audio, get_model, uses_local_model, route_model, routed_models, CANCELLED,
+    CANCEL_WINDOWS
+)
+from job_queue import JobQueue, JOBS_UPLOAD_DIR, new_job_id
+from scheduler import AsyncAdmissionGate, classify_priority
+from converters.audio_converter import probe_duration, WINDOW_SECONDS
+from cascade import cascade_enabled, cascade_stats, draft_model_name
+from transcript_store import TranscriptStore, store_enabled
+from log_setup import setup_logging, request_id_var, stop_logging
+from memory_guard import MemoryBudget, MemoryBudgetExceeded, WorkerRecycler, decoded_bytes
+
+if SERVING:
+    setup_logging(os.getenv('SERVER_LOG_FILE'), default_format='json')
+logger = logging.getLogger('app')
 
 app = FastAPI()
 
+# Seconds a request may take in total, queueing included (0 = no deadline);
+# a client can set its own with the X-Deadline-Seconds header
+REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', '0'))
+# Answer with the text transcribed so far when the deadline hits, instead of 504
+PARTIAL_ON_DEADLINE = int(os.getenv('PARTIAL_ON_DEADLINE', '1')) == 1
+DISCONNECT_POLL_SECONDS = 0.5
+# Time for the last response to be sent before a recycled worker exits
+RECYCLE_EXIT_DELAY = 1.0
+
 def get_local_ips():
     local_ips = set()
     for interface in netifaces.interfaces():
@@ -19,8 +62,75 @@ def get_local_ips():
                 local_ips.add(addr_info['addr'])
     return local_ips
 
-local_ips = get_local_ips()
-print(f"Local IPs: {local_ips}")
+local_ips = get_local_ips() if SERVING else set()
+if SERVING:
+    logger.info("Local IPs", extra={"fields": {"local_ips": sorted(local_ips)}})
+
+# Inference slots of this worker, granted interactive-first and shortest-first.
+# With the sidecar the ordering happens there, so the worker only caps concurrency
+inference_gate = AsyncAdmissionGate(slots=os.getenv('INFERENCE_SLOTS') or (1 if uses_local_model() else 64))
+
+# Decoded audio in flight (MEMORY_BUDGET_MB) and RSS-based recycling (WORKER_MAX_RSS_MB)
+memory_budget = MemoryBudget() if SERVING else None
+recycler = WorkerRecycler()
+
+_job_queue = None
+# Optional SQLite sink with full-text search (TRANSCRIPT_DB)
+transcript_store = TranscriptStore() if SERVING and store_enabled() else None
+
+def get_job_queue():
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
+
+@app.on_event("startup")
+async def preload_model():
+    # With MODEL_SHARE=mmap the weights are mapped from the shared file,
+    # so this only costs each worker its own activations and buffers
+    if uses_local_model():
+        for model_name in routed_models():
+            get_model(model_name)
+        if cascade_enabled():
+            get_model(draft_model_name())
+
+@app.on_event("shutdown")
+async def flush_transcripts():
+    if transcript_store:
+        transcript_store.close()
+
+def exit_worker():
+    """End a recycled worker with exit code 0, hypercorn starts a replacement"""
+    if transcript_store:
+        transcript_store.close()
+    logger.info("Worker recycled", extra={"fields": {"pid": os.getpid()}})
+    stop_logging()
+    os._exit(0)
+
+@app.middleware("http")
+async def recycle_worker(request: Request, call_next):
+    if recycler.draining:
+        # The retry lands on another worker; this one exits when its requests are done
+        return JSONResponse({"detail": "Worker restarting"}, status_code=503,
+                            headers={"Retry-After": "1", "Connection": "close"})
+    recycler.started()
+    try:
+        return await call_next(request)
+    finally:
+        if recycler.finished():
+            asyncio.get_running_loop().call_later(RECYCLE_EXIT_DELAY, exit_worker)
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    # Log records of this request, also from threadpool calls, carry its id
+    request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12]
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers['X-Request-ID'] = request_id
+    return response
 
 @app.middleware("http")
 async def check_request_origin(request: Request, call_next):
@@ -30,38 +140,216 @@ async def check_request_origin(request: Request, call_next):
     response = await call_next(request)
     return response
 
+def request_deadline(request):
+    """Monotonic time by which the request has to be answered, or None"""
+    try:
+        seconds = float(request.headers.get('X-Deadline-Seconds', REQUEST_DEADLINE_SECONDS))
+    except ValueError:
+        seconds = REQUEST_DEADLINE_SECONDS
+    return time.monotonic() + seconds if seconds > 0 else None
+
+async def watch_request(request, cancel, deadline):
+    """Set cancel once the client is gone or the deadline has passed, returns which of them"""
+    while True:
+        if await request.is_disconnected():
+            reason = "disconnected"
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            reason = "deadline"
+            break
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+    cancel.set()
+    return reason
+
+async def acquire_unless_abandoned(acquire, release, watcher):
+    """Wait for the acquire coroutine; False when the watcher fired first (nothing is held then)"""
+    acquire = asyncio.ensure_future(acquire)
+    done, _ = await asyncio.wait({acquire, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    if acquire in done:
+        # Raises what acquire raised
+        acquire.result()
+        return True
+    acquire.cancel()
+    try:
+        await acquire
+    except asyncio.CancelledError:
+        return False
+    # Granted right before the cancellation took effect
+    release()
+    return False
+
 @app.post("/update/")
 
-async def transformation_flow(file: UploadFile = File(...),
+async def transformation_flow(request: Request,
+                            file: UploadFile = File(...),
                             clientId: str = Form(...),  
-                            segment_number: str = Form(default='unknown')):
-    print(f"Request file: {file.filename}")
-    print(f"User ID: {clientId}")
-    print(f"Segment Number: {segment_number}")
-
+                            segment_number: str = Form(default='unknown'),
+                            priority: str = Form(default=None)):
     filepath, filename = handle_file_upload(clientId, file, segment_number )
-    transcription = transcribe_audio(filepath)
+    duration = await run_in_threadpool(probe_duration, filepath)
+    priority = classify_priority(duration, priority)
+    # Routed before queueing, so a backlog sends more requests to the fast model
+    model_name = route_model(duration, clientId, priority, inference_gate.depth)
+    logger.info("Transcription request", extra={"fields": {
+        "file": file.filename, "client_id": clientId, "segment_number": segment_number,
+        "duration": round(duration, 1), "priority": priority, "model": model_name,
+    }})
+
+    # Memory of the decoded audio is reserved before queueing for a slot
+    needed = decoded_bytes(duration, WINDOW_SECONDS)
+    if not memory_budget.could_fit(needed):
+        os.remove(filepath)
+        logger.warning("Upload exceeds the memory budget", extra={"fields": {
+            "client_id": clientId, "file": filename, "needed_mb": round(needed / 1024 ** 2)}})
+        raise HTTPException(status_code=413, detail="Recording too large for the memory budget")
 
+    details = {}
+    # Set when the client goes away or the deadline passes; the transcription
+    # stops at the next window and the slot is free for the next request
+    cancel = threading.Event()
+    deadline = request_deadline(request)
+    # Short windows only where stopping early matters enough to lose context at their boundaries
+    cancel_windows = deadline is not None or CANCEL_WINDOWS
+    watcher = asyncio.create_task(watch_request(request, cancel, deadline))
+    try:
+        try:
+            reserved = await acquire_unless_abandoned(memory_budget.acquire(needed),
+                                                      lambda: memory_budget.release(needed), watcher)
+        except MemoryBudgetExceeded as e:
+            os.remove(filepath)
+            logger.warning("No memory for upload", extra={"fields": {"client_id": clientId, "file": filename,
+                                                                      "error": str(e)}})
+            raise HTTPException(status_code=503, detail="Server is low on memory, retry later",
+                                headers={"Retry-After": "5"})
+        if not reserved:
+            os.remove(filepath)
+            raise_abandoned(watcher.result(), clientId, filename)
+        try:
+            if not await acquire_unless_abandoned(inference_gate.acquire(duration, priority),
+                                                  inference_gate.release, watcher):
+                os.remove(filepath)
+                raise_abandoned(watcher.result(), clientId, filename)
+            try:
+                # Run off the event loop so the worker keeps serving while it waits
+                start_time = time.monotonic()
+                transcription = await run_in_threadpool(transcribe_audio, filepath, priority, details,
+                                                        model_name, cancel, cancel_windows)
+                processing_seconds = time.monotonic() - start_time
+            finally:
+                inference_gate.release()
+        finally:
+            memory_budget.release(needed)
+    finally:
+        watcher.cancel()
+
+    model = details.get("model", model_name)
+    fields = {"client_id": clientId, "file": filename, "model": model,
+              "processing_seconds": round(processing_seconds, 2)}
     if int(os.getenv('TRANSCRIPTION_OUT_LOG', '0')) == 1:
-        sys.stdout.reconfigure(encoding='utf-8')
-        print(f"User ID: {clientId}")
-        print(f'File {filename}, Transcription: {transcription}')
+        fields["transcription"] = transcription
+    logger.info("Transcription done", extra={"fields": fields})
 
     os.remove(filepath)
+    if transcription and transcription[1] == CANCELLED:
+        reason = watcher.result() if watcher.done() and not watcher.cancelled() else "deadline"
+        if reason == "deadline" and PARTIAL_ON_DEADLINE:
+            logger.info("Deadline reached, returning partial transcription", extra={"fields": {
+                "client_id": clientId, "file": filename, "transcribed_seconds": details.get("transcribed_seconds"),
+            }})
+            return {"translated_text": transcription, "model": model, "partial": True,
+                    "transcribed_seconds": details.get("transcribed_seconds"), "segments": details.get("segments", [])}
+        raise_abandoned(reason, clientId, filename)
+    if transcription and transcript_store:
+        # transcribe_audio returns (text, error)
+        text = transcription[0] if isinstance(transcription, tuple) else transcription
+        if text:
+            # A full batch is written inside add(), off the event loop
+            await run_in_threadpool(transcript_store.add, text, client_id=clientId, segment_number=segment_number,
+                                    model=model, duration=duration,
+                                    processing_seconds=processing_seconds, segments=details.get("segments"))
     if transcription:
-        return {"translated_text":transcription}
+        return {"translated_text":transcription, "model": model}
     else:
         raise HTTPException(status_code=500, detail="Invalid transformation")
 
+def raise_abandoned(reason, client_id, filename):
+    logger.info("Request abandoned", extra={"fields": {"client_id": client_id, "file": filename, "reason": reason}})
+    if reason == "deadline":
+        raise HTTPException(status_code=504, detail="Deadline exceeded")
+    # Nobody reads the answer; 499 is what proxies log for client-closed requests
+    raise HTTPException(status_code=499, detail="Client closed request")
+
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "queued": inference_gate.depth,
+        "queued_seconds": inference_gate.scheduler.queued_cost(),
+        "memory_reserved_mb": round(memory_budget.reserved / 1024 ** 2),
+        "in_flight": recycler.in_flight,
+        # Per worker process: share of the audio the final model had to re-decode
+        **({"cascade": cascade_stats()} if cascade_enabled() else {}),
+    }
+
+@app.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...),
+                     clientId: str = Form(...),
+                     segment_number: str = Form(default='unknown'),
+                     callback_url: str = Form(default=None)):
+    if callback_url and urlparse(callback_url).hostname not in local_ips | {'localhost'}:
+        raise HTTPException(status_code=400, detail="Callback URL must point to a local host")
+
+    os.makedirs(JOBS_UPLOAD_DIR, exist_ok=True)
+    job_id = new_job_id()
+    filepath, filename = handle_file_upload(clientId, file, segment_number,
+                                            upload_dir=JOBS_UPLOAD_DIR, prefix=f"{job_id}_")
+    get_job_queue().enqueue(filepath, clientId, segment_number, callback_url, job_id=job_id)
+    logger.info("Job queued", extra={"fields": {"job_id": job_id, "file": filename}})
+    return {"id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "translated_text": job["result"],
+        "error": job["error"],
+    }
+
 
 if __name__ == "__main__":
-    import hypercorn.asyncio
-    import asyncio
+    from hypercorn.config import Config
+    from hypercorn.run import run
+
+    # Hypercorn spawns its workers (no fork), so weights are shared by
+    # memory-mapping one prepared file instead of copy-on-write pages
+    if uses_local_model() and os.getenv('MODEL_SHARE', 'mmap') == 'mmap':
+        from model_store import prepare_shared_weights
+        for model_name in routed_models():
+            prepare_shared_weights(model_name)
+        if cascade_enabled():
+            prepare_shared_weights(draft_model_name())
 
-    async def main():
-        config = hypercorn.Config()
-        config.bind = ["0.0.0.0:8338"]
-        config.workers = 4
-        await hypercorn.asyncio.serve(app, config)
+    # Older hypercorn has no max_requests and does not replace workers that exit,
+    # so every recycled worker would be gone for good
+    max_requests = int(os.getenv('WORKER_MAX_REQUESTS', '0'))
+    if (max_requests > 0 or recycler.enabled) and not hasattr(Config, 'max_requests'):
+        sys.exit("WORKER_MAX_REQUESTS and WORKER_MAX_RSS_MB need hypercorn >= 0.16 (pip install -r requirements.txt)")
 
-    asyncio.run(main())
\ No newline at end of file
+    config = Config()
+    config.bind = [os.getenv('BIND', '0.0.0.0:8338')]
+    config.workers = int(os.getenv('WORKERS', '4'))
+    # Recycling after a number of requests is hypercorn's; it drains the
+    # worker's requests for up to graceful_timeout (memory-based: memory_guard)
+    if max_requests > 0:
+        config.max_requests = max_requests
+        config.max_requests_jitter = int(os.getenv('WORKER_MAX_REQUESTS_JITTER', '0'))
+    config.graceful_timeout = float(os.getenv('WORKER_GRACEFUL_SECONDS', '300'))
+    if pinning_enabled():
+        report_layout(plan_layout(config.workers))
+    config.application_path = "app:app"
+    sys.exit(run(config))
@@ -0,0 +1,248 @@
+# autotune.py
+"""
+Per-host tuning of faster-whisper CPU settings.
+
+Benchmarks compute types, CTranslate2 thread counts and the number of parallel
+workers on a short built-in clip and stores the fastest combination per host
+fingerprint (CPU model, core count, memory, CTranslate2 version) and model size.
+The processors read the cache when they build their WhisperModel, so a host
+is tuned once and every run afterwards uses its settings.
+
+    python src/autotune.py --model small            # tune this host
+    python src/autotune.py --model small --clip a.wav
+    python src/autotune.py --show                   # print the cache
+
+Environment:
+    AUTOTUNE_CACHE  cache file (default ~/.cache/speechToTxt/autotune.json)
+    AUTOTUNE        0 to ignore the cache and use the built-in defaults
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import threading
+from datetime import datetime
+
+import numpy as np
+
+CACHE_PATH = os.getenv('AUTOTUNE_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'speechToTxt', 'autotune.json'))
+COMPUTE_TYPES = ('int8', 'int8_float32', 'float32')
+CLIP_SECONDS = 20
+SAMPLE_RATE = 16000
+
+def _cpu_model():
+    try:
+        with open('/proc/cpuinfo', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+def _memory_gb():
+    try:
+        with open('/proc/meminfo', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return round(int(line.split()[1]) / 1024 / 1024)
+    except OSError:
+        pass
+    return None
+
+def _ctranslate2_version():
+    try:
+        import ctranslate2
+        return ctranslate2.__version__
+    except ImportError:
+        return None
+
+def host_info():
+    return {
+        "cpu": _cpu_model(),
+        "cores": os.cpu_count(),
+        "memory_gb": _memory_gb(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "ctranslate2": _ctranslate2_version(),
+    }
+
+def host_fingerprint(info=None):
+    info = info or host_info()
+    return hashlib.sha1(json.dumps(info, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def load_cache(path=None):
+    try:
+        with open(path or CACHE_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache, path=None):
+    path = path or CACHE_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, path)
+
+def load_tuned_config(model_size, device='cpu'):
+    """Tuned settings for this host and model, or None if the host was not tuned"""
+    if device != 'cpu' or os.getenv('AUTOTUNE', '1') == '0':
+        return None
+    entry = load_cache().get(host_fingerprint(), {})
+    return entry.get('models', {}).get(model_size)
+
+def model_kwargs(model_size, device, default_compute_type, parallel=True):
+    """WhisperModel keyword arguments: tuned settings if available, else the defaults
+
+    The tuned threads and workers are for files decoded in parallel; callers
+    decoding one file at a time pass parallel=False and keep all cores for it.
+    """
+    config = load_tuned_config(model_size, device)
+    if config is None:
+        return {"compute_type": default_compute_type}
+    if not parallel:
+        print(f"🎛️  Autotuned: {config['compute_type']}")
+        return {"compute_type": config['compute_type']}
+    print(f"🎛️  Autotuned: {config['compute_type']}, {config['cpu_threads']} threads, {config['num_workers']} worker(s)")
+    return {
+        "compute_type": config['compute_type'],
+        "cpu_threads": config['cpu_threads'],
+        "num_workers": config['num_workers'],
+    }
+
+def synthetic_clip(seconds=CLIP_SECONDS, sample_rate=SAMPLE_RATE):
+    """Speech-like test signal: voiced harmonics with a syllable-rate envelope"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 40 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) * (np.sin(2 * np.pi * 0.25 * t) > -0.5)
+    clip = 0.3 * voiced * envelope + 0.01 * rng.standard_normal(len(t))
+    return (clip / np.max(np.abs(clip)) * 0.5).astype(np.float32)
+
+def load_clip(clip_path=None):
+    if clip_path is None:
+        return synthetic_clip()
+    from converters.audio_converter import load_pcm
+    return load_pcm(clip_path)[:CLIP_SECONDS * SAMPLE_RATE]
+
+def candidate_layouts(cores):
+    """(cpu_threads, num_workers) pairs that do not oversubscribe the cores"""
+    layouts = []
+    workers = 1
+    while workers <= cores:
+        threads = cores // workers
+        while threads >= 1:
+            layouts.append((threads, workers))
+            if threads == 1:
+                break
+            threads //= 2
+        workers *= 2
+    return [(threads, workers) for threads, workers in layouts if threads * workers >= cores // 2]
+
+def benchmark(model_size, clip, compute_type, cpu_threads, num_workers):
+    """Audio seconds transcribed per wall-clock second with this configuration"""
+    from faster_whisper import WhisperModel
+
+    model = WhisperModel(model_size, device='cpu', compute_type=compute_type,
+                         cpu_threads=cpu_threads, num_workers=num_workers)
+
+    def run():
+        segments, _ = model.transcribe(clip, language='en', beam_size=1, best_of=1, temperature=0,
+                                       condition_on_previous_text=False, without_timestamps=True)
+        list(segments)
+
+    # Warm-up, excluded from timing
+    run()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=run) for _ in range(num_workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    del model
+    return num_workers * (len(clip) / SAMPLE_RATE) / elapsed
+
+def run_autotune(model_size='small', clip_path=None, compute_types=COMPUTE_TYPES):
+    """Benchmark this host, store and return the fastest configuration"""
+    clip = load_clip(clip_path)
+    cores = os.cpu_count() or 1
+    info = host_info()
+    print(f"🖥️  Host: {info['cpu']}, {cores} cores")
+    print(f"🧠 Model: {model_size}, clip: {len(clip) / SAMPLE_RATE:.0f}s")
+
+    results = []
+
+    def measure(compute_type, cpu_threads, num_workers):
+        try:
+            speed = benchmark(model_size, clip, compute_type, cpu_threads, num_workers)
+        except Exception as e:
+            # e.g. a compute type this CPU does not support
+            print(f"   {compute_type:<13} threads={cpu_threads:<3} workers={num_workers:<3} ❌ {e}")
+            return None
+        print(f"   {compute_type:<13} threads={cpu_threads:<3} workers={num_workers:<3} {speed:6.2f}x real time")
+        results.append((speed, compute_type, cpu_threads, num_workers))
+        return speed
+
+    # Stage 1: compute type with all cores in one worker
+    print("⚡ Compute types:")
+    type_speeds = {compute_type: measure(compute_type, cores, 1) for compute_type in compute_types}
+    type_speeds = {compute_type: speed for compute_type, speed in type_speeds.items() if speed}
+    if not type_speeds:
+        print("❌ No configuration could be benchmarked")
+        return None
+    best_type = max(type_speeds, key=type_speeds.get)
+
+    # Stage 2: split of the cores between threads and parallel workers for the best type
+    print(f"🧵 Threads/workers for {best_type}:")
+    for cpu_threads, num_workers in candidate_layouts(cores):
+        if (cpu_threads, num_workers) != (cores, 1):
+            measure(best_type, cpu_threads, num_workers)
+
+    speed, compute_type, cpu_threads, num_workers = max(results)
+    config = {
+        "compute_type": compute_type,
+        "cpu_threads": cpu_threads,
+        "num_workers": num_workers,
+        "speed": round(speed, 2),
+        "tuned": datetime.now().isoformat(timespec='seconds'),
+    }
+
+    cache = load_cache()
+    entry = cache.setdefault(host_fingerprint(info), {"host": info, "models": {}})
+    entry["models"][model_size] = config
+    save_cache(cache)
+
+    print(f"✅ Best: {compute_type}, {cpu_threads} threads, {num_workers} worker(s), {speed:.2f}x real time")
+    print(f"💾 Saved to {CACHE_PATH}")
+    return config
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Tune faster-whisper CPU settings for this host')
+    parser.add_argument('--model', '-m', default='small', help='Model size to tune (default: small)')
+    parser.add_argument('--clip', help='Audio file to benchmark with (default: built-in synthetic clip)')
+    parser.add_argument('--compute-types', default=','.join(COMPUTE_TYPES),
+                        help=f"Comma-separated compute types (default: {','.join(COMPUTE_TYPES)})")
+    parser.add_argument('--show', action='store_true', help='Print the cached settings and exit')
+
+    args = parser.parse_args()
+
+    if args.show:
+        print(json.dumps(load_cache(), indent=2))
+        print(f"This host: {host_fingerprint()}")
+        return
+
+    run_autotune(args.model, args.clip, tuple(t.strip() for t in args.compute_types.split(',') if t.strip()))
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    main()
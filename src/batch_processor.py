@@ -2,11 +2,21 @@
 import os
 import asyncio
 import logging
-from pathlib import Path
+import time
+import itertools
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
-from .transformer import transcribe_audio
+from .transformer import transcribe_audio, transcribe_pack, packing_stats, probe_duration
 from .converters.audio_converter import convert_to_wav
+from .scheduler import PriorityScheduler, classify_priority, longest_first
+from .file_discovery import iter_audio_files
+from .folder_watcher import FolderWatcher
+from .work_claims import LeaseManager
+from .transcript_store import TranscriptStore, store_enabled
+from .log_setup import setup_logging
+from .clip_packer import packing_enabled, iter_packs
+from .run_report import RunReport, report_enabled, stage_timer, summary_lines
 
 # Load environment variables from .env file
 load_dotenv()
@@ -16,22 +26,22 @@ class BatchAudioProcessor:
         self.source_dir = os.getenv('AUDIO_SOURCE_DIR', r'D:\02_Проекты\LK-TRANS\2025\AI\AUDIO')
         self.output_dir = os.getenv('OUTPUT_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'output'))
         self.supported_extensions = {'.ogg', '.m4a', '.wav', '.mp3', '.flac', '.aac'}
+        self.combined_filename = None
         self.setup_logging()
         self.ensure_output_dir()
+        # Shared claims directory: several hosts can drain the same source directory
+        claims_dir = os.getenv('CLAIMS_DIR')
+        self.claims = LeaseManager(claims_dir) if claims_dir else None
+        if self.claims:
+            self.logger.info(f"Claiming files in: {claims_dir} (owner {self.claims.owner})")
+        # Optional SQLite sink with full-text search (TRANSCRIPT_DB)
+        self.store = TranscriptStore() if store_enabled() else None
+        # Per-file stage timings of the current run (RUN_REPORT)
+        self.report = None
     
     def setup_logging(self):
-        """Setup logging configuration"""
-        log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
-        numeric_level = getattr(logging, log_level, logging.INFO)
-        
-        logging.basicConfig(
-            level=numeric_level,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(os.path.join(self.output_dir, 'batch_processing.log'), encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
+        """Setup logging configuration (formatting and I/O run in a background thread)"""
+        setup_logging(os.path.join(self.output_dir, 'batch_processing.log'))
         self.logger = logging.getLogger(__name__)
     
     def ensure_output_dir(self):
@@ -41,32 +51,62 @@ class BatchAudioProcessor:
             self.logger.info(f"Created output directory: {self.output_dir}")
     
     def find_audio_files(self):
-        """Find all audio files in directory and subdirectories"""
-        audio_files = []
-        
+        """Find audio files in directory and subdirectories (lazily, one walk)"""
         if not os.path.exists(self.source_dir):
             self.logger.error(f"Source directory does not exist: {self.source_dir}")
-            return audio_files
+            return
         
         self.logger.info(f"Scanning directory: {self.source_dir}")
         
-        for root, dirs, files in os.walk(self.source_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                file_ext = Path(file).suffix.lower()
-                
-                if file_ext in self.supported_extensions:
-                    audio_files.append(file_path)
-                    self.logger.info(f"Found audio file: {file_path}")
-                else:
-                    self.logger.debug(f"Skipping non-audio file: {file_path}")
-        
-        self.logger.info(f"Total audio files found: {len(audio_files)}")
-        return audio_files
+        found_count = 0
+        for file_path in iter_audio_files(self.source_dir, self.supported_extensions):
+            found_count += 1
+            self.logger.debug(f"Found audio file: {file_path}", extra={"chatter": True})
+            yield file_path
+        
+        self.logger.info(f"Total audio files found: {found_count}")
+    
+    def schedule_files(self, audio_files):
+        """Yield files interactive-first and shortest-first
+        
+        BATCH_SCHEDULING=fifo keeps scan order; 'lpt' runs the longest files first,
+        for several hosts draining one source directory with CLAIMS_DIR.
+        """
+        scheduling = os.getenv('BATCH_SCHEDULING', 'priority').lower()
+        if scheduling == 'fifo':
+            yield from audio_files
+            return
+        if scheduling == 'lpt':
+            yield from longest_first(audio_files, probe_duration)
+            return
+        
+        # Files are scheduled within a window of discovered files,
+        # so processing starts before the whole tree has been scanned
+        lookahead = int(os.getenv('SCHEDULER_LOOKAHEAD', '64'))
+        scheduler = PriorityScheduler()
+        requested_priority = os.getenv('BATCH_PRIORITY')
+        for audio_file in audio_files:
+            duration = probe_duration(audio_file)
+            scheduler.push(audio_file, duration, classify_priority(duration, requested_priority))
+            if len(scheduler) >= lookahead:
+                yield scheduler.pop(block=False)
+        
+        while len(scheduler):
+            yield scheduler.pop(block=False)
+    
+    def pack_files(self, audio_files):
+        """Yield lists of files: short ones grouped for one decoding window with PACK_SHORT_CLIPS=1"""
+        if not packing_enabled():
+            for audio_file in audio_files:
+                yield [audio_file]
+            return
+        yield from iter_packs((audio_file, probe_duration(audio_file)) for audio_file in audio_files)
     
     def generate_output_filename(self, audio_file_path, transcription_type='individual'):
         """Generate output filename"""
         if transcription_type == 'combined':
+            if self.combined_filename:
+                return self.combined_filename
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             return f"combined_transcriptions_{timestamp}.txt"
         
@@ -79,6 +119,11 @@ class BatchAudioProcessor:
     
     def save_transcription(self, audio_file_path, transcription, save_mode='individual'):
         """Save transcription to file"""
+        if save_mode == 'both':
+            self.save_transcription(audio_file_path, transcription, 'individual')
+            self.save_transcription(audio_file_path, transcription, 'combined')
+            return
+        
         try:
             if save_mode == 'individual':
                 # Save to separate file for each audio
@@ -111,35 +156,125 @@ class BatchAudioProcessor:
         except Exception as e:
             self.logger.error(f"Error saving transcription for {audio_file_path}: {e}")
     
-    def process_single_file(self, audio_file_path, save_mode='individual'):
-        """Process single audio file"""
+    def process_single_file(self, audio_file_path, save_mode='individual', result=None, details=None):
+        """Process single audio file
+        
+        result and details are given when the file was transcribed in a packed window.
+        """
+        start_time = time.monotonic()
+        details = details if result is not None else {}
+        
+        def record(status, error=None):
+            if self.report:
+                # Packed files add their share of the window to the time spent here
+                total_seconds = details.get("processing_seconds", 0.0) + time.monotonic() - start_time
+                self.report.add(audio_file_path, status, probe_duration(audio_file_path), details.get("model"),
+                                details, total_seconds, error)
+        
         try:
             self.logger.info(f"Processing file: {audio_file_path}")
             
             # Audio transcription - returns (text, error)
-            result = transcribe_audio(audio_file_path)
+            if result is None:
+                result = transcribe_audio(audio_file_path, details=details)
             
             # Handle the tuple return value
             if isinstance(result, tuple):
                 transcription, error = result
                 if error:
                     self.logger.error(f"Transcription error for {audio_file_path}: {error}")
+                    record('error', error)
                     return False
             else:
                 # If it's not a tuple, assume it's the transcription text
                 transcription = result
             
             if transcription and transcription.strip():
-                self.save_transcription(audio_file_path, transcription, save_mode)
+                with stage_timer(details, 'write'):
+                    self.save_transcription(audio_file_path, transcription, save_mode)
+                    if self.store:
+                        self.store.add(
+                            transcription,
+                            source_path=audio_file_path,
+                            model=details.get("model"),
+                            duration=probe_duration(audio_file_path),
+                            processing_seconds=details.get("processing_seconds", time.monotonic() - start_time),
+                            segments=details.get("segments")
+                        )
+                record('ok')
                 return True
             else:
                 self.logger.error(f"Empty transcription for: {audio_file_path}")
+                record('empty')
                 return False
                 
         except Exception as e:
             self.logger.error(f"Error processing {audio_file_path}: {e}")
+            record('error', str(e))
             return False
-            return False
+    
+    def start_report(self):
+        self.report = RunReport(self.output_dir) if report_enabled() else None
+    
+    def finish_report(self):
+        """Write the run report and log its summary"""
+        if not self.report:
+            return
+        report_path = self.report.write()
+        if report_path:
+            for line in summary_lines(self.report.aggregates()):
+                self.logger.info(f"  {line}")
+            self.logger.info(f"Run report: {report_path}")
+        self.report = None
+    
+    def claim_key(self, audio_file_path):
+        return os.path.relpath(audio_file_path, self.source_dir).replace(os.sep, '/')
+    
+    def claim(self, audio_file_path):
+        """Whether this host may process the file (always without CLAIMS_DIR)"""
+        if self.claims is None:
+            return True
+        if self.claims.claim(self.claim_key(audio_file_path)):
+            return True
+        self.logger.debug(f"Claimed elsewhere, skipping: {audio_file_path}", extra={"chatter": True})
+        return False
+    
+    def finish_claim(self, audio_file_path, success):
+        if self.claims is None:
+            return
+        key = self.claim_key(audio_file_path)
+        if not success:
+            # Another host may have better luck (or a working ffmpeg)
+            self.claims.release(key)
+        elif not self.claims.complete(key):
+            self.logger.warning(f"Lease expired while processing, file may be transcribed twice: {audio_file_path}")
+    
+    def process_claimed_file(self, audio_file_path, save_mode='individual'):
+        """Process file if this host can claim it, None when another host has it or finished it"""
+        if not self.claim(audio_file_path):
+            return None
+        success = self.process_single_file(audio_file_path, save_mode)
+        self.finish_claim(audio_file_path, success)
+        return success
+    
+    def process_claimed_files(self, audio_files, save_mode='individual'):
+        """Results of process_claimed_file for a list of files, short ones transcribed in one window"""
+        if len(audio_files) == 1:
+            return [self.process_claimed_file(audio_files[0], save_mode)]
+        
+        claimed = [audio_file for audio_file in audio_files if self.claim(audio_file)]
+        details_list = [{} for _ in claimed]
+        start_time = time.monotonic()
+        results = transcribe_pack(claimed, details_list) if claimed else []
+        # The window's time is shared by its clips
+        processing_seconds = (time.monotonic() - start_time) / max(len(claimed), 1)
+        
+        successes = {}
+        for audio_file, result, details in zip(claimed, results, details_list):
+            details.setdefault("processing_seconds", processing_seconds)
+            successes[audio_file] = self.process_single_file(audio_file, save_mode, result, details)
+            self.finish_claim(audio_file, successes[audio_file])
+        return [successes.get(audio_file) for audio_file in audio_files]
     
     def process_all_files(self, save_mode='individual'):
         """Process all found audio files
@@ -149,10 +284,12 @@ class BatchAudioProcessor:
                            'combined' - all transcriptions in one file
         """
         audio_files = self.find_audio_files()
+        first_file = next(audio_files, None)
         
-        if not audio_files:
+        if first_file is None:
             self.logger.warning("No audio files found to process")
             return
+        audio_files = itertools.chain([first_file], audio_files)
         
         processed_count = 0
         failed_count = 0
@@ -165,20 +302,39 @@ class BatchAudioProcessor:
                 f.write("BATCH AUDIO TRANSCRIPTION\n")
                 f.write(f"Source directory: {self.source_dir}\n")
                 f.write(f"Processing start date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"Total files to process: {len(audio_files)}\n")
                 f.write("=" * 80 + "\n")
         
-        for audio_file in audio_files:
-            if self.process_single_file(audio_file, save_mode):
-                processed_count += 1
-            else:
-                failed_count += 1
+        total_files = 0
+        skipped_count = 0
+        self.start_report()
+        try:
+            for pack in self.pack_files(self.schedule_files(audio_files)):
+                for result in self.process_claimed_files(pack, save_mode):
+                    total_files += 1
+                    if result is None:
+                        skipped_count += 1
+                    elif result:
+                        processed_count += 1
+                    else:
+                        failed_count += 1
+        finally:
+            if self.claims:
+                self.claims.close()
+            if self.store:
+                self.store.flush()
+            self.finish_report()
         
         # Final statistics
         self.logger.info(f"Processing completed:")
         self.logger.info(f"  Successfully processed: {processed_count}")
         self.logger.info(f"  Failed: {failed_count}")
-        self.logger.info(f"  Total files: {len(audio_files)}")
+        if self.claims:
+            self.logger.info(f"  Handled by other hosts: {skipped_count}")
+        self.logger.info(f"  Total files: {total_files}")
+        if packing_enabled():
+            stats = packing_stats()
+            self.logger.info(f"  Packed: {stats['clips']} clips in {stats['windows']} windows, "
+                             f"{stats['fallbacks']} decoded on their own")
         
         # Add statistics to combined file
         if save_mode == 'combined':
@@ -190,7 +346,7 @@ class BatchAudioProcessor:
                 f.write(f"Completion date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
                 f.write(f"Successfully processed: {processed_count}\n")
                 f.write(f"Errors: {failed_count}\n")
-                f.write(f"Total files: {len(audio_files)}\n")
+                f.write(f"Total files: {total_files}\n")
     
     async def process_batch(self, save_mode='individual'):
         """Asynchronous batch processing of all found audio files
@@ -200,52 +356,80 @@ class BatchAudioProcessor:
                            'combined' - all transcriptions in one file,
                            'both' - both modes
         """
-        if save_mode == 'both':
+        if save_mode == 'both' and self.claims is None:
             # Process both modes
             await self.process_batch('individual')
-            await self.process_batch('combined')
+            # The individual pass already stored the transcripts
+            store, self.store = self.store, None
+            try:
+                await self.process_batch('combined')
+            finally:
+                self.store = store
             return
         
         audio_files = self.find_audio_files()
+        first_file = next(audio_files, None)
         
-        if not audio_files:
+        if first_file is None:
             self.logger.warning("No audio files found to process")
             return
+        audio_files = itertools.chain([first_file], audio_files)
         
         processed_count = 0
         failed_count = 0
         
         # Create header for combined file
-        if save_mode == 'combined':
+        # (with claims, 'both' is a single pass: a second pass would find every file done)
+        if save_mode in ('combined', 'both'):
             output_filename = self.generate_output_filename(None, 'combined')
+            self.combined_filename = output_filename
             output_path = os.path.join(self.output_dir, output_filename)
             with open(output_path, 'w', encoding='utf-8') as f:
                 f.write("BATCH AUDIO TRANSCRIPTION\n")
                 f.write(f"Source directory: {self.source_dir}\n")
                 f.write(f"Processing start date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"Total files to process: {len(audio_files)}\n")
                 f.write("=" * 80 + "\n")
         
         # Process files with progress indicator
-        for i, audio_file in enumerate(audio_files, 1):
-            print(f"Processing {i}/{len(audio_files)}: {os.path.basename(audio_file)}")
-            
-            if self.process_single_file(audio_file, save_mode):
-                processed_count += 1
-            else:
-                failed_count += 1
-            
-            # Add small delay to prevent overwhelming the system
-            await asyncio.sleep(0.1)
+        total_files = 0
+        skipped_count = 0
+        self.start_report()
+        try:
+            for pack in self.pack_files(self.schedule_files(audio_files)):
+                for audio_file in pack:
+                    total_files += 1
+                    print(f"Processing {total_files}: {os.path.basename(audio_file)}")
+                
+                results = self.process_claimed_files(pack, save_mode)
+                skipped_count += results.count(None)
+                processed_count += results.count(True)
+                failed_count += results.count(False)
+                if all(result is None for result in results):
+                    continue
+                
+                # Add small delay to prevent overwhelming the system
+                await asyncio.sleep(0.1)
+        finally:
+            if self.claims:
+                self.claims.close()
+            if self.store:
+                self.store.flush()
+            self.finish_report()
         
         # Final statistics
         self.logger.info("Async processing completed:")
         self.logger.info(f"  Successfully processed: {processed_count}")
         self.logger.info(f"  Failed: {failed_count}")
-        self.logger.info(f"  Total files: {len(audio_files)}")
+        if self.claims:
+            self.logger.info(f"  Handled by other hosts: {skipped_count}")
+        self.logger.info(f"  Total files: {total_files}")
+        if packing_enabled():
+            stats = packing_stats()
+            self.logger.info(f"  Packed: {stats['clips']} clips in {stats['windows']} windows, "
+                             f"{stats['fallbacks']} decoded on their own")
         
         # Add statistics to combined file
-        if save_mode == 'combined':
+        if save_mode in ('combined', 'both'):
             output_filename = self.generate_output_filename(None, 'combined')
             output_path = os.path.join(self.output_dir, output_filename)
             with open(output_path, 'a', encoding='utf-8') as f:
@@ -254,7 +438,69 @@ class BatchAudioProcessor:
                 f.write(f"Completion date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
                 f.write(f"Successfully processed: {processed_count}\n")
                 f.write(f"Errors: {failed_count}\n")
-                f.write(f"Total files: {len(audio_files)}\n")
+                f.write(f"Total files: {total_files}\n")
+    
+    def is_transcribed(self, audio_file_path):
+        """Whether an individual transcription newer than the audio file exists"""
+        output_path = os.path.join(self.output_dir, self.generate_output_filename(audio_file_path, 'individual'))
+        try:
+            return os.path.getmtime(output_path) >= os.path.getmtime(audio_file_path)
+        except OSError:
+            return False
+    
+    def watch(self, save_mode='individual', stop_event=None):
+        """Daemon mode: transcribe new files as they arrive in the source directory
+        
+        Runs until stop_event is set, the file in progress is finished first.
+        """
+        stop_event = stop_event or threading.Event()
+        watcher = FolderWatcher(self.source_dir, self.supported_extensions)
+        
+        if save_mode in ('combined', 'both'):
+            # One combined file for the whole daemon run
+            self.combined_filename = self.generate_output_filename(None, 'combined')
+            output_path = os.path.join(self.output_dir, self.combined_filename)
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write("WATCH MODE AUDIO TRANSCRIPTION\n")
+                f.write(f"Source directory: {self.source_dir}\n")
+                f.write(f"Processing start date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+                f.write("=" * 80 + "\n")
+        
+        processed_count = 0
+        failed_count = 0
+        
+        self.start_report()
+        watcher.start()
+        self.logger.info(f"Watching for new audio files in: {self.source_dir}")
+        try:
+            while not stop_event.is_set():
+                audio_file = watcher.next_file(timeout=1.0)
+                if audio_file is None:
+                    continue
+                
+                if save_mode in ('individual', 'both') and self.is_transcribed(audio_file):
+                    self.logger.debug(f"Already transcribed, skipping: {audio_file}", extra={"chatter": True})
+                    continue
+                
+                result = self.process_claimed_file(audio_file, save_mode)
+                if result:
+                    processed_count += 1
+                elif result is not None:
+                    failed_count += 1
+                
+                backlog = watcher.ready_files.qsize() + len(watcher.pending)
+                if backlog:
+                    self.logger.info(f"Files waiting: {backlog}")
+        finally:
+            watcher.stop()
+            if self.claims:
+                self.claims.close()
+            if self.store:
+                self.store.flush()
+            self.finish_report()
+            self.logger.info("Watch mode stopped:")
+            self.logger.info(f"  Successfully processed: {processed_count}")
+            self.logger.info(f"  Failed: {failed_count}")
 
 def main():
     """Main function for running batch processing"""
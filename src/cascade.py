@@ -0,0 +1,107 @@
+# cascade.py
+"""
+Two-tier transcription: a fast draft model for everything, the full model
+only where the draft is unsure.
+
+Every draft segment is scored by its average log probability, no-speech
+probability and compression ratio (the same signals whisper uses for its
+temperature fallback). Runs of low-confidence segments are cut out of the
+audio, transcribed again with the full model and spliced back in place of the
+draft text.
+
+Environment:
+    CASCADE_DRAFT_MODEL      draft model (e.g. tiny or base); cascade is off when unset
+    CASCADE_MIN_LOGPROB      re-decode segments with a lower avg_logprob (default -0.5)
+    CASCADE_MAX_NO_SPEECH    ... or a higher no_speech_prob (default 0.5)
+    CASCADE_MAX_COMPRESSION  ... or a higher compression ratio (default 2.2)
+"""
+import os
+import threading
+
+SAMPLE_RATE = 16000
+# Audio added around a re-decoded span so words at the cut are not lost
+SPAN_PADDING = 0.25
+# Low-confidence segments closer than this are re-decoded together
+SPAN_MERGE_GAP = 1.0
+
+_stats = {"files": 0, "segments": 0, "redecoded_segments": 0, "seconds": 0.0, "redecoded_seconds": 0.0}
+_stats_lock = threading.Lock()
+
+def draft_model_name():
+    return os.getenv('CASCADE_DRAFT_MODEL')
+
+def cascade_enabled():
+    return bool(draft_model_name())
+
+def default_thresholds():
+    return {
+        "min_logprob": float(os.getenv('CASCADE_MIN_LOGPROB', '-0.5')),
+        "max_no_speech": float(os.getenv('CASCADE_MAX_NO_SPEECH', '0.5')),
+        "max_compression": float(os.getenv('CASCADE_MAX_COMPRESSION', '2.2')),
+    }
+
+def is_low_confidence(segment, thresholds):
+    return (segment["avg_logprob"] < thresholds["min_logprob"]
+            or segment["no_speech_prob"] > thresholds["max_no_speech"]
+            or segment["compression_ratio"] > thresholds["max_compression"])
+
+def low_confidence_spans(segments, thresholds):
+    """[(first, last)] index ranges of segments to re-decode, nearby ones merged"""
+    spans = []
+    for index, segment in enumerate(segments):
+        if not is_low_confidence(segment, thresholds):
+            continue
+        if spans and segment["start"] - segments[spans[-1][1]]["end"] <= SPAN_MERGE_GAP:
+            spans[-1][1] = index
+        else:
+            spans.append([index, index])
+    return [tuple(span) for span in spans]
+
+def cascade_transcribe(pcm, draft_model, final_model, initial_prompt=None, thresholds=None):
+    """Transcribe float32 PCM with the draft model and fix unsure spans with the final one
+
+    Returns (text, stats) where stats describes how much was re-decoded.
+    """
+    thresholds = thresholds or default_thresholds()
+    draft = draft_model.transcribe(pcm, initial_prompt=initial_prompt)
+    segments = draft["segments"]
+    duration = len(pcm) / SAMPLE_RATE
+
+    parts = []
+    redecoded_segments = 0
+    redecoded_seconds = 0.0
+    next_index = 0
+    for first, last in low_confidence_spans(segments, thresholds):
+        parts.extend(segment["text"].strip() for segment in segments[next_index:first])
+        start = max(0.0, segments[first]["start"] - SPAN_PADDING)
+        end = min(duration, segments[last]["end"] + SPAN_PADDING)
+        prompt = ' '.join(parts)[-200:] or initial_prompt
+        result = final_model.transcribe(pcm[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)], initial_prompt=prompt)
+        parts.append(result["text"].strip())
+        redecoded_segments += last - first + 1
+        redecoded_seconds += end - start
+        next_index = last + 1
+    parts.extend(segment["text"].strip() for segment in segments[next_index:])
+
+    stats = {
+        "segments": len(segments),
+        "redecoded_segments": redecoded_segments,
+        "seconds": duration,
+        "redecoded_seconds": redecoded_seconds,
+    }
+    with _stats_lock:
+        _stats["files"] += 1
+        for key, value in stats.items():
+            _stats[key] += value
+    print(f"Cascade: re-decoded {redecoded_segments}/{len(segments)} segments, "
+          f"{redecoded_seconds:.1f}s of {duration:.1f}s audio")
+    return ' '.join(part for part in parts if part), stats
+
+def cascade_stats():
+    """Totals of this process with the share of audio that needed the final model"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["redecode_rate"] = round(stats["redecoded_seconds"] / stats["seconds"], 3) if stats["seconds"] else 0.0
+    stats["seconds"] = round(stats["seconds"], 1)
+    stats["redecoded_seconds"] = round(stats["redecoded_seconds"], 1)
+    return stats
@@ -0,0 +1,117 @@
+# clip_packer.py
+"""
+Packing of short clips into one decoding window.
+
+Whisper pads every input to a 30-second window, so a 4-second voice message
+costs the encoder as much as 30 seconds of audio. Short clips are joined with
+PACK_GAP_SECONDS of silence between them into one window, transcribed once,
+and the timed segments are split back to the clips at the middle of each gap.
+A clip touched by a segment that crosses such a boundary, or that got no text
+at all, is transcribed on its own instead. The language is detected once per
+window, so packing suits corpora in one language.
+
+Environment:
+    PACK_SHORT_CLIPS       1 = pack short clips in batch runs (default 0)
+    PACK_MAX_CLIP_SECONDS  clips up to this length are packed (default 8)
+    PACK_GAP_SECONDS       silence between packed clips (default 1.5)
+"""
+import os
+import threading
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+# Audio per packed window, below Whisper's 30 s so the last clip is not cut
+PACK_WINDOW_SECONDS = 28.0
+# Timestamps may reach this far past a boundary and still count as one clip
+BOUNDARY_TOLERANCE = 0.2
+
+_stats = {"windows": 0, "clips": 0, "fallbacks": 0}
+_stats_lock = threading.Lock()
+
+def packing_enabled():
+    return int(os.getenv('PACK_SHORT_CLIPS', '0')) == 1
+
+def max_clip_seconds():
+    return float(os.getenv('PACK_MAX_CLIP_SECONDS', '8'))
+
+def gap_seconds():
+    return float(os.getenv('PACK_GAP_SECONDS', '1.5'))
+
+def iter_packs(clips, window_seconds=PACK_WINDOW_SECONDS, gap=None, max_clip=None):
+    """Group (item, duration) pairs into lists of items
+
+    Clips longer than max_clip come alone, short ones are collected until the
+    next would not fit into window_seconds together with the gaps.
+    """
+    gap = gap if gap is not None else gap_seconds()
+    max_clip = max_clip if max_clip is not None else max_clip_seconds()
+    pack, length = [], 0.0
+    for item, duration in clips:
+        if duration > max_clip:
+            yield [item]
+            continue
+        if pack and length + gap + duration > window_seconds:
+            yield pack
+            pack, length = [], 0.0
+        length += duration + (gap if pack else 0.0)
+        pack.append(item)
+    if pack:
+        yield pack
+
+def build_window(pcms, gap=None, sample_rate=SAMPLE_RATE):
+    """(float32 PCM of the clips with silence between them, [(start, end)] seconds of each clip)"""
+    gap = gap if gap is not None else gap_seconds()
+    silence = np.zeros(int(gap * sample_rate), np.float32)
+    parts, spans, position = [], [], 0
+    for index, pcm in enumerate(pcms):
+        if index:
+            parts.append(silence)
+            position += len(silence)
+        parts.append(np.asarray(pcm, dtype=np.float32))
+        spans.append((position / sample_rate, (position + len(pcm)) / sample_rate))
+        position += len(pcm)
+    return np.concatenate(parts), spans
+
+def split_segments(segments, spans):
+    """Segments of each clip in its own time, None for clips that need their own decode"""
+    # Clip i owns the time up to the middle of the gap after it
+    bounds = np.array([(spans[i][1] + spans[i + 1][0]) / 2 for i in range(len(spans) - 1)])
+    clips = [[] for _ in spans]
+    ambiguous = set()
+    for segment in segments:
+        start, end = segment["start"] + BOUNDARY_TOLERANCE, segment["end"] - BOUNDARY_TOLERANCE
+        if start > end:
+            start = end = (segment["start"] + segment["end"]) / 2
+        first, last = np.searchsorted(bounds, [start, end], side='right')
+        if first != last:
+            ambiguous.update(range(first, last + 1))
+            continue
+        offset = spans[first][0]
+        clips[first].append({"start": max(0.0, segment["start"] - offset), "end": segment["end"] - offset,
+                             "text": segment["text"]})
+    return [None if index in ambiguous or not clip else clip for index, clip in enumerate(clips)]
+
+def transcribe_packed(pcms, transcribe_segments, gap=None):
+    """Transcribe clips in one window
+
+    transcribe_segments(pcm) returns the timed segments (dicts with start, end
+    and text) of the packed window. Returns the segments of each clip, None for
+    clips whose text could not be told apart.
+    """
+    window, spans = build_window(pcms, gap)
+    clips = split_segments(transcribe_segments(window), spans)
+    fallbacks = sum(clip is None for clip in clips)
+    with _stats_lock:
+        _stats["windows"] += 1
+        _stats["clips"] += len(clips)
+        _stats["fallbacks"] += fallbacks
+    print(f"Packed {len(clips)} clips ({spans[-1][1]:.1f}s) into one window, {fallbacks} decoded on their own")
+    return clips
+
+def segments_text(segments):
+    return ' '.join(segment["text"].strip() for segment in segments).strip()
+
+def packing_stats():
+    with _stats_lock:
+        return dict(_stats)
@@ -1,7 +1,19 @@
 # audio_converter.py
 import os
+import struct
+import tempfile
+import subprocess
+import numpy as np
 from pydub import AudioSegment
 
+from .media_probe import probe_duration
+
+SAMPLE_RATE = 16000
+# Longer recordings are decoded and transcribed window by window (0 = never)
+WINDOW_SECONDS = float(os.getenv('TRANSCRIBE_WINDOW_SECONDS', '600'))
+# Windows end at the quietest 100 ms within this many seconds before the nominal end
+CUT_SEARCH_SECONDS = 5.0
+
 def convert_to_wav(file_path):
     file_ext = os.path.splitext(file_path)[1].lower()
     output_file_path = os.path.splitext(file_path)[0] + ".wav"
@@ -34,3 +46,133 @@ def convert_to_wav(file_path):
     except Exception as e:
         print(f"Error converting file {file_path} to WAV: {e}")
         return None
+
+
+def load_pcm(file_path, sample_rate=SAMPLE_RATE):
+    """Mono float32 PCM of a file, from the PCM cache when PCM_CACHE_DIR is set"""
+    if os.getenv('PCM_CACHE_DIR'):
+        from pcm_cache import cached_pcm
+        return cached_pcm(file_path, lambda path: decode_pcm(path, sample_rate), sample_rate)
+    return decode_pcm(file_path, sample_rate)
+
+def decode_pcm(file_path, sample_rate=SAMPLE_RATE):
+    """Decode any supported file to mono float32 PCM through an ffmpeg pipe"""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", file_path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-"
+    ]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to decode audio {file_path}: {e.stderr.decode(errors='ignore')}") from e
+
+    return np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
+
+def _wav_data(file_path, sample_rate=SAMPLE_RATE):
+    """(offset, frames) of the samples of a mono 16-bit PCM WAV at sample_rate, None otherwise"""
+    with open(file_path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            return None
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = struct.unpack('<4sI', chunk)
+            if chunk_id == b'fmt ':
+                # format tag, channels, sample rate, byte rate, block align, bits per sample
+                fmt = struct.unpack('<HHIIHH', f.read(size + (size & 1))[:16])
+            elif chunk_id == b'data':
+                if fmt is None or fmt[0] != 1 or fmt[1] != 1 or fmt[2] != sample_rate or fmt[5] != 16:
+                    return None
+                offset = f.tell()
+                # Streaming writers leave the size at 0 or 0xFFFFFFFF
+                available = os.path.getsize(file_path) - offset
+                if size == 0 or size > available:
+                    size = available
+                return offset, size // 2
+            else:
+                f.seek(size + (size & 1), 1)
+
+def _pcm_blocks(file_path, sample_rate, block_samples):
+    """int16 mono PCM in blocks of at most block_samples, never the whole file at once"""
+    wav = _wav_data(file_path, sample_rate)
+    if wav is not None:
+        offset, frames = wav
+        if frames == 0:
+            return
+        # Only the pages of the block being copied are read in
+        samples = np.memmap(file_path, dtype='<i2', mode='r', offset=offset, shape=(frames,))
+        for start in range(0, frames, block_samples):
+            yield np.array(samples[start:start + block_samples])
+        del samples
+        return
+
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", file_path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-"
+    ]
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            while True:
+                data = process.stdout.read(block_samples * 2)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) // 2 * 2], np.int16)
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise RuntimeError(f"Failed to decode audio {file_path}: {stderr.read().decode(errors='ignore')}")
+        finally:
+            # Also reached when the consumer stops early
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+def _quietest_cut(samples, start, end, frame):
+    """Sample index in the middle of the lowest-energy frame of samples[start:end]"""
+    region = samples[start:end].astype(np.float32)
+    count = len(region) // frame
+    if count == 0:
+        return end
+    energy = np.square(region[:count * frame].reshape(count, frame)).mean(axis=1)
+    return start + int(np.argmin(energy)) * frame + frame // 2
+
+def _cut_windows(blocks, window, sample_rate):
+    """Yield (offset seconds, samples) windows of a stream of sample blocks, cut at quiet points"""
+    search = min(int(CUT_SEARCH_SECONDS * sample_rate), window // 2)
+    frame = sample_rate // 10
+
+    buffer = None
+    offset = 0
+    for block in blocks:
+        buffer = block if buffer is None else np.concatenate([buffer, block])
+        while len(buffer) >= window:
+            cut = _quietest_cut(buffer, window - search, window, frame)
+            yield offset / sample_rate, buffer[:cut]
+            buffer = buffer[cut:]
+            offset += cut
+    if buffer is not None and len(buffer):
+        yield offset / sample_rate, buffer
+
+def iter_pcm_windows(file_path, window_seconds=None, sample_rate=SAMPLE_RATE):
+    """Yield (offset seconds, float32 PCM) windows of about window_seconds each
+
+    Reads from a memory-mapped WAV when the file already is 16 kHz mono PCM,
+    otherwise from an ffmpeg pipe, so peak memory depends on the window size
+    and not on the length of the recording. Windows are cut at a quiet point
+    to avoid splitting words.
+    """
+    window = int((window_seconds or WINDOW_SECONDS) * sample_rate)
+    for offset, samples in _cut_windows(_pcm_blocks(file_path, sample_rate, window), window, sample_rate):
+        yield offset, samples.astype(np.float32) / 32768.0
+
+def iter_array_windows(pcm, window_seconds, sample_rate=SAMPLE_RATE):
+    """Same windows as iter_pcm_windows for PCM that is already decoded"""
+    return _cut_windows([pcm], int(window_seconds * sample_rate), sample_rate)
+
+def needs_windows(file_path):
+    """Whether a file is long enough to be transcribed window by window"""
+    return WINDOW_SECONDS > 0 and probe_duration(file_path) > WINDOW_SECONDS
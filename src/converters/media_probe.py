@@ -0,0 +1,142 @@
+# media_probe.py
+"""
+Audio metadata from container headers, without decoding.
+
+Duration, sample rate and channels come from the WAV header or from ffprobe,
+which only reads the container. Results are cached per file, keyed on the
+path, size and modification time, in memory and optionally in SQLite, so
+nightly runs over a mostly unchanged corpus probe only the new files.
+
+    python src/converters/media_probe.py /path/to/audio   # fill the cache, print totals
+
+Environment:
+    PROBE_CACHE_DB  persistent cache; only the in-process cache is used when unset
+"""
+import os
+import sys
+import json
+import wave
+import sqlite3
+import threading
+import subprocess
+
+PROBE_CACHE_DB = os.getenv('PROBE_CACHE_DB')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    sample_rate INTEGER,
+    channels INTEGER
+);
+"""
+
+# (path, size, mtime) -> probe, so unchanged files are probed once per process
+_probes = {}
+_lock = threading.Lock()
+_conn = None
+
+def _db():
+    """Connection to PROBE_CACHE_DB, opened on first use (None when unset)"""
+    global _conn
+    if _conn is None and PROBE_CACHE_DB:
+        db_dir = os.path.dirname(PROBE_CACHE_DB)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        _conn = sqlite3.connect(PROBE_CACHE_DB, timeout=30, isolation_level=None, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(SCHEMA)
+    return _conn
+
+def _probe_wav(file_path):
+    try:
+        with wave.open(file_path, 'rb') as wav:
+            return {"duration": wav.getnframes() / float(wav.getframerate()),
+                    "sample_rate": wav.getframerate(), "channels": wav.getnchannels()}
+    except (wave.Error, EOFError, OSError, ZeroDivisionError):
+        # Float and extensible WAVs are left to ffprobe
+        return None
+
+def _probe_ffprobe(file_path):
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "a:0",
+        "-show_entries", "format=duration:stream=duration,sample_rate,channels",
+        "-of", "json", file_path
+    ]
+    try:
+        out = json.loads(subprocess.run(cmd, capture_output=True, check=True, timeout=30).stdout)
+    except (subprocess.SubprocessError, OSError, ValueError):
+        return None
+    stream = (out.get("streams") or [{}])[0]
+    duration = out.get("format", {}).get("duration") or stream.get("duration")
+    try:
+        return {"duration": float(duration),
+                "sample_rate": int(stream["sample_rate"]) if stream.get("sample_rate") else None,
+                "channels": stream.get("channels")}
+    except (TypeError, ValueError):
+        return None
+
+def read_header(file_path):
+    """{'duration', 'sample_rate', 'channels'} of a file, uncached; None when it cannot be read"""
+    probe = _probe_wav(file_path) if os.path.splitext(file_path)[1].lower() == ".wav" else None
+    return probe or _probe_ffprobe(file_path)
+
+def probe_audio(file_path):
+    """{'duration', 'sample_rate', 'channels'} from the cache or the header
+
+    Files that cannot be probed get a duration estimated from their size and
+    no sample rate or channels; such estimates are not cached.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return {"duration": 0.0, "sample_rate": None, "channels": None}
+    path = os.path.realpath(file_path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        probe = _probes.get(key)
+        if probe is None and _db() is not None:
+            row = _conn.execute(
+                "SELECT duration, sample_rate, channels FROM probes WHERE path = ? AND size = ? AND mtime_ns = ?", key
+            ).fetchone()
+            if row:
+                probe = _probes[key] = {"duration": row[0], "sample_rate": row[1], "channels": row[2]}
+    if probe is not None:
+        return probe
+
+    probe = read_header(file_path)
+    if probe is None:
+        # Rough estimate from the size of a typical 32 kbit/s voice recording
+        return {"duration": stat.st_size * 8 / 32000.0, "sample_rate": None, "channels": None}
+    with _lock:
+        _probes[key] = probe
+        if _db() is not None:
+            _conn.execute("INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?)",
+                          (*key, probe["duration"], probe["sample_rate"], probe["channels"]))
+    return probe
+
+def probe_duration(file_path):
+    """Audio duration in seconds from the container header, without decoding"""
+    return probe_audio(file_path)["duration"]
+
+def main():
+    import time
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from file_discovery import iter_audio_files
+
+    if len(sys.argv) != 2:
+        print("Usage: python src/converters/media_probe.py /path/to/audio")
+        sys.exit(1)
+
+    start = time.time()
+    count, seconds = 0, 0.0
+    for file_path in iter_audio_files(sys.argv[1]):
+        count += 1
+        seconds += probe_duration(file_path)
+    print(f"{count} files, {seconds / 3600:.2f} audio hours, probed in {time.time() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
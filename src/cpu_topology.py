@@ -0,0 +1,190 @@
+# cpu_topology.py
+"""
+CPU affinity and NUMA-aware placement of inference workers.
+
+With CPU_PINNING=numa every inference worker (a hypercorn worker of app.py or
+a process of the parallel batch mode) is pinned to its own disjoint set of
+CPUs. Workers are spread over the NUMA nodes in proportion to their CPU
+counts, hyperthread siblings stay in the same set, and each worker prefers
+memory of its own node. Pinning happens before the model is loaded, so the
+weights and buffers a worker allocates land on its local node (first touch).
+
+Environment:
+    CPU_PINNING   'none' (default) or 'numa'
+    CPU_SLOT_DIR  directory for the worker slot locks of the server
+"""
+import os
+import sys
+import ctypes
+import platform
+import tempfile
+
+NODE_DIR = '/sys/devices/system/node'
+CPU_DIR = '/sys/devices/system/cpu'
+
+MPOL_PREFERRED = 1
+# set_mempolicy syscall numbers
+SYS_SET_MEMPOLICY = {'x86_64': 238, 'aarch64': 237, 'ppc64le': 261, 's390x': 270}
+
+# Open slot lock of this process and its slot, released automatically when it exits
+_slot_lock = None
+_slot_index = None
+
+def pinning_enabled():
+    return os.getenv('CPU_PINNING', 'none').lower() == 'numa' and hasattr(os, 'sched_setaffinity')
+
+def parse_cpulist(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+def format_cpulist(cpus):
+    """[0, 1, 2, 3, 8] -> '0-3,8'"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f"{start}-{end}" if start != end else str(start) for start, end in ranges)
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def allowed_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def numa_nodes():
+    """node -> CPUs of that node this process may use; one node if there is no NUMA info"""
+    allowed = set(allowed_cpus())
+    nodes = {}
+    try:
+        names = os.listdir(NODE_DIR)
+    except OSError:
+        names = []
+    for name in names:
+        if not (name.startswith('node') and name[4:].isdigit()):
+            continue
+        cpulist = _read(os.path.join(NODE_DIR, name, 'cpulist'))
+        cpus = [cpu for cpu in parse_cpulist(cpulist or '') if cpu in allowed]
+        if cpus:
+            nodes[int(name[4:])] = cpus
+    return nodes or {0: sorted(allowed)}
+
+def _core_order(cpus):
+    """CPUs ordered so hyperthread siblings are adjacent"""
+    def core_key(cpu):
+        siblings = _read(os.path.join(CPU_DIR, f'cpu{cpu}', 'topology', 'thread_siblings_list'))
+        return (min(parse_cpulist(siblings)) if siblings else cpu, cpu)
+    return sorted(cpus, key=core_key)
+
+def plan_layout(worker_count, nodes=None):
+    """[(node, cpus)] for each worker: disjoint CPU sets grouped by NUMA node
+
+    With more workers than CPUs on a node, the node's CPUs are shared round-robin.
+    """
+    nodes = nodes or numa_nodes()
+    per_node = {node: 0 for node in nodes}
+    for _ in range(worker_count):
+        # Next worker goes to the node with the most CPUs per worker left
+        node = min(nodes, key=lambda n: (per_node[n] / len(nodes[n]), n))
+        per_node[node] += 1
+
+    layout = []
+    for node in sorted(nodes):
+        cpus = _core_order(nodes[node])
+        count = per_node[node]
+        if count > len(cpus):
+            layout.extend((node, [cpus[i % len(cpus)]]) for i in range(count))
+            continue
+        for i in range(count):
+            layout.append((node, cpus[i * len(cpus) // count:(i + 1) * len(cpus) // count]))
+    return layout
+
+def report_layout(layout):
+    print(f"📌 CPU pinning: {len(layout)} worker(s) on {len({node for node, _ in layout})} NUMA node(s)")
+    for index, (node, cpus) in enumerate(layout):
+        print(f"   worker {index}: node {node}, cpus {format_cpulist(cpus)}")
+
+def prefer_local_memory(node):
+    """Ask the kernel to allocate from the given node (best effort)"""
+    number = SYS_SET_MEMPOLICY.get(platform.machine())
+    if number is None or not sys.platform.startswith('linux'):
+        return False
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        mask = (ctypes.c_ulong * 16)()
+        bits = ctypes.sizeof(ctypes.c_ulong) * 8
+        mask[node // bits] = 1 << (node % bits)
+        return libc.syscall(number, MPOL_PREFERRED, mask, len(mask) * bits + 1) == 0
+    except (OSError, IndexError):
+        return False
+
+def pin_process(cpus, node):
+    """Pin this process to cpus and size the math libraries' thread pools to match"""
+    os.sched_setaffinity(0, cpus)
+    threads = str(len(cpus))
+    # Read when torch/OpenMP initialize, so this has to happen before they are imported
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[name] = threads
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(len(cpus))
+    local = prefer_local_memory(node)
+    print(f"📌 Worker {os.getpid()} pinned to node {node}, cpus {format_cpulist(cpus)}"
+          f"{'' if local else ' (no local memory policy)'}")
+
+def claim_worker_slot(worker_count, scope=''):
+    """Index of a free worker slot, held through an flock until the process exits
+
+    A restarted worker gets the slot of the one it replaces. Servers on the same
+    host need different scopes (e.g. their bind address). Later calls in the
+    same process return the slot it already holds.
+    """
+    import fcntl
+    global _slot_lock, _slot_index
+
+    if _slot_lock is not None:
+        return _slot_index
+
+    scope = ''.join(c if c.isalnum() else '_' for c in scope)
+    slot_dir = os.path.join(os.getenv('CPU_SLOT_DIR') or tempfile.gettempdir(), f'speechToTxt-cpu-slots-{scope}'.rstrip('-'))
+    os.makedirs(slot_dir, exist_ok=True)
+    for index in range(worker_count):
+        lock = open(os.path.join(slot_dir, f'slot-{index}.lock'), 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            continue
+        _slot_lock, _slot_index = lock, index
+        return index
+    return None
+
+def pin_server_worker(worker_count, scope=''):
+    """Pin a server worker to the CPU set of the first free slot"""
+    if not pinning_enabled():
+        return None
+    if _slot_lock is not None:
+        # Already pinned by an earlier call in this process
+        return _slot_index
+    index = claim_worker_slot(worker_count, scope)
+    if index is None:
+        print(f"⚠️ No free CPU slot for worker {os.getpid()}, running unpinned")
+        return None
+    node, cpus = plan_layout(worker_count)[index]
+    pin_process(cpus, node)
+    return index
@@ -0,0 +1,174 @@
+# dispatcher.py
+"""
+Dispatcher in front of several transcription servers (src/app.py instances).
+
+Each upload is routed to the backend with the earliest expected completion:
+(audio seconds already dispatched to it + this file's duration) * its observed
+real-time factor. Unhealthy backends are skipped and failed requests are
+retried on the next best backend.
+
+Local test with the stand-in backend:
+    TRANSCRIPTION_BACKEND=stub WORKERS=1 BIND=127.0.0.1:8341 python src/app.py
+    TRANSCRIPTION_BACKEND=stub WORKERS=1 BIND=127.0.0.1:8342 python src/app.py
+    DISPATCHER_BACKENDS=http://127.0.0.1:8341,http://127.0.0.1:8342 python src/dispatcher.py
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+import aiohttp
+from fastapi import FastAPI, HTTPException, UploadFile, Form, File
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from converters.audio_converter import probe_duration
+
+DEFAULT_RTF = float(os.getenv('DISPATCHER_DEFAULT_RTF', '0.5'))
+RTF_SMOOTHING = float(os.getenv('DISPATCHER_RTF_SMOOTHING', '0.2'))
+HEALTH_INTERVAL = float(os.getenv('DISPATCHER_HEALTH_INTERVAL', '5'))
+MAX_ATTEMPTS = int(os.getenv('DISPATCHER_MAX_ATTEMPTS', '3'))
+REQUEST_TIMEOUT = float(os.getenv('DISPATCHER_REQUEST_TIMEOUT', '3600'))
+
+
+class Backend:
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.queued_seconds = 0.0
+        self.in_flight = 0
+        self.rtf = DEFAULT_RTF
+        self.healthy = True
+        self.failures = 0
+        self.reported_queue = 0
+
+    def expected_completion(self, duration):
+        """Seconds until a file of this duration would be done on this backend"""
+        return (self.queued_seconds + duration) * self.rtf
+
+    def observe(self, duration, elapsed):
+        # Exponential moving average of the real-time factor
+        if duration > 0:
+            self.rtf = (1 - RTF_SMOOTHING) * self.rtf + RTF_SMOOTHING * (elapsed / duration)
+
+    def status(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "queued_seconds": round(self.queued_seconds, 1),
+            "in_flight": self.in_flight,
+            "reported_queue": self.reported_queue,
+            "rtf": round(self.rtf, 3),
+            "failures": self.failures,
+        }
+
+
+backends = [Backend(url) for url in os.getenv('DISPATCHER_BACKENDS', 'http://127.0.0.1:8338').split(',') if url.strip()]
+
+app = FastAPI()
+_session = None
+_health_task = None
+
+def rank_backends(duration):
+    """Healthy backends ordered by expected completion time"""
+    candidates = [backend for backend in backends if backend.healthy] or backends
+    return sorted(candidates, key=lambda backend: backend.expected_completion(duration))
+
+async def check_health(backend):
+    try:
+        async with _session.get(f"{backend.url}/health", timeout=aiohttp.ClientTimeout(total=5)) as response:
+            backend.healthy = response.status == 200
+            if backend.healthy:
+                backend.reported_queue = (await response.json()).get("queued", 0)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        backend.healthy = False
+
+async def health_loop():
+    while True:
+        await asyncio.gather(*(check_health(backend) for backend in backends))
+        await asyncio.sleep(HEALTH_INTERVAL)
+
+@app.on_event("startup")
+async def startup():
+    global _session, _health_task
+    _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+    _health_task = asyncio.create_task(health_loop())
+    print(f"Dispatching to: {[backend.url for backend in backends]}")
+
+@app.on_event("shutdown")
+async def shutdown():
+    _health_task.cancel()
+    await _session.close()
+
+async def forward(backend, data, filename, fields):
+    form = aiohttp.FormData()
+    form.add_field('file', data, filename=filename)
+    for name, value in fields.items():
+        if value is not None:
+            form.add_field(name, value)
+    async with _session.post(f"{backend.url}/update/", data=form) as response:
+        return response.status, await response.json(content_type=None)
+
+@app.post("/update/")
+async def dispatch(file: UploadFile = File(...),
+                   clientId: str = Form(...),
+                   segment_number: str = Form(default='unknown'),
+                   priority: str = Form(default=None)):
+    data = await file.read()
+
+    # The duration is probed from the header of a temporary copy
+    suffix = os.path.splitext(file.filename or '')[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        tmp.write(data)
+    try:
+        duration = await run_in_threadpool(probe_duration, tmp.name)
+    finally:
+        os.remove(tmp.name)
+
+    fields = {"clientId": clientId, "segment_number": segment_number, "priority": priority}
+    last_error = "No backends configured"
+    for backend in rank_backends(duration)[:MAX_ATTEMPTS]:
+        backend.queued_seconds += duration
+        backend.in_flight += 1
+        start = time.monotonic()
+        try:
+            status, body = await forward(backend, data, file.filename, fields)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            backend.healthy = False
+            backend.failures += 1
+            last_error = f"{backend.url}: {e}"
+            print(f"Backend failed, retrying elsewhere: {last_error}")
+            continue
+        finally:
+            backend.queued_seconds -= duration
+            backend.in_flight -= 1
+
+        if status >= 500:
+            backend.failures += 1
+            last_error = f"{backend.url}: HTTP {status}"
+            print(f"Backend error, retrying elsewhere: {last_error}")
+            continue
+
+        if status == 200:
+            backend.observe(duration, time.monotonic() - start)
+        return JSONResponse(status_code=status, content=body, headers={"X-Transcription-Backend": backend.url})
+
+    raise HTTPException(status_code=502, detail=f"All backends failed: {last_error}")
+
+@app.get("/backends")
+async def backend_status():
+    return [backend.status() for backend in backends]
+
+
+if __name__ == "__main__":
+    import hypercorn.asyncio
+
+    async def main():
+        # Single process: the load accounting lives in this process
+        config = hypercorn.Config()
+        config.bind = [os.getenv('DISPATCHER_BIND', '0.0.0.0:8330')]
+        await hypercorn.asyncio.serve(app, config)
+
+    asyncio.run(main())
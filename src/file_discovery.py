@@ -0,0 +1,83 @@
+# file_discovery.py
+"""
+Audio file discovery shared by all processors.
+
+One os.scandir walk over the tree, case-insensitive extension matching and
+lazy results, so processing starts with the first file found.
+
+Environment:
+    DISCOVERY_INCLUDE          comma-separated glob patterns a file must match
+    DISCOVERY_EXCLUDE          comma-separated glob patterns for files/dirs to skip
+    DISCOVERY_FOLLOW_SYMLINKS  'files' (default), 'all' or 'none'
+"""
+import os
+from fnmatch import fnmatch
+
+AUDIO_EXTENSIONS = ('.ogg', '.m4a', '.wav', '.mp3', '.flac', '.aac')
+SYMLINK_POLICIES = ('files', 'all', 'none')
+
+def _patterns(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [pattern.strip() for pattern in value if pattern.strip()]
+
+def _matches(patterns, name, relative_path):
+    return any(fnmatch(name, pattern) or fnmatch(relative_path, pattern) for pattern in patterns)
+
+def iter_audio_files(root, extensions=AUDIO_EXTENSIONS, include=None, exclude=None, follow_symlinks=None):
+    """Yield audio file paths under root, one directory at a time
+
+    Patterns are matched against the file name and the path relative to root
+    (with '/' separators). Excluded directories are not descended into.
+    """
+    extensions = {ext.lower() for ext in extensions}
+    include = _patterns(include if include is not None else os.getenv('DISCOVERY_INCLUDE'))
+    exclude = _patterns(exclude if exclude is not None else os.getenv('DISCOVERY_EXCLUDE'))
+    follow_symlinks = (follow_symlinks or os.getenv('DISCOVERY_FOLLOW_SYMLINKS', 'files')).lower()
+    if follow_symlinks not in SYMLINK_POLICIES:
+        raise ValueError(f"Unknown symlink policy: {follow_symlinks} (expected one of {SYMLINK_POLICIES})")
+
+    # Directories already visited, guards against symlink loops
+    visited = set()
+    stack = [root]
+
+    while stack:
+        directory = stack.pop()
+        try:
+            stat = os.stat(directory)
+            if (stat.st_dev, stat.st_ino) in visited:
+                continue
+            visited.add((stat.st_dev, stat.st_ino))
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            relative_path = os.path.relpath(entry.path, root).replace(os.sep, '/')
+            try:
+                is_symlink = entry.is_symlink()
+                if is_symlink and follow_symlinks == 'none':
+                    continue
+                if entry.is_dir(follow_symlinks=follow_symlinks == 'all'):
+                    if not _matches(exclude, entry.name, relative_path):
+                        subdirectories.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            if os.path.splitext(entry.name)[1].lower() not in extensions:
+                continue
+            if include and not _matches(include, entry.name, relative_path):
+                continue
+            if _matches(exclude, entry.name, relative_path):
+                continue
+            yield entry.path
+
+        # Reversed so directories are visited in name order
+        stack.extend(reversed(subdirectories))
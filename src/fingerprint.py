@@ -0,0 +1,251 @@
+# fingerprint.py
+"""
+Acoustic fingerprints for reusing transcriptions of repeated audio.
+
+IVR prompts, voicemail greetings and forwarded voice notes arrive again and
+again, re-encoded, so their bytes differ. The fingerprint is a sequence of
+32-bit sub-fingerprints, one every 16 ms, each bit the sign of the change of
+the energy difference of two neighbouring bands (Haitsma-Kalker). Signs of
+log-energy differences survive gain changes, codecs and mild noise.
+
+Sub-fingerprints of transcribed files are indexed in SQLite together with the
+text and timed segments. Exact sub-fingerprint hits vote for a time offset
+into a stored file; the best candidates are verified by the bit error rate
+over the aligned fingerprints. A new file that matches a stored one (or a
+stretch of a longer stored one) reuses that text instead of running the model.
+
+Silence has no band structure to sign: digital silence hashes to 0 and a noise
+floor to random bits, so silence-padded clips would match each other on their
+padding. Sub-fingerprints of quiet frames are set to 0 and, like the other
+degenerate hash 0xFFFFFFFF, are neither indexed, voted with nor compared.
+
+Environment:
+    FINGERPRINT_DB           index path; fingerprinting is off when unset
+    FINGERPRINT_MAX_SECONDS  only files up to this length are fingerprinted (default 300)
+    FINGERPRINT_MAX_BER      bit error rate up to which audio counts as the same (default 0.3)
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FINGERPRINT_DB = os.getenv('FINGERPRINT_DB')
+FINGERPRINT_MAX_SECONDS = float(os.getenv('FINGERPRINT_MAX_SECONDS', '300'))
+FINGERPRINT_MAX_BER = float(os.getenv('FINGERPRINT_MAX_BER', '0.3'))
+
+# 256 ms frames of the 8 kHz signal every 16 ms; 33 bands between 300 and 2000 Hz
+FP_SAMPLE_RATE = 8000
+FRAME = 2048
+HOP = 128
+BANDS = np.geomspace(300, 2000, 34)
+# Frames per FFT block, bounds memory for long files
+BLOCK_FRAMES = 2048
+# Candidate offsets verified by bit error rate
+CANDIDATES = 5
+# The aligned part must cover this share of the new recording
+MIN_OVERLAP = 0.8
+# Frames this far below the loud frames of the file (50 dB), or under about -80 dBFS, are silence
+SILENCE_RATIO = 1e-5
+SILENCE_FLOOR = 1e-3
+# Non-silent aligned sub-fingerprints needed to verify a match (about 1 s)
+MIN_VALID_FRAMES = 64
+# Hashes of silent or featureless frames
+DEGENERATE = (0, 0xFFFFFFFF)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fp_files (
+    id INTEGER PRIMARY KEY,
+    source TEXT,
+    duration REAL NOT NULL,
+    text TEXT NOT NULL,
+    segments TEXT,
+    fingerprint BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fp_hashes (
+    hash INTEGER NOT NULL,
+    file_id INTEGER NOT NULL,
+    t INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fp_hashes_hash ON fp_hashes (hash);
+"""
+
+def fingerprint_enabled():
+    return bool(FINGERPRINT_DB)
+
+def _band_matrix():
+    """rfft bins -> band energies"""
+    freqs = np.fft.rfftfreq(FRAME, 1 / FP_SAMPLE_RATE)
+    matrix = np.zeros((len(freqs), len(BANDS) - 1), np.float32)
+    for band in range(len(BANDS) - 1):
+        matrix[(freqs >= BANDS[band]) & (freqs < BANDS[band + 1]), band] = 1.0
+    return matrix
+
+def fingerprint(pcm, sample_rate=16000):
+    """uint32 sub-fingerprints of float32 PCM, one per HOP / FP_SAMPLE_RATE seconds
+
+    Sub-fingerprints involving a silent frame are 0.
+    """
+    step = sample_rate // FP_SAMPLE_RATE
+    usable = len(pcm) // step * step
+    # Averaging neighbours is a cheap low-pass before dropping to 8 kHz
+    signal = np.asarray(pcm[:usable], dtype=np.float32).reshape(-1, step).mean(axis=1)
+    if len(signal) < FRAME + HOP:
+        return np.empty(0, np.uint32)
+
+    frames = sliding_window_view(signal, FRAME)[::HOP]
+    window = np.hanning(FRAME).astype(np.float32)
+    bands = _band_matrix()
+    energy = np.concatenate([
+        np.square(np.abs(np.fft.rfft(frames[start:start + BLOCK_FRAMES] * window, axis=1))) @ bands
+        for start in range(0, len(frames), BLOCK_FRAMES)
+    ])
+    total = energy.sum(axis=1)
+    silent = total < max(SILENCE_FLOOR, np.percentile(total, 95) * SILENCE_RATIO)
+    energy = np.log(energy + 1e-10)
+
+    # Bit m of frame n: sign of the change over time of the difference of bands m and m + 1
+    difference = energy[:, :-1] - energy[:, 1:]
+    bits = (difference[1:] - difference[:-1]) > 0
+    fp = np.packbits(bits, axis=1, bitorder='little').view('<u4').ravel()
+    fp[silent[1:] | silent[:-1]] = 0
+    return fp
+
+def valid_frames(fp):
+    """Mask of the sub-fingerprints that carry audio (not silent or degenerate)"""
+    return ~np.isin(fp, DEGENERATE)
+
+def bit_error_rate(a, b):
+    return np.unpackbits((a ^ b).view(np.uint8)).mean() if len(a) else 1.0
+
+
+class FingerprintIndex:
+    def __init__(self, db_path=None, max_ber=None):
+        self.db_path = db_path or FINGERPRINT_DB
+        self.max_ber = max_ber if max_ber is not None else FINGERPRINT_MAX_BER
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def add(self, fp, duration, text, segments=None, source=None):
+        """Store the fingerprint of a transcribed file"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                file_id = self.conn.execute(
+                    "INSERT INTO fp_files (source, duration, text, segments, fingerprint, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (source, duration, text, json.dumps(segments) if segments else None, fp.tobytes(), time.time())
+                ).lastrowid
+                t = np.flatnonzero(valid_frames(fp))
+                self.conn.executemany(
+                    "INSERT INTO fp_hashes (hash, file_id, t) VALUES (?, ?, ?)",
+                    zip(fp[t].tolist(), [file_id] * len(t), t.tolist())
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return file_id
+
+    def _candidates(self, fp):
+        """(hash, file_id, t) rows of stored files sharing any sub-fingerprint"""
+        unique = np.unique(fp[valid_frames(fp)]).tolist()
+        rows = []
+        with self.lock:
+            for start in range(0, len(unique), 900):
+                chunk = unique[start:start + 900]
+                rows.extend(self.conn.execute(
+                    f"SELECT hash, file_id, t FROM fp_hashes WHERE hash IN ({','.join('?' * len(chunk))})", chunk
+                ))
+        return np.array(rows, dtype=np.int64).reshape(-1, 3)
+
+    def _offsets(self, fp):
+        """[(file_id, offset)] most voted by exact sub-fingerprint hits"""
+        rows = self._candidates(fp)
+        if len(rows) == 0:
+            return []
+        hashes = fp.astype(np.int64)
+        order = np.argsort(hashes, kind='stable')
+        sorted_hashes = hashes[order]
+        left = np.searchsorted(sorted_hashes, rows[:, 0], side='left')
+        right = np.searchsorted(sorted_hashes, rows[:, 0], side='right')
+        counts = right - left
+        # Positions left[i] .. right[i] - 1 for every row, without a Python loop
+        starts = np.repeat(left, counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        offsets = np.repeat(rows[:, 2], counts) - order[starts + within]
+
+        pairs, votes = np.unique(np.stack([np.repeat(rows[:, 1], counts), offsets], axis=1),
+                                 axis=0, return_counts=True)
+        return [tuple(int(v) for v in pairs[i]) for i in np.argsort(votes)[::-1][:CANDIDATES]]
+
+    def match(self, fp, duration):
+        """Stored transcription covering this audio, or None
+
+        A match is either a near-duplicate of a whole stored file or a stretch
+        of a longer stored file with timed segments.
+        """
+        valid = valid_frames(fp)
+        if valid.sum() < MIN_VALID_FRAMES:
+            return None
+
+        best = None
+        for file_id, offset in self._offsets(fp):
+            with self.lock:
+                row = self.conn.execute(
+                    "SELECT duration, text, segments, fingerprint FROM fp_files WHERE id = ?", (file_id,)
+                ).fetchone()
+            stored = np.frombuffer(row[3], dtype='<u4')
+            # Aligned overlap: query frame i is stored frame i + offset
+            start, end = max(0, -offset), min(len(fp), len(stored) - offset)
+            if end - start < MIN_OVERLAP * len(fp):
+                continue
+            # Only frames with audio in both are compared, and enough of them
+            aligned = stored[start + offset:end + offset]
+            both = valid[start:end] & valid_frames(aligned)
+            if both.sum() < max(MIN_VALID_FRAMES, MIN_OVERLAP * valid.sum()):
+                continue
+            ber = bit_error_rate(fp[start:end][both], aligned[both])
+            if ber <= self.max_ber and (best is None or ber < best[0]):
+                best = (ber, file_id, offset, row)
+        if best is None:
+            return None
+
+        ber, file_id, offset, (stored_duration, text, segments, _) = best
+        match = {"file_id": file_id, "ber": round(float(ber), 3), "offset": offset * HOP / FP_SAMPLE_RATE}
+        if abs(stored_duration - duration) <= 0.1 * max(stored_duration, duration) and abs(match["offset"]) < 1.0:
+            return {**match, "text": text, "segments": json.loads(segments) if segments else None}
+
+        if segments and match["offset"] >= -0.5 and match["offset"] + duration <= stored_duration + 1.0:
+            # A stretch of a longer recording: reuse the segments inside it, shifted to our time
+            start, end = match["offset"], match["offset"] + duration
+            inside = [
+                {"start": segment["start"] - start, "end": segment["end"] - start, "text": segment["text"]}
+                for segment in json.loads(segments)
+                if segment["start"] >= start - 0.5 and segment["end"] <= end + 0.5
+            ]
+            if inside:
+                return {**match, "text": ''.join(segment["text"] for segment in inside).strip(), "segments": inside}
+        return None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    """Index of this process, opened on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FingerprintIndex()
+        return _index
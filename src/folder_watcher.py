@@ -0,0 +1,214 @@
+# folder_watcher.py
+"""
+Watch a directory tree for new audio files.
+
+Uses inotify on Linux (through ctypes, no extra packages) and falls back to
+periodic scanning elsewhere or on network shares where inotify does not see
+remote writes (WATCH_METHOD=poll). A file is reported only once its size and
+modification time have stayed the same for WATCH_SETTLE_SECONDS, so files that
+are still being copied are not picked up half-written.
+"""
+import os
+import sys
+import time
+import queue
+import struct
+import select
+import ctypes
+import ctypes.util
+import threading
+
+from .file_discovery import iter_audio_files, AUDIO_EXTENSIONS
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifySource:
+    """Recursive inotify watch, returns paths of touched files"""
+
+    def __init__(self, root):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root = root
+        self.watches = {}
+        self.needs_rescan = False
+        self.watch_tree(root)
+
+    def watch_tree(self, directory):
+        for current, _, _ in os.walk(directory):
+            wd = self._add_watch(self.fd, os.fsencode(current), WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = current
+
+    def poll(self, timeout):
+        """Paths touched since the last call (waits up to timeout seconds)"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+
+        paths = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, the caller has to rescan the tree
+                self.needs_rescan = True
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # New directory: watch it and pick up files already inside
+                    self.watch_tree(path)
+                    paths.update(iter_audio_files(path))
+                continue
+            paths.add(path)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Reports new audio files once they are fully written
+
+    At most max_pending settled files are handed out through ready_files;
+    when processing falls behind, further files stay in the pending set (one
+    entry per path, no matter how many events arrive) until there is room.
+    """
+
+    def __init__(self, root, extensions=AUDIO_EXTENSIONS, settle_seconds=None, poll_interval=None,
+                 max_pending=None, method=None, initial_scan=True):
+        self.root = root
+        self.extensions = {ext.lower() for ext in extensions}
+        self.settle_seconds = float(settle_seconds or os.getenv('WATCH_SETTLE_SECONDS', '3'))
+        self.poll_interval = float(poll_interval or os.getenv('WATCH_POLL_INTERVAL', '5'))
+        self.ready_files = queue.Queue(maxsize=int(max_pending or os.getenv('WATCH_MAX_PENDING', '100')))
+        self.method = (method or os.getenv('WATCH_METHOD', 'auto')).lower()
+        self.initial_scan = initial_scan
+        self.stop_event = threading.Event()
+        # path -> (size, mtime, time the stat was first seen unchanged)
+        self.pending = {}
+        self.known = {}
+        self.source = None
+        self.thread = None
+
+    def _open_source(self):
+        if self.method in ('auto', 'inotify') and sys.platform.startswith('linux'):
+            try:
+                return InotifySource(self.root)
+            except OSError as e:
+                if self.method == 'inotify':
+                    raise
+                print(f"inotify unavailable ({e}), falling back to polling")
+        return None
+
+    def _is_audio(self, path):
+        return os.path.splitext(path)[1].lower() in self.extensions
+
+    def _scan(self):
+        return set(iter_audio_files(self.root, self.extensions))
+
+    def _track(self, paths):
+        for path in paths:
+            if not self._is_audio(path) or path in self.pending:
+                continue
+            if path in self.known:
+                # Seen again by a rescan: only changed files are picked up again
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if self.known[path] == (stat.st_size, stat.st_mtime):
+                    continue
+            self.pending[path] = (None, None, None)
+
+    def _settle(self):
+        """Move files whose size and mtime stopped changing to the ready queue"""
+        now = time.monotonic()
+        for path, (size, mtime, stable_since) in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+
+            if (stat.st_size, stat.st_mtime) != (size, mtime):
+                self.pending[path] = (stat.st_size, stat.st_mtime, now)
+                continue
+            if now - stable_since < self.settle_seconds:
+                continue
+            if self.known.get(path) == (size, mtime):
+                # Touched without changes after it was handed out
+                del self.pending[path]
+                continue
+            try:
+                self.ready_files.put_nowait(path)
+            except queue.Full:
+                # Back-pressure: keep it pending until the processor catches up
+                return
+            self.known[path] = (size, mtime)
+            del self.pending[path]
+
+    def _run(self):
+        self.source = self._open_source()
+        print(f"Watching {self.root} ({'inotify' if self.source else 'polling'})")
+        if self.initial_scan:
+            self._track(self._scan())
+
+        # With pending files the loop wakes up often enough to notice them settle
+        while not self.stop_event.is_set():
+            timeout = min(self.poll_interval, self.settle_seconds / 2) if self.pending else self.poll_interval
+            if self.source:
+                self._track(self.source.poll(timeout))
+                if self.source.needs_rescan:
+                    self.source.needs_rescan = False
+                    self._track(self._scan())
+            else:
+                self.stop_event.wait(timeout)
+                self._track(self._scan())
+            self._settle()
+
+        if self.source:
+            self.source.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def next_file(self, timeout=1.0):
+        """Next settled file, or None if nothing is ready within timeout"""
+        try:
+            return self.ready_files.get(timeout=timeout)
+        except queue.Empty:
+            return None
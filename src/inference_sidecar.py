@@ -0,0 +1,200 @@
+# inference_sidecar.py
+"""
+Central inference process for the HTTP server.
+
+The server workers only receive uploads and decode them to PCM. The samples are
+placed in a shared-memory block and a small JSON request is sent over a Unix
+socket to this process, which owns the only model instance and schedules the
+jobs of all workers from one priority queue.
+
+Run:
+    python src/inference_sidecar.py --socket /tmp/stt-inference.sock
+    INFERENCE_SOCKET=/tmp/stt-inference.sock python src/app.py
+"""
+import os
+import sys
+import json
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from scheduler import PriorityScheduler, classify_priority
+from cascade import cascade_enabled
+from converters.audio_converter import SAMPLE_RATE
+
+DEFAULT_SOCKET = '/tmp/stt-inference.sock'
+
+def send_message(sock, message):
+    """Send a length-prefixed JSON message"""
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(struct.pack('!I', len(data)) + data)
+
+def recv_message(sock):
+    """Receive a length-prefixed JSON message (None if the peer closed)"""
+    header = _recv_exact(sock, 4)
+    if header is None:
+        return None
+    data = _recv_exact(sock, struct.unpack('!I', header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def _attach_shared_memory(name):
+    """Attach to a block owned by the client without adopting its cleanup"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers attached blocks with the resource tracker,
+        # which would unlink them when this process exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+def transcribe_remote(pcm, socket_path=None, options=None, priority=None, model=None):
+    """Transcribe decoded PCM in the inference process, returns (text, error)
+
+    model names a model other than the sidecar's own; it is loaded there on first use.
+    """
+    socket_path = socket_path or os.getenv('INFERENCE_SOCKET', DEFAULT_SOCKET)
+    pcm = np.ascontiguousarray(pcm, dtype=np.float32)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(pcm.nbytes, 1))
+    try:
+        buffer = np.ndarray(pcm.shape, dtype=np.float32, buffer=shm.buf)
+        buffer[:] = pcm
+        del buffer
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            send_message(sock, {
+                "shm": shm.name,
+                "samples": int(pcm.shape[0]),
+                "priority": priority,
+                "model": model,
+                "options": options or {},
+            })
+            response = recv_message(sock)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    if response is None:
+        return None, "Inference process closed the connection"
+    return response.get("text"), response.get("error")
+
+
+class InferenceSidecar:
+    def __init__(self, socket_path=DEFAULT_SOCKET, model_name=None, stub=False):
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.stub = stub
+        self.model = None
+        self.jobs = PriorityScheduler()
+
+    def _load_model(self):
+        if self.stub:
+            print("Inference sidecar runs the stand-in backend (no model loaded)")
+            return
+        from transformer import get_model
+        self.model = get_model(self.model_name)
+        print("Inference sidecar model loaded")
+
+    def submit(self, request):
+        """Queue a request from a worker connection and wait for its result"""
+        job = {"request": request, "done": threading.Event(), "response": None}
+        duration = request["samples"] / SAMPLE_RATE
+        self.jobs.push(job, duration, classify_priority(duration, request.get("priority")))
+        job["done"].wait()
+        return job["response"]
+
+    def _run_job(self, request):
+        if self.stub:
+            return {"text": "This is a test transcription", "error": None}
+
+        shm = _attach_shared_memory(request["shm"])
+        try:
+            audio = np.ndarray((request["samples"],), dtype=np.float32, buffer=shm.buf)
+            options = request.get("options", {})
+            model = self.model
+            if request.get("model") and request["model"] != self.model_name:
+                from transformer import get_model
+                model = get_model(request["model"])
+            if cascade_enabled():
+                from transformer import transcribe_pcm
+                text = transcribe_pcm(audio, options.get("initial_prompt"), model)
+            else:
+                text = model.transcribe(audio, **options)["text"]
+            del audio
+            return {"text": text, "error": None}
+        finally:
+            shm.close()
+
+    def _inference_loop(self):
+        # One thread owns the model, jobs of all workers are scheduled together
+        while True:
+            job = self.jobs.pop()
+            try:
+                job["response"] = self._run_job(job["request"])
+            except Exception as e:
+                print(f"Error in sidecar transcription: {e}")
+                job["response"] = {"text": None, "error": str(e)}
+            finally:
+                job["done"].set()
+
+    def serve_forever(self):
+        self._load_model()
+        threading.Thread(target=self._inference_loop, daemon=True).start()
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        sidecar = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                while True:
+                    request = recv_message(self.request)
+                    if request is None:
+                        return
+                    send_message(self.request, sidecar.submit(request))
+
+        with socketserver.ThreadingUnixStreamServer(self.socket_path, Handler) as server:
+            server.daemon_threads = True
+            print(f"Inference sidecar listening on {self.socket_path}")
+            try:
+                server.serve_forever()
+            finally:
+                os.remove(self.socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Central inference process for the HTTP workers')
+    parser.add_argument('--socket', default=os.getenv('INFERENCE_SOCKET', DEFAULT_SOCKET),
+                        help=f'Unix socket path (default: {DEFAULT_SOCKET})')
+    parser.add_argument('--model', default=os.getenv('WHISPER_MODEL', 'small'), help='Model size (default: small)')
+    parser.add_argument('--stub', action='store_true',
+                        default=os.getenv('TRANSCRIPTION_BACKEND') == 'stub',
+                        help='Answer with the stand-in transcription instead of loading a model')
+    args = parser.parse_args()
+
+    InferenceSidecar(args.socket, args.model, args.stub).serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+# job_queue.py
+"""
+Durable job queue for long recordings, backed by a local SQLite database.
+
+Jobs are claimed with a visibility timeout: a claimed job that is not completed
+or extended in time becomes visible again and is picked up by another worker,
+so jobs survive worker restarts. Failed jobs are retried until MAX_JOB_ATTEMPTS.
+Only the worker holding the claim can complete or fail a job.
+"""
+import os
+import time
+import uuid
+import sqlite3
+from contextlib import closing
+
+JOBS_DB = os.getenv('JOBS_DB', os.path.join('uploads', 'jobs.db'))
+JOBS_UPLOAD_DIR = os.getenv('JOBS_UPLOAD_DIR', os.path.join('uploads', 'jobs'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    client_id TEXT,
+    segment_number TEXT,
+    callback_url TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    visible_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, visible_at, created_at);
+"""
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+def remove_upload(file_path):
+    """Delete the uploaded recording of a finished job"""
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+class JobQueue:
+    def __init__(self, db_path=None, visibility_timeout=None, max_attempts=None, retry_delay=None):
+        self.db_path = db_path or JOBS_DB
+        self.visibility_timeout = float(visibility_timeout or os.getenv('JOB_VISIBILITY_TIMEOUT', '300'))
+        self.max_attempts = int(max_attempts or os.getenv('MAX_JOB_ATTEMPTS', '3'))
+        self.retry_delay = float(retry_delay or os.getenv('JOB_RETRY_DELAY', '10'))
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, file_path, client_id=None, segment_number=None, callback_url=None, job_id=None):
+        """Add a job, returns its id"""
+        job_id = job_id or new_job_id()
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, file_path, client_id, segment_number, callback_url, status,"
+                " created_at, updated_at, visible_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, file_path, client_id, segment_number, callback_url, now, now, now)
+            )
+        return job_id
+
+    def claim(self, worker_id):
+        """Claim the oldest visible job, returns it as a dict or None"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Jobs whose last attempt expired and used up all attempts are dead
+            dead = conn.execute(
+                "SELECT file_path FROM jobs WHERE status = 'running' AND visible_at <= ? AND attempts >= ?",
+                (now, self.max_attempts)
+            ).fetchall()
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = COALESCE(error, 'Visibility timeout expired'),"
+                " updated_at = ? WHERE status = 'running' AND visible_at <= ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') AND visible_at <= ?"
+                " ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?,"
+                    " updated_at = ?, visible_at = ? WHERE id = ?",
+                    (worker_id, now, now + self.visibility_timeout, row["id"])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        for dead_job in dead:
+            remove_upload(dead_job["file_path"])
+        if row is None:
+            return None
+        job = dict(row)
+        job["attempts"] += 1
+        job["status"] = 'running'
+        return job
+
+    def extend(self, job_id, worker_id):
+        """Push the visibility timeout of a running job forward (heartbeat)"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET visible_at = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (now + self.visibility_timeout, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, result):
+        """Store the result, False when the claim was lost to another worker"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, updated_at = ?"
+                " WHERE id = ? AND worker = ? AND status = 'running'",
+                (result, time.time(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Record a failed attempt, the job is retried with a growing delay until attempts run out
+
+        Returns the new status ('queued' or 'failed'), None when the claim was lost.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT attempts FROM jobs WHERE id = ? AND worker = ? AND status = 'running'", (job_id, worker_id)
+            ).fetchone()
+            if row is None:
+                return None
+            if row["attempts"] >= self.max_attempts:
+                status, visible_at = 'failed', now
+            else:
+                status, visible_at = 'queued', now + self.retry_delay * row["attempts"]
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, visible_at = ?"
+                " WHERE id = ? AND worker = ? AND status = 'running'",
+                (status, error, now, visible_at, job_id, worker_id)
+            )
+            return status if cursor.rowcount == 1 else None
+
+    def get(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
@@ -0,0 +1,105 @@
+# job_worker.py
+"""
+Worker process for the asynchronous job API (POST /jobs).
+
+Claims jobs from the SQLite queue, transcribes them with transcribe_audio and
+stores the result. Run as many worker processes as the host can handle:
+    python src/job_worker.py
+"""
+import os
+import sys
+import json
+import signal
+import socket
+import threading
+import urllib.request
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_queue import JobQueue, remove_upload
+from transformer import transcribe_audio
+
+def send_callback(callback_url, payload):
+    """POST the job result to the callback URL given at submission"""
+    try:
+        request = urllib.request.Request(
+            callback_url,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=10):
+            pass
+    except Exception as e:
+        print(f"Callback to {callback_url} failed: {e}")
+
+
+class JobWorker:
+    def __init__(self, job_queue=None, poll_interval=None):
+        self.queue = job_queue or JobQueue()
+        self.poll_interval = float(poll_interval or os.getenv('JOB_POLL_INTERVAL', '2'))
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stop_event = threading.Event()
+
+    def _heartbeat(self, job_id, done):
+        # Keep the claim alive while a long recording is being transcribed
+        interval = self.queue.visibility_timeout / 3
+        while not done.wait(interval):
+            self.queue.extend(job_id, self.worker_id)
+
+    def process_job(self, job):
+        print(f"Job {job['id']}: processing {job['file_path']} (attempt {job['attempts']})")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job['id'], done), daemon=True)
+        heartbeat.start()
+        try:
+            transcription, error = transcribe_audio(job['file_path'])
+        except Exception as e:
+            transcription, error = None, str(e)
+        finally:
+            done.set()
+            heartbeat.join()
+
+        if transcription and not error:
+            status = 'done' if self.queue.complete(job['id'], self.worker_id, transcription) else None
+        else:
+            status = self.queue.fail(job['id'], self.worker_id, error or "Invalid transformation")
+        if status is None:
+            # The visibility timeout expired and another worker owns the job now
+            print(f"Job {job['id']}: claim lost, result dropped")
+            return
+        if status in ('done', 'failed'):
+            remove_upload(job['file_path'])
+        print(f"Job {job['id']}: {status}")
+
+        if job.get('callback_url') and status in ('done', 'failed'):
+            send_callback(job['callback_url'], {
+                "id": job['id'],
+                "status": status,
+                "translated_text": transcription,
+                "error": error,
+            })
+
+    def run(self):
+        print(f"Job worker {self.worker_id} polling {self.queue.db_path}")
+        while not self.stop_event.is_set():
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                self.stop_event.wait(self.poll_interval)
+                continue
+            self.process_job(job)
+        print(f"Job worker {self.worker_id} stopped")
+
+    def stop(self, *_):
+        # Finish the current job, then exit
+        self.stop_event.set()
+
+
+def main():
+    worker = JobWorker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+if __name__ == "__main__":
+    main()
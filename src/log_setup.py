@@ -0,0 +1,144 @@
+# log_setup.py
+"""
+Non-blocking logging for the server and the batch processor.
+
+Log calls only put the record on a queue; a QueueListener thread formats it
+and writes to stdout and the optional log file, so slow terminals and disks do
+not add latency to requests. Records carry the id of the request they belong
+to. High-volume per-file messages are marked with extra={"chatter": True} and
+rate-limited, the number of dropped messages is reported with the next one
+that passes.
+
+Environment:
+    LOG_LEVEL                minimum level (default INFO)
+    LOG_FORMAT               'json' (one JSON object per line) or 'text'
+    LOG_CHATTER_PER_SECOND   chatter messages let through per second (default 5)
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Id of the request being handled, follows the request into threadpool calls
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+_listener = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; extra={"fields": {...}} adds event fields"""
+
+    def format(self, record):
+        event = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            event["request_id"] = record.request_id
+        if getattr(record, 'suppressed', 0):
+            event["suppressed"] = record.suppressed
+        event.update(getattr(record, 'fields', None) or {})
+        if record.exc_text:
+            event["exc"] = record.exc_text
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, 'request_id', None):
+            text = f"[{record.request_id}] {text}"
+        fields = getattr(record, 'fields', None)
+        if fields:
+            text += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        if getattr(record, 'suppressed', 0):
+            text += f" (+{record.suppressed} similar messages suppressed)"
+        return text
+
+
+class ContextFilter(logging.Filter):
+    """Attach the current request id (runs in the logging thread, before queueing)"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class ChatterFilter(logging.Filter):
+    """Token bucket for records marked as chatter, per logger"""
+
+    def __init__(self, per_second=None):
+        super().__init__()
+        self.per_second = float(per_second if per_second is not None else os.getenv('LOG_CHATTER_PER_SECOND', '5'))
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'chatter', False):
+            return True
+        now = time.monotonic()
+        with self.lock:
+            tokens, last, suppressed = self.buckets.get(record.name, (self.per_second, now, 0))
+            tokens = min(self.per_second, tokens + (now - last) * self.per_second)
+            if tokens < 1:
+                self.buckets[record.name] = (tokens, now, suppressed + 1)
+                return False
+            self.buckets[record.name] = (tokens - 1, now, 0)
+        record.suppressed = suppressed
+        return True
+
+
+def setup_logging(log_file=None, default_format='text', level=None):
+    """Route all logging through one background listener (idempotent per process)"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+
+        log_format = os.getenv('LOG_FORMAT', default_format).lower()
+        formatter = JsonFormatter() if log_format == 'json' else TextFormatter(TEXT_FORMAT)
+
+        # Once per process instead of per message
+        if hasattr(sys.stdout, 'reconfigure'):
+            sys.stdout.reconfigure(encoding='utf-8')
+
+        handlers = [logging.StreamHandler(sys.stdout)]
+        if log_file:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(ContextFilter())
+        queue_handler.addFilter(ChatterFilter())
+
+        root = logging.getLogger()
+        root.handlers = [queue_handler]
+        level = level or os.getenv('LOG_LEVEL', 'INFO').upper()
+        root.setLevel(getattr(logging, level, logging.INFO))
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        # Drain the queue on exit
+        atexit.register(_listener.stop)
+
+def stop_logging():
+    """Write out queued records, e.g. before the process ends with os._exit()"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
@@ -0,0 +1,160 @@
+# memory_guard.py
+"""
+Memory guardrails for the long-running server workers.
+
+Workers are recycled before their resident memory creeps into swap: after
+WORKER_MAX_REQUESTS requests (hypercorn's max_requests) or once the RSS
+measured after a request exceeds WORKER_MAX_RSS_MB. A recycling worker stops
+taking new requests, lets the ones in flight finish and exits cleanly, and
+hypercorn starts a fresh one.
+
+Uploads reserve the memory their decoded audio will take from a per-worker
+budget before they are queued. Requests that do not fit wait for running ones
+to release theirs (and for the host to have the memory available), requests
+that could never fit are rejected.
+
+Environment:
+    WORKER_MAX_REQUESTS         recycle after this many requests (default 0 = never)
+    WORKER_MAX_REQUESTS_JITTER  random extra requests, so workers do not restart together (default 0)
+    WORKER_MAX_RSS_MB           recycle when the RSS after a request is above this (default 0 = never)
+    WORKER_GRACEFUL_SECONDS     time in-flight requests get when a worker stops (default 300)
+    MEMORY_BUDGET_MB            decoded audio in flight per worker (default 0 = no limit)
+    MEMORY_WAIT_SECONDS         longest wait for memory before answering 503 (default 60)
+"""
+import os
+import time
+import ctypes
+import asyncio
+import logging
+
+SAMPLE_RATE = 16000
+# int16 samples from ffmpeg plus the float32 copy given to the model
+DECODED_BYTES_PER_SAMPLE = 6
+# Host memory kept free besides the reservation itself
+HOST_HEADROOM_BYTES = 256 * 1024 ** 2
+POLL_SECONDS = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+def rss_bytes():
+    """Resident memory of this process, None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def available_bytes():
+    """MemAvailable of the host, None where /proc is not available"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def trim_heap():
+    """Return freed heap pages to the system (glibc only)"""
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def decoded_bytes(duration, window_seconds=None):
+    """Peak memory of the decoded audio; windowed recordings hold one window at a time"""
+    if window_seconds and duration > window_seconds:
+        duration = window_seconds
+    return int(duration * SAMPLE_RATE * DECODED_BYTES_PER_SAMPLE)
+
+
+class MemoryBudget:
+    """Reservations of decoded audio memory, granted while they fit into the budget"""
+
+    def __init__(self, budget_mb=None, max_wait=None):
+        budget_mb = float(budget_mb if budget_mb is not None else os.getenv('MEMORY_BUDGET_MB', '0'))
+        self.budget = int(budget_mb * 1024 ** 2)
+        self.max_wait = float(max_wait if max_wait is not None else os.getenv('MEMORY_WAIT_SECONDS', '60'))
+        self.reserved = 0
+        self.released = asyncio.Event()
+
+    @property
+    def enabled(self):
+        return self.budget > 0
+
+    def could_fit(self, nbytes):
+        return not self.enabled or nbytes <= self.budget
+
+    def _fits(self, nbytes):
+        if self.reserved and self.reserved + nbytes > self.budget:
+            return False
+        available = available_bytes()
+        # Other processes may have taken the host's memory
+        return available is None or available >= nbytes + HOST_HEADROOM_BYTES
+
+    async def acquire(self, nbytes):
+        """Wait until nbytes fit, MemoryBudgetExceeded when they never can or the wait is too long"""
+        if not self.enabled:
+            return
+        if not self.could_fit(nbytes):
+            raise MemoryBudgetExceeded(f"{nbytes / 1024 ** 2:.0f} MB exceed the budget of {self.budget / 1024 ** 2:.0f} MB")
+
+        deadline = time.monotonic() + self.max_wait
+        while not self._fits(nbytes):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise MemoryBudgetExceeded(f"No memory for {nbytes / 1024 ** 2:.0f} MB within {self.max_wait:.0f}s")
+            self.released.clear()
+            try:
+                # Woken by releases; the host's free memory is polled
+                await asyncio.wait_for(self.released.wait(), min(POLL_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                pass
+        # Checked and taken without yielding to the event loop in between
+        self.reserved += nbytes
+
+    def release(self, nbytes):
+        if not self.enabled:
+            return
+        self.reserved -= nbytes
+        self.released.set()
+
+
+class WorkerRecycler:
+    """Counts requests in flight and decides when this worker has grown too large"""
+
+    def __init__(self, max_rss_mb=None):
+        max_rss_mb = float(max_rss_mb if max_rss_mb is not None else os.getenv('WORKER_MAX_RSS_MB', '0'))
+        self.max_rss = int(max_rss_mb * 1024 ** 2)
+        self.in_flight = 0
+        self.draining = False
+
+    @property
+    def enabled(self):
+        return self.max_rss > 0
+
+    def started(self):
+        self.in_flight += 1
+
+    def finished(self):
+        """Mark a request done; True when the worker should exit now"""
+        self.in_flight -= 1
+        if self.enabled and not self.draining:
+            rss = rss_bytes()
+            if rss is not None and rss > self.max_rss:
+                # Often enough to get back under the limit after a large file
+                trim_heap()
+                rss = rss_bytes()
+            if rss is not None and rss > self.max_rss:
+                logger.warning("Worker memory above limit, recycling", extra={"fields": {
+                    "rss_mb": round(rss / 1024 ** 2), "max_rss_mb": round(self.max_rss / 1024 ** 2),
+                    "in_flight": self.in_flight,
+                }})
+                self.draining = True
+        return self.draining and self.in_flight == 0
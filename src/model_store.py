@@ -0,0 +1,56 @@
+# model_store.py
+import os
+
+import torch
+import whisper
+from whisper.model import ModelDimensions, Whisper
+
+# Directory for the float32 weight files shared by all server workers
+MODEL_CACHE_DIR = os.getenv(
+    'MODEL_CACHE_DIR',
+    os.path.join(os.getenv('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'whisper')
+)
+
+def shared_weights_path(model_name):
+    """Path of the memory-mappable weight file for a model"""
+    return os.path.join(MODEL_CACHE_DIR, f"{model_name}-fp32-shared.pt")
+
+def prepare_shared_weights(model_name):
+    """Write a float32 copy of the checkpoint once, so workers can memory-map it
+
+    The original checkpoints are float16 and whisper converts them while loading,
+    which gives every process its own private copy. The converted file is mapped
+    read-only by all workers and its pages stay shared in the page cache.
+    """
+    path = shared_weights_path(model_name)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    print(f"Preparing shared weights for '{model_name}' model: {path}")
+    model = whisper.load_model(model_name, device="cpu")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save({"dims": model.dims.__dict__, "model_state_dict": model.state_dict()}, tmp_path)
+    # Atomic rename - concurrent preparers never expose a half-written file
+    os.replace(tmp_path, path)
+    del model
+    return path
+
+def load_shared_model(model_name):
+    """Load a Whisper model with its weights memory-mapped from the shared file"""
+    path = prepare_shared_weights(model_name)
+    try:
+        checkpoint = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except TypeError:
+        # torch < 2.1 has no mmap support, fall back to a private copy
+        print("torch does not support memory-mapped loading, loading a private model copy")
+        return whisper.load_model(model_name, device="cpu")
+
+    model = Whisper(ModelDimensions(**checkpoint["dims"]))
+    # assign=True keeps the mapped tensors instead of copying them into the
+    # freshly allocated parameters, which are released right after
+    model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+    if model_name in whisper._ALIGNMENT_HEADS:
+        model.set_alignment_heads(whisper._ALIGNMENT_HEADS[model_name])
+    model.requires_grad_(False)
+    return model.eval()
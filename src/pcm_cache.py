@@ -0,0 +1,174 @@
+# pcm_cache.py
+"""
+Persistent cache of decoded audio.
+
+Decoded 16 kHz mono float32 PCM is stored as .npy files named after the
+SHA-256 of the source file's content, so renamed or copied files hit the same
+entry and edited files miss it. Entries are memory-mapped when reused. The
+cache is kept under PCM_CACHE_MAX_GB by evicting the least recently used
+entries.
+
+    python src/pcm_cache.py warm /path/to/audio   # decode a corpus ahead of time
+    python src/pcm_cache.py prune --max-gb 5
+    python src/pcm_cache.py stats
+
+Environment:
+    PCM_CACHE_DIR     cache directory; the cache is off when unset
+    PCM_CACHE_MAX_GB  size cap (default 10)
+"""
+import os
+import sys
+import hashlib
+import threading
+
+import numpy as np
+
+PCM_CACHE_DIR = os.getenv('PCM_CACHE_DIR')
+PCM_CACHE_MAX_GB = float(os.getenv('PCM_CACHE_MAX_GB', '10'))
+
+# Writes after which the running size is recounted, other processes write to the cache too
+RESCAN_EVERY = 100
+# A full cache is pruned to this share of its size, so the next writes do not prune again
+PRUNE_TARGET = 0.9
+
+# (path, size, mtime) -> content hash, so unchanged files are hashed once per process
+_hashes = {}
+_prune_lock = threading.Lock()
+# cache_dir -> [bytes, writes since the last scan], the running size seen by this process
+_sizes = {}
+
+def cache_enabled():
+    return bool(PCM_CACHE_DIR)
+
+def content_hash(file_path):
+    stat = os.stat(file_path)
+    key = (os.path.realpath(file_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _hashes:
+        sha256 = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha256.update(block)
+        _hashes[key] = sha256.hexdigest()
+    return _hashes[key]
+
+def entry_path(file_path, sample_rate, cache_dir=None):
+    return os.path.join(cache_dir or PCM_CACHE_DIR, f"{content_hash(file_path)}_{sample_rate}.npy")
+
+def cached_pcm(file_path, decode, sample_rate, cache_dir=None, max_bytes=None):
+    """PCM of file_path from the cache, decoded with decode(file_path) and stored on a miss"""
+    cache_dir = cache_dir or PCM_CACHE_DIR
+    path = entry_path(file_path, sample_rate, cache_dir)
+    try:
+        pcm = np.load(path, mmap_mode='r')
+        # The modification time is the LRU clock (atime is often disabled)
+        os.utime(path)
+        return pcm
+    except (OSError, ValueError):
+        pass
+
+    pcm = decode(file_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.asarray(pcm, dtype=np.float32))
+    os.replace(tmp_path, path)
+    _count_write(cache_dir, os.path.getsize(path), max_bytes)
+    return pcm
+
+def _count_write(cache_dir, size, max_bytes=None):
+    """Add a new entry to the running size, pruning only once it exceeds the limit"""
+    max_bytes = max_bytes if max_bytes is not None else int(PCM_CACHE_MAX_GB * 1024 ** 3)
+    with _prune_lock:
+        counted = _sizes.get(cache_dir)
+        if counted is None or counted[1] >= RESCAN_EVERY:
+            counted = _sizes[cache_dir] = [sum(size for _, size, _ in entries(cache_dir)), 0]
+        else:
+            counted[0] += size
+            counted[1] += 1
+        if counted[0] <= max_bytes:
+            return
+    prune(cache_dir, int(max_bytes * PRUNE_TARGET))
+
+def entries(cache_dir=None):
+    """[(mtime, size, path)] of all cache entries, oldest first"""
+    cache_dir = cache_dir or PCM_CACHE_DIR
+    result = []
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.npy'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    result.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        pass
+    return sorted(result)
+
+def prune(cache_dir=None, max_bytes=None):
+    """Evict least recently used entries until the cache fits, returns bytes freed"""
+    max_bytes = max_bytes if max_bytes is not None else int(PCM_CACHE_MAX_GB * 1024 ** 3)
+    with _prune_lock:
+        current = entries(cache_dir)
+        total = sum(size for _, size, _ in current)
+        freed = 0
+        for _, size, path in current:
+            if total - freed <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            freed += size
+        _sizes[cache_dir or PCM_CACHE_DIR] = [total - freed, 0]
+    return freed
+
+def warm(source_dir, workers=None, cache_dir=None):
+    """Decode every audio file under source_dir into the cache"""
+    from concurrent.futures import ThreadPoolExecutor
+    from file_discovery import iter_audio_files
+    from converters.audio_converter import decode_pcm, SAMPLE_RATE
+
+    def warm_file(file_path):
+        try:
+            cached_pcm(file_path, decode_pcm, SAMPLE_RATE, cache_dir)
+            return True
+        except Exception as e:
+            print(f"❌ {file_path}: {e}")
+            return False
+
+    # ffmpeg does the work, so threads are enough to use all cores
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        results = list(pool.map(warm_file, iter_audio_files(source_dir)))
+    print(f"✅ Cached {sum(results)}/{len(results)} files")
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Decoded PCM cache')
+    parser.add_argument('--dir', default=PCM_CACHE_DIR, help='Cache directory (default: PCM_CACHE_DIR)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    warm_parser = commands.add_parser('warm', help='Decode all audio files of a directory into the cache')
+    warm_parser.add_argument('source', help='Directory with audio files')
+    warm_parser.add_argument('--workers', type=int, help='Parallel decoders (default: CPU count)')
+    prune_parser = commands.add_parser('prune', help='Evict least recently used entries')
+    prune_parser.add_argument('--max-gb', type=float, default=PCM_CACHE_MAX_GB,
+                              help=f'Size to prune to (default: {PCM_CACHE_MAX_GB})')
+    commands.add_parser('stats', help='Show number and size of cached entries')
+
+    args = parser.parse_args()
+    if not args.dir:
+        parser.error("Set PCM_CACHE_DIR or pass --dir")
+
+    if args.command == 'warm':
+        warm(args.source, args.workers, args.dir)
+    elif args.command == 'prune':
+        freed = prune(args.dir, int(args.max_gb * 1024 ** 3))
+        print(f"🧹 Freed {freed / 1024 ** 2:.1f} MB")
+    current = entries(args.dir)
+    print(f"📦 {len(current)} entries, {sum(size for _, size, _ in current) / 1024 ** 2:.1f} MB in {args.dir}")
+
+if __name__ == "__main__":
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    main()
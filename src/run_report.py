@@ -0,0 +1,216 @@
+# run_report.py
+"""
+Machine-readable reports of batch runs.
+
+Every processed file gets a row with its audio duration and size, the time
+spent decoding, in inference and writing the result, the real-time factor
+(processing time / audio time), the model and the status. At the end of a run
+the rows go to run_report_<timestamp>.csv, and run_report_<timestamp>.json
+holds them together with run-level aggregates: throughput in audio hours per
+wall-clock hour, percentiles of processing time and real-time factor, and the
+slowest files. Past reports give the cost model for runtime estimates of the
+next run (historical_cost).
+
+    python src/run_report.py output/run_report_20250101_120000.json
+
+Environment:
+    RUN_REPORT      0 = no reports (default 1)
+    RUN_REPORT_DIR  where reports are written (default: the output directory)
+"""
+import os
+import csv
+import glob
+import json
+import time
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+import numpy as np
+
+FIELDS = [
+    'file', 'status', 'model', 'duration', 'bytes',
+    'decode_seconds', 'inference_seconds', 'write_seconds', 'total_seconds', 'rtf', 'error',
+]
+PERCENTILES = (50, 90, 99)
+SLOWEST = 10
+# Latest reports used for runtime estimates
+HISTORY_REPORTS = 20
+
+def report_enabled():
+    return int(os.getenv('RUN_REPORT', '1')) == 1
+
+@contextmanager
+def stage_timer(timings, stage):
+    """Add the time spent in the block to timings['<stage>_seconds'] (no-op for None)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            key = f"{stage}_seconds"
+            timings[key] = timings.get(key, 0.0) + time.perf_counter() - start
+
+def file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return None
+
+
+class RunReport:
+    def __init__(self, output_dir=None, name='run_report'):
+        self.output_dir = os.getenv('RUN_REPORT_DIR') or output_dir
+        self.name = name
+        self.started = time.time()
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def add(self, file, status, duration=None, model=None, timings=None, total_seconds=None, error=None,
+            size=None):
+        """Record one file; timings holds decode/inference/write_seconds as filled by stage_timer"""
+        timings = timings or {}
+        if total_seconds is None:
+            total_seconds = sum(timings.get(f"{stage}_seconds", 0.0) for stage in ('decode', 'inference', 'write'))
+        row = {
+            "file": file,
+            "status": status,
+            "model": model,
+            "duration": round(duration, 3) if duration is not None else None,
+            "bytes": size if size is not None else file_size(file),
+            "decode_seconds": round(timings.get("decode_seconds", 0.0), 3),
+            "inference_seconds": round(timings.get("inference_seconds", 0.0), 3),
+            "write_seconds": round(timings.get("write_seconds", 0.0), 3),
+            "total_seconds": round(total_seconds, 3),
+            "rtf": round(total_seconds / duration, 4) if duration else None,
+            "error": error,
+        }
+        with self.lock:
+            self.rows.append(row)
+        return row
+
+    def extend(self, rows):
+        """Rows recorded elsewhere, e.g. by a worker process"""
+        with self.lock:
+            self.rows.extend(rows)
+
+    def aggregates(self):
+        with self.lock:
+            rows = list(self.rows)
+        wall_seconds = time.time() - self.started
+        ok = [row for row in rows if row["status"] == 'ok']
+        audio_seconds = sum(row["duration"] or 0.0 for row in ok)
+        totals = np.array([row["total_seconds"] for row in ok])
+        rtfs = np.array([row["rtf"] for row in ok if row["rtf"] is not None])
+
+        def percentiles(values):
+            if not len(values):
+                return {}
+            return {f"p{p}": round(float(np.percentile(values, p)), 4) for p in PERCENTILES}
+
+        return {
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            "wall_seconds": round(wall_seconds, 1),
+            "files": len(rows),
+            "statuses": {status: sum(row["status"] == status for row in rows)
+                         for status in sorted({row["status"] for row in rows})},
+            "audio_hours": round(audio_seconds / 3600, 3),
+            "bytes": sum(row["bytes"] or 0 for row in rows),
+            # Above 1 the run transcribes faster than real time
+            "audio_hours_per_hour": round(audio_seconds / wall_seconds, 3) if wall_seconds > 0 else None,
+            "stage_seconds": {stage: round(sum(row[f"{stage}_seconds"] for row in rows), 1)
+                              for stage in ('decode', 'inference', 'write')},
+            "rtf": {"mean": round(float(totals.sum() / audio_seconds), 4) if audio_seconds else None,
+                    **percentiles(rtfs)},
+            "total_seconds": percentiles(totals),
+            "slowest": [
+                {key: row[key] for key in ('file', 'total_seconds', 'duration', 'rtf')}
+                for row in sorted(rows, key=lambda row: row["total_seconds"], reverse=True)[:SLOWEST]
+            ],
+        }
+
+    def write(self):
+        """Write the CSV and JSON reports, returns the JSON path (None without rows or directory)"""
+        with self.lock:
+            rows = list(self.rows)
+        if not rows or not self.output_dir:
+            return None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, f"{self.name}_{datetime.fromtimestamp(self.started):%Y%m%d_%H%M%S}")
+        with open(base + '.csv', 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump({"aggregates": self.aggregates(), "files": rows}, f, ensure_ascii=False, indent=2)
+        return base + '.json'
+
+def historical_cost(report_dir, model=None, reports=HISTORY_REPORTS):
+    """Cost model fitted to the files of the latest reports in report_dir, None without history
+
+    Returns {"per_file": seconds, "rtf": seconds per audio second, "files": n}:
+    processing a file takes about per_file + rtf * duration.
+    """
+    report_dir = os.getenv('RUN_REPORT_DIR') or report_dir
+    if not report_dir:
+        return None
+    durations, totals = [], []
+    for path in sorted(glob.glob(os.path.join(report_dir, 'run_report*.json')), key=os.path.getmtime)[-reports:]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                rows = json.load(f)["files"]
+        except (OSError, ValueError, KeyError):
+            continue
+        for row in rows:
+            if row.get("status") == 'ok' and row.get("duration") and (model is None or row.get("model") == model):
+                durations.append(row["duration"])
+                totals.append(row["total_seconds"])
+    if not durations:
+        return None
+
+    durations, totals = np.array(durations), np.array(totals)
+    rtf, per_file = totals.sum() / durations.sum(), 0.0
+    if len(np.unique(durations)) > 1:
+        # Short files pay a fixed overhead (model call, padding to 30 s) on top of their length
+        slope, intercept = np.polyfit(durations, totals, 1)
+        if slope > 0 and intercept >= 0:
+            rtf, per_file = slope, intercept
+    return {"per_file": float(per_file), "rtf": float(rtf), "files": len(durations)}
+
+def file_cost(duration, history=None):
+    """Estimated processing seconds of a file, its audio seconds without history"""
+    if history is None:
+        return duration
+    return history["per_file"] + history["rtf"] * duration
+
+def summary_lines(aggregates):
+    """Short human-readable summary of aggregates()"""
+    lines = [
+        f"Audio: {aggregates['audio_hours']:.2f} h in {aggregates['wall_seconds'] / 3600:.2f} h "
+        f"({aggregates['audio_hours_per_hour'] or 0:.1f} audio hours per hour)",
+        "Stages: " + ', '.join(f"{stage} {seconds:.0f}s" for stage, seconds in aggregates['stage_seconds'].items()),
+    ]
+    if aggregates['rtf'].get('p50') is not None:
+        lines.append("RTF: " + ', '.join(f"{key} {value}" for key, value in aggregates['rtf'].items()))
+    for row in aggregates['slowest'][:3]:
+        lines.append(f"Slow: {os.path.basename(row['file'])} {row['total_seconds']:.1f}s "
+                     f"(RTF {row['rtf'] if row['rtf'] is not None else '-'})")
+    return lines
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Summarize a batch run report')
+    parser.add_argument('report', help='run_report_*.json')
+    args = parser.parse_args()
+
+    with open(args.report, encoding='utf-8') as f:
+        report = json.load(f)
+    aggregates = report['aggregates']
+    print(f"📊 {aggregates['files']} files started {aggregates['started']}: {aggregates['statuses']}")
+    for line in summary_lines(aggregates):
+        print(f"   {line}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# scheduler.py
+"""
+Duration-aware priority scheduling.
+
+Jobs are ordered by priority class first (interactive before bulk) and by
+estimated cost (audio seconds) inside a class, shortest first. Waiting time is
+subtracted from the score, so long and bulk jobs still get their turn under a
+steady stream of short interactive ones.
+
+Parallel batches go the other way: longest-processing-time-first, so the
+long files start early and the run does not end with one worker busy on a
+long file while the others are idle.
+"""
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from contextlib import asynccontextmanager
+
+PRIORITY_CLASSES = {'interactive': 0, 'bulk': 1}
+
+def classify_priority(duration, requested=None):
+    """Priority class for a job: the requested one, or by duration"""
+    if requested in PRIORITY_CLASSES:
+        return requested
+    interactive_max = float(os.getenv('INTERACTIVE_MAX_SECONDS', '60'))
+    return 'interactive' if duration <= interactive_max else 'bulk'
+
+def longest_first(items, cost):
+    """Items ordered by cost(item), highest first; ties keep their order"""
+    return sorted(items, key=lambda item: -cost(item))
+
+def simulate_makespan(costs, workers):
+    """Wall time of running costs in this order on workers that each take the next one when free"""
+    loads = [0.0] * max(1, workers)
+    for cost in costs:
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+class PriorityScheduler:
+    """Thread-safe queue: shortest-job-first within a class, with aging"""
+
+    def __init__(self, aging_rate=None, class_offset=None):
+        # Seconds of cost forgiven per second spent waiting
+        self.aging_rate = float(aging_rate if aging_rate is not None else os.getenv('SCHEDULER_AGING_RATE', '1.0'))
+        # Cost added per priority class rank
+        self.class_offset = float(class_offset if class_offset is not None else os.getenv('SCHEDULER_CLASS_OFFSET', '600'))
+        self._entries = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def _score(self, entry, now):
+        rank, cost, enqueued_at, _, _ = entry
+        return rank * self.class_offset + cost - self.aging_rate * (now - enqueued_at)
+
+    def push(self, item, cost, priority='bulk'):
+        rank = PRIORITY_CLASSES.get(priority, PRIORITY_CLASSES['bulk'])
+        with self._cond:
+            self._entries.append((rank, float(cost), time.monotonic(), next(self._counter), item))
+            self._cond.notify()
+
+    def pop(self, block=True, timeout=None):
+        """Remove and return the best item, None if nothing arrived in time"""
+        with self._cond:
+            if block and not self._entries:
+                self._cond.wait_for(lambda: self._entries, timeout)
+            if not self._entries:
+                return None
+            # Scores change as jobs age, so pick by a linear scan on each pop
+            now = time.monotonic()
+            best = min(range(len(self._entries)), key=lambda i: (self._score(self._entries[i], now), self._entries[i][3]))
+            return self._entries.pop(best)[4]
+
+    def remove(self, item):
+        """Drop a queued item, e.g. a request that was abandoned; False if it is not queued"""
+        with self._cond:
+            for index, entry in enumerate(self._entries):
+                if entry[4] is item:
+                    del self._entries[index]
+                    return True
+            return False
+
+    def queued_cost(self):
+        """Total estimated cost (audio seconds) waiting in the queue"""
+        with self._cond:
+            return sum(entry[1] for entry in self._entries)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._entries)
+
+
+class AsyncAdmissionGate:
+    """Hands a limited number of inference slots to waiting requests in scheduler order"""
+
+    def __init__(self, slots=None, scheduler=None):
+        self.free = int(slots or os.getenv('INFERENCE_SLOTS', '1'))
+        self.scheduler = scheduler or PriorityScheduler()
+
+    async def acquire(self, cost, priority):
+        if self.free > 0 and not len(self.scheduler):
+            self.free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.scheduler.push(waiter, cost, priority)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # The slot may have been handed over right before the cancellation
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                # Gone requests must not count in depth (model routing reads it)
+                self.scheduler.remove(waiter)
+            raise
+
+    def release(self):
+        while True:
+            waiter = self.scheduler.pop(block=False)
+            if waiter is None:
+                self.free += 1
+                return
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    @asynccontextmanager
+    async def slot(self, cost, priority):
+        await self.acquire(cost, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @property
+    def depth(self):
+        """Number of requests waiting for a slot"""
+        return len(self.scheduler)
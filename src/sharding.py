@@ -0,0 +1,126 @@
+# sharding.py
+"""
+Deterministic sharding of a batch across several worker instances.
+
+Every instance sees the same source tree and computes the same assignment, so
+no coordination is needed: instance i of N processes only its own files and
+writes manifest_shard_{i}_of_{N}.json. merge_shard_manifests checks that the
+shards together cover the source exactly once and writes the combined
+manifest.json.
+"""
+import os
+import json
+import hashlib
+
+SHARD_STRATEGIES = ('hash', 'duration')
+
+def parse_shard(value):
+    """'i/N' -> (i, N), with 0 <= i < N"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected i/N (e.g. 0/4)")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{value}', index must be in 0..{count - 1}")
+    return index, count
+
+def relative_key(file_path, root):
+    """Stable identity of a file across machines: its path relative to the source root"""
+    return os.path.relpath(file_path, root).replace(os.sep, '/')
+
+def hash_shard(key, shard_count):
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % shard_count
+
+def assign_by_duration(keys_with_durations, shard_count):
+    """Longest-first greedy assignment to the least loaded shard, key -> shard index"""
+    loads = [0.0] * shard_count
+    assignment = {}
+    # Sorting by key as well keeps ties identical on every instance
+    for key, duration in sorted(keys_with_durations, key=lambda item: (-item[1], item[0])):
+        shard = min(range(shard_count), key=lambda i: (loads[i], i))
+        loads[shard] += duration
+        assignment[key] = shard
+    return assignment
+
+def select_shard(files, root, shard_index, shard_count, strategy='hash', duration_of=None):
+    """Files of one shard; 'hash' streams, 'duration' needs the whole listing"""
+    if strategy not in SHARD_STRATEGIES:
+        raise ValueError(f"Unknown shard strategy: {strategy} (expected one of {SHARD_STRATEGIES})")
+
+    if strategy == 'hash':
+        for file_path in files:
+            if hash_shard(relative_key(file_path, root), shard_count) == shard_index:
+                yield file_path
+        return
+
+    if duration_of is None:
+        from converters.media_probe import probe_duration as duration_of
+    files = list(files)
+    assignment = assign_by_duration(
+        [(relative_key(file_path, root), duration_of(file_path)) for file_path in files],
+        shard_count
+    )
+    for file_path in files:
+        if assignment[relative_key(file_path, root)] == shard_index:
+            yield file_path
+
+def shard_manifest_name(shard_index, shard_count):
+    return f"manifest_shard_{shard_index}_of_{shard_count}.json"
+
+def file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+def merge_shard_manifests(output_dir, shard_count, expected_inputs=None, manifest_name='manifest.json'):
+    """Validate all shard manifests and write the combined manifest
+
+    Returns a list of problems; the combined manifest is only written when
+    there are none.
+    """
+    problems = []
+    outputs = []
+    seen_inputs = {}
+    # Output name -> shard; shards write to one folder, so a repeated name was overwritten
+    seen_outputs = {}
+
+    for shard_index in range(shard_count):
+        path = os.path.join(output_dir, shard_manifest_name(shard_index, shard_count))
+        if not os.path.exists(path):
+            problems.append(f"Missing manifest of shard {shard_index}/{shard_count}")
+            continue
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+
+        for key in manifest.get('inputs', []):
+            if key in seen_inputs:
+                problems.append(f"{key} was processed by shards {seen_inputs[key]} and {shard_index}")
+            seen_inputs[key] = shard_index
+        for key in manifest.get('failed', []):
+            problems.append(f"{key} failed in shard {shard_index}")
+
+        for entry in manifest.get('files', []):
+            if entry['name'] in seen_outputs:
+                problems.append(f"Output {entry['name']} written by shards {seen_outputs[entry['name']]} and {shard_index}")
+            seen_outputs[entry['name']] = shard_index
+            output_path = os.path.join(output_dir, entry['name'])
+            if not os.path.exists(output_path):
+                problems.append(f"Output missing: {entry['name']} (shard {shard_index})")
+            elif entry.get('md5') and file_md5(output_path) != entry['md5']:
+                problems.append(f"Checksum mismatch: {entry['name']} (shard {shard_index})")
+            outputs.append(entry)
+
+    if expected_inputs is not None:
+        for key in sorted(set(expected_inputs) - set(seen_inputs)):
+            problems.append(f"Not assigned to any shard: {key}")
+
+    if not problems:
+        manifest_path = os.path.join(output_dir, manifest_name)
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"files": outputs, "shards": shard_count, "inputs": len(seen_inputs)}, f, indent=2)
+        os.replace(tmp_path, manifest_path)
+
+    return problems
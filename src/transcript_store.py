@@ -0,0 +1,236 @@
+# transcript_store.py
+"""
+SQLite store of transcripts and their segments with a full-text index.
+
+Transcripts are buffered and written in one transaction per batch
+(TRANSCRIPT_BATCH_SIZE entries or TRANSCRIPT_FLUSH_SECONDS, whichever comes
+first). The database runs in WAL mode so several server workers and batch
+runs can write to it while it is being searched. Search goes through an FTS5
+index of the transcript text.
+
+    python src/transcript_store.py search "договор поставки"
+    python src/transcript_store.py search "invoice" --client 42 --segments
+    python src/transcript_store.py stats
+
+Environment:
+    TRANSCRIPT_DB  database path; storing is off when unset
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+TRANSCRIPT_DB = os.getenv('TRANSCRIPT_DB')
+TRANSCRIPT_BATCH_SIZE = int(os.getenv('TRANSCRIPT_BATCH_SIZE', '50'))
+TRANSCRIPT_FLUSH_SECONDS = float(os.getenv('TRANSCRIPT_FLUSH_SECONDS', '5'))
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY,
+    source_path TEXT,
+    client_id TEXT,
+    segment_number TEXT,
+    model TEXT,
+    duration REAL,
+    processing_seconds REAL,
+    created_at REAL NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_source ON transcripts (source_path);
+CREATE INDEX IF NOT EXISTS transcripts_client ON transcripts (client_id, created_at);
+CREATE TABLE IF NOT EXISTS segments (
+    transcript_id INTEGER NOT NULL REFERENCES transcripts (id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    start REAL,
+    end REAL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (transcript_id, idx)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS transcripts_fts USING fts5(
+    text, content='transcripts', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS transcripts_fts_insert AFTER INSERT ON transcripts BEGIN
+    INSERT INTO transcripts_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS transcripts_fts_delete AFTER DELETE ON transcripts BEGIN
+    INSERT INTO transcripts_fts (transcripts_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+def store_enabled():
+    return bool(TRANSCRIPT_DB)
+
+
+class TranscriptStore:
+    def __init__(self, db_path=None, batch_size=None, flush_seconds=None):
+        self.db_path = db_path or TRANSCRIPT_DB
+        self.batch_size = batch_size or TRANSCRIPT_BATCH_SIZE
+        self.flush_seconds = flush_seconds if flush_seconds is not None else TRANSCRIPT_FLUSH_SECONDS
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Durable at checkpoints, not at every commit; a crash loses at most the last batches
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+        # lock guards the queue, db_lock the connection, so queueing never waits for a write
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def add(self, text, source_path=None, client_id=None, segment_number=None, model=None,
+            duration=None, processing_seconds=None, segments=None):
+        """Queue a transcript for the next batch; segments are dicts with start, end and text
+
+        A full batch is written here, in the caller's thread, so async callers
+        run this in a threadpool. A failed write stays queued for the next flush.
+        """
+        with self.lock:
+            self.pending.append((
+                (source_path, client_id, segment_number, model, duration, processing_seconds, time.time(), text),
+                segments or []
+            ))
+            due = len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_seconds
+        if due:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Writing transcripts failed, the batch stays queued")
+        elif self.thread is None:
+            # Writes out a partial batch when no further transcripts arrive
+            self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self.thread.start()
+
+    def flush(self):
+        """Write all queued transcripts in one transaction, re-queued when it fails"""
+        with self.db_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+                self.last_flush = time.monotonic()
+            if not batch:
+                return
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                for row, segments in batch:
+                    transcript_id = self.conn.execute(
+                        "INSERT INTO transcripts (source_path, client_id, segment_number, model, duration,"
+                        " processing_seconds, created_at, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        row
+                    ).lastrowid
+                    self.conn.executemany(
+                        "INSERT INTO segments (transcript_id, idx, start, end, text) VALUES (?, ?, ?, ?, ?)",
+                        [(transcript_id, idx, segment.get("start"), segment.get("end"), segment["text"].strip())
+                         for idx, segment in enumerate(segments)]
+                    )
+                self.conn.execute("COMMIT")
+            except Exception:
+                # BEGIN itself may have failed (e.g. the database stayed locked)
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                with self.lock:
+                    self.pending[:0] = batch
+                raise
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Writing transcripts failed, retrying with the next flush")
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        self.conn.close()
+
+    def search(self, query, limit=20, client_id=None):
+        """Best matches of an FTS5 query with a highlighted snippet"""
+        sql = (
+            "SELECT t.id, t.source_path, t.client_id, t.segment_number, t.model, t.duration, t.created_at,"
+            " snippet(transcripts_fts, 0, '[', ']', '…', 16) AS snippet"
+            " FROM transcripts_fts JOIN transcripts t ON t.id = transcripts_fts.rowid"
+            " WHERE transcripts_fts MATCH ?"
+        )
+        params = [query]
+        if client_id is not None:
+            sql += " AND t.client_id = ?"
+            params.append(client_id)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        with self.db_lock:
+            return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def matching_segments(self, transcript_id, words):
+        """Segments of a transcript that contain any of the words (case-insensitive)"""
+        with self.db_lock:
+            rows = self.conn.execute(
+                "SELECT idx, start, end, text FROM segments WHERE transcript_id = ? ORDER BY idx",
+                (transcript_id,)
+            ).fetchall()
+        words = [word.lower() for word in words]
+        return [dict(row) for row in rows if any(word in row["text"].lower() for word in words)]
+
+    def stats(self):
+        with self.db_lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) AS transcripts, COALESCE(SUM(duration), 0) AS seconds,"
+                " COUNT(DISTINCT client_id) AS clients FROM transcripts"
+            ).fetchone()
+            segments = self.conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        return {**dict(row), "segments": segments}
+
+
+def main():
+    import argparse
+    from datetime import datetime
+
+    parser = argparse.ArgumentParser(description='Search stored transcripts')
+    parser.add_argument('--db', default=TRANSCRIPT_DB, help='Database path (default: TRANSCRIPT_DB)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    search_parser = commands.add_parser('search', help='Full-text search (FTS5 query syntax)')
+    search_parser.add_argument('query')
+    search_parser.add_argument('--limit', type=int, default=20)
+    search_parser.add_argument('--client', help='Only transcripts of this client id')
+    search_parser.add_argument('--segments', action='store_true', help='Show matching segments with timestamps')
+    commands.add_parser('stats', help='Number of stored transcripts and segments')
+
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("Set TRANSCRIPT_DB or pass --db")
+
+    store = TranscriptStore(args.db)
+    if args.command == 'stats':
+        stats = store.stats()
+        print(f"📚 {stats['transcripts']} transcripts, {stats['segments']} segments, "
+              f"{stats['seconds'] / 3600:.1f} h audio, {stats['clients']} clients")
+        return
+
+    start = time.perf_counter()
+    hits = store.search(args.query, args.limit, args.client)
+    elapsed = (time.perf_counter() - start) * 1000
+    for hit in hits:
+        created = datetime.fromtimestamp(hit['created_at']).strftime('%Y-%m-%d %H:%M')
+        print(f"#{hit['id']} {created} {hit['source_path'] or ''} client={hit['client_id'] or '-'} model={hit['model'] or '-'}")
+        print(f"   {hit['snippet']}")
+        if args.segments:
+            words = [word.strip('"*') for word in args.query.split() if word.upper() not in ('AND', 'OR', 'NOT')]
+            for segment in store.matching_segments(hit['id'], words):
+                print(f"   [{segment['start']:.1f}s - {segment['end']:.1f}s] {segment['text']}")
+    print(f"🔎 {len(hits)} result(s) in {elapsed:.1f} ms")
+
+if __name__ == "__main__":
+    main()
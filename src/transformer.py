@@ -1,7 +1,9 @@
 # transformer.py
 import os
+import json
 import subprocess
 import sys
+import threading
 
 try:
     import whisper
@@ -17,14 +19,98 @@ except ImportError:
     subprocess.check_call([sys.executable, "-m", "pip", "install", "pydub"])
     from pydub import AudioSegment
 
-from converters.audio_converter import convert_to_wav
+from converters.audio_converter import (
+    convert_to_wav, load_pcm, iter_pcm_windows, iter_array_windows, needs_windows, probe_duration, SAMPLE_RATE
+)
+from cascade import cascade_enabled, cascade_transcribe, draft_model_name
+from fingerprint import fingerprint_enabled, fingerprint, get_index, FINGERPRINT_MAX_SECONDS
+# Re-exported for src.batch_processor: its relative imports load src.clip_packer and
+# src.converters.* as separate modules, with their own statistics and probe cache
+from clip_packer import transcribe_packed, segments_text, packing_stats
+from run_report import stage_timer
 
-def handle_file_upload(clientId, file, segment_number):
+# Characters of the previous window's text given to the next one as prompt
+PROMPT_CHARS = 200
+# Requests with a deadline (or all cancellable ones with CANCEL_WINDOWS=1) are decoded
+# in windows of this length and checked between them; windows lose context at their
+# boundaries, so other requests are decoded whole
+CANCEL_WINDOW_SECONDS = float(os.getenv('CANCEL_WINDOW_SECONDS', '30'))
+CANCEL_WINDOWS = int(os.getenv('CANCEL_WINDOWS', '0')) == 1
+# Error of a transcription stopped by its cancel event
+CANCELLED = "Cancelled"
+
+# Loaded models per process, reused across requests
+_models = {}
+_models_lock = threading.Lock()
+# Parsed MODEL_ROUTES
+_routes = None
+
+def get_model(model_name=None):
+    """Get or load a Whisper model (once per process)"""
+    model_name = model_name or os.getenv('WHISPER_MODEL', 'small')
+    with _models_lock:
+        if model_name not in _models:
+            if os.getenv('MODEL_SHARE', 'mmap') == 'mmap':
+                from model_store import load_shared_model
+                _models[model_name] = load_shared_model(model_name)
+            else:
+                _models[model_name] = whisper.load_model(model_name)
+        return _models[model_name]
+
+def load_routes():
+    """Model routing rules from MODEL_ROUTES, a JSON list or the path of a JSON file
+
+    Rules are checked in order and the first match picks the model; a request
+    matching none gets WHISPER_MODEL. A rule matches when all its conditions hold:
+    min_duration / max_duration (seconds), priority ('interactive' or 'bulk'),
+    client_ids (list), min_queue / max_queue (requests waiting in this worker):
+
+        [{"model": "base", "max_duration": 20},
+         {"model": "base", "priority": "interactive", "min_queue": 4},
+         {"model": "medium", "client_ids": ["42"]},
+         {"model": "medium", "min_duration": 600}]
+    """
+    global _routes
+    if _routes is None:
+        value = os.getenv('MODEL_ROUTES', '').strip()
+        if value and not value.startswith('['):
+            with open(value, encoding='utf-8') as f:
+                value = f.read()
+        _routes = json.loads(value) if value else []
+    return _routes
+
+def _rule_matches(rule, duration, client_id, priority, queue_depth):
+    checks = {
+        "min_duration": lambda limit: duration >= limit,
+        "max_duration": lambda limit: duration < limit,
+        "priority": lambda value: priority == value,
+        "client_ids": lambda ids: str(client_id) in {str(client) for client in ids},
+        "min_queue": lambda limit: queue_depth >= limit,
+        "max_queue": lambda limit: queue_depth < limit,
+    }
+    return all(check(rule[key]) for key, check in checks.items() if key in rule)
+
+def route_model(duration, client_id=None, priority=None, queue_depth=0):
+    """Model for a request by the first matching MODEL_ROUTES rule"""
+    for rule in load_routes():
+        if _rule_matches(rule, duration, client_id, priority, queue_depth):
+            return rule["model"]
+    return os.getenv('WHISPER_MODEL', 'small')
+
+def routed_models():
+    """All models a request can be routed to"""
+    return {os.getenv('WHISPER_MODEL', 'small')} | {rule["model"] for rule in load_routes()}
+
+def uses_local_model():
+    """Whether this process runs the model itself (not the stand-in or the sidecar)"""
+    return os.getenv('TRANSCRIPTION_BACKEND') != 'stub' and not os.getenv('INFERENCE_SOCKET')
+
+def handle_file_upload(clientId, file, segment_number, upload_dir='uploads', prefix=''):
     if file.filename == '':
         return {"error": "No selected file"}, 400
 
-    filename = generate_filename(segment_number, clientId)
-    filepath = os.path.join('uploads', filename)
+    filename = prefix + generate_filename(segment_number, clientId)
+    filepath = os.path.join(upload_dir, filename)
     
     with open(filepath, "wb") as buffer:
         buffer.write(file.file.read())
@@ -35,14 +121,187 @@ def generate_filename(segment_number, clientId):
     segment_name = os.getenv('SEGMENT_NAME', 'segment')
     return f"{clientId}_{segment_name}_{segment_number}.wav"
     
-def transcribe_audio(file_path):
+def model_label(model_name=None):
+    """Model description stored with results"""
+    model_name = model_name or os.getenv('WHISPER_MODEL', 'small')
+    return f"{draft_model_name()}->{model_name}" if cascade_enabled() else model_name
+
+def _collect_segments(details, result, offset=0.0):
+    if details is not None:
+        details.setdefault("segments", []).extend(
+            {"start": offset + segment["start"], "end": offset + segment["end"], "text": segment["text"]}
+            for segment in result.get("segments", [])
+        )
+
+def transcribe_pcm(pcm, initial_prompt=None, model=None, details=None, offset=0.0):
+    """Text of float32 PCM with the local model, through the draft/final cascade when enabled
+
+    If a details dict is given, the timed segments are appended to details["segments"]
+    (not available for cascade results, whose text is spliced from two models).
+    """
+    model = model or get_model()
+    if cascade_enabled():
+        text, _ = cascade_transcribe(pcm, get_model(draft_model_name()), model, initial_prompt)
+        return text
+    result = model.transcribe(pcm, initial_prompt=initial_prompt)
+    _collect_segments(details, result, offset)
+    return result["text"]
+
+def transcribe_windows(windows, transcribe_pcm, cancel=None, details=None):
+    """Transcribe (offset, pcm) windows one by one, e.g. of a long file with constant memory
+
+    transcribe_pcm(pcm, prompt, offset) returns (text, error); each window is
+    prompted with the end of the text so far to keep the context across the cuts.
+    Once cancel (a threading.Event) is set, no further window is started and the
+    text so far is returned with the error CANCELLED; details["transcribed_seconds"]
+    then tells how much audio it covers.
+    """
+    texts = []
+    windows = iter(windows)
+    while True:
+        with stage_timer(details, 'decode'):
+            window = next(windows, None)
+        if window is None:
+            break
+        offset, pcm = window
+        if cancel is not None and cancel.is_set():
+            if details is not None:
+                details["transcribed_seconds"] = offset
+            return ' '.join(text for text in texts if text), CANCELLED
+        prompt = ' '.join(texts)[-PROMPT_CHARS:] or None
+        with stage_timer(details, 'inference'):
+            text, error = transcribe_pcm(pcm, prompt, offset)
+        if error:
+            return None, f"Window at {offset:.0f}s: {error}"
+        texts.append(text.strip())
+    return ' '.join(text for text in texts if text), None
+
+def _pcm_transcriber(model_name=None, priority=None, details=None):
+    """transcribe_pcm(pcm, prompt, offset) -> (text, error) with the sidecar or the local model"""
+    if os.getenv('INFERENCE_SOCKET'):
+        # Decode here, run the model in the central inference process
+        from inference_sidecar import transcribe_remote
+        return lambda pcm, prompt, offset: transcribe_remote(
+            pcm, options={"initial_prompt": prompt} if prompt else None, priority=priority, model=model_name)
+    model = get_model(model_name)
+    return lambda pcm, prompt, offset: (transcribe_pcm(pcm, prompt, model, details, offset), None)
+
+def transcribe_fingerprinted(file_path, priority=None, details=None, model_name=None, cancel=None,
+                              cancel_windows=False):
+    """Reuse the transcription of the same audio seen before, otherwise transcribe and remember it"""
+    details = details if details is not None else {}
+    with stage_timer(details, 'decode'):
+        pcm = load_pcm(file_path)
+        duration = len(pcm) / SAMPLE_RATE
+        fp = fingerprint(pcm) if duration <= FINGERPRINT_MAX_SECONDS else None
+    if fp is not None:
+        match = get_index().match(fp, duration)
+        if match:
+            print(f"Fingerprint match: {os.path.basename(file_path)} reuses #{match['file_id']} "
+                  f"(bit error rate {match['ber']}, offset {match['offset']:.1f}s)")
+            details["model"] = f"fingerprint:{match['file_id']}"
+            details["segments"] = match["segments"] or []
+            return match["text"], None
+
+    details["model"] = model_label(model_name)
+    transcribe = _pcm_transcriber(model_name, priority, details)
+    if cancel is not None and cancel_windows and duration > CANCEL_WINDOW_SECONDS:
+        text, error = transcribe_windows(iter_array_windows(pcm, CANCEL_WINDOW_SECONDS), transcribe, cancel, details)
+    else:
+        with stage_timer(details, 'inference'):
+            text, error = transcribe(pcm, None, 0.0)
+    if fp is not None and not error and text and text.strip():
+        get_index().add(fp, duration, text, details.get("segments"), file_path)
+    return text, error
+
+def transcribe_audio(file_path, priority=None, details=None, model_name=None, cancel=None, cancel_windows=False):
+    """Returns (text, error); details (a dict) receives the model and timed segments when available
+
+    model_name overrides WHISPER_MODEL, e.g. with the result of route_model().
+    Setting cancel (a threading.Event) stops the transcription at the next
+    window boundary, see transcribe_windows(). Recordings are only cut into
+    CANCEL_WINDOW_SECONDS windows for that with cancel_windows, otherwise only
+    long recordings decoded in windows anyway can stop early.
+    """
     try:
-        model = whisper.load_model("small")
-        wav_file_path = convert_to_wav(file_path)
-        result = model.transcribe(wav_file_path)
+        if os.getenv('TRANSCRIPTION_BACKEND') == 'stub':
+            return "This is a test transcription", None
+        windowed = needs_windows(file_path)
+        if fingerprint_enabled() and not windowed:
+            return transcribe_fingerprinted(file_path, priority, details, model_name, cancel, cancel_windows)
+        if details is not None:
+            details["model"] = model_label(model_name)
+
+        cancellable = cancel is not None and cancel_windows and probe_duration(file_path) > CANCEL_WINDOW_SECONDS
+        if windowed or cancellable:
+            windows = iter_pcm_windows(file_path, CANCEL_WINDOW_SECONDS if cancellable else None)
+            return transcribe_windows(windows, _pcm_transcriber(model_name, priority, details), cancel, details)
+        if os.getenv('INFERENCE_SOCKET'):
+            from inference_sidecar import transcribe_remote
+            with stage_timer(details, 'decode'):
+                pcm = load_pcm(file_path)
+            with stage_timer(details, 'inference'):
+                return transcribe_remote(pcm, priority=priority, model=model_name)
+
+        model = get_model(model_name)
+        if os.getenv('PCM_CACHE_DIR') or cascade_enabled():
+            # Decoded once per content with the cache; the cascade needs the PCM to cut spans from
+            with stage_timer(details, 'decode'):
+                pcm = load_pcm(file_path)
+            with stage_timer(details, 'inference'):
+                return transcribe_pcm(pcm, model=model, details=details), None
+        with stage_timer(details, 'decode'):
+            wav_file_path = convert_to_wav(file_path)
+        with stage_timer(details, 'inference'):
+            result = model.transcribe(wav_file_path)
+        _collect_segments(details, result)
         return result["text"], None 
-        return "This is a test transcription", None
     except Exception as e:
         print(f"Error in audio transcription: {e}")
         return None, str(e)
-    
\ No newline at end of file
+
+def transcribe_pack(file_paths, details_list=None):
+    """[(text, error)] of short files transcribed together in one window, see clip_packer
+
+    Files whose text cannot be told apart in the packed window are transcribed
+    on their own; details_list holds one details dict per file.
+    """
+    details_list = details_list or [{} for _ in file_paths]
+    if not uses_local_model() or cascade_enabled():
+        # Splitting needs the timed segments of one model
+        return [transcribe_audio(file_path, details=details) for file_path, details in zip(file_paths, details_list)]
+
+    pcms = {}
+    for file_path, details in zip(file_paths, details_list):
+        try:
+            with stage_timer(details, 'decode'):
+                pcms[file_path] = load_pcm(file_path)
+        except Exception as e:
+            print(f"Error decoding {file_path} for packing: {e}")
+    packed = [file_path for file_path in file_paths if file_path in pcms]
+    clips = {}
+    if len(packed) > 1:
+        model = get_model()
+        timings = {}
+        try:
+            with stage_timer(timings, 'inference'):
+                clips = dict(zip(packed, transcribe_packed([pcms[file_path] for file_path in packed],
+                                                           lambda pcm: model.transcribe(pcm)["segments"])))
+        except Exception as e:
+            print(f"Error in packed transcription, decoding files on their own: {e}")
+        # The window's inference time is shared by the clips served from it;
+        # the others are timed again when they are transcribed on their own
+        served = [file_path for file_path in packed if clips.get(file_path) is not None]
+        for file_path, details in zip(file_paths, details_list):
+            if file_path in served:
+                details["inference_seconds"] = timings["inference_seconds"] / len(served)
+
+    results = []
+    for file_path, details in zip(file_paths, details_list):
+        if clips.get(file_path) is None:
+            results.append(transcribe_audio(file_path, details=details))
+            continue
+        details["model"] = f"{model_label()} (packed)"
+        details["segments"] = clips[file_path]
+        results.append((segments_text(clips[file_path]), None))
+    return results
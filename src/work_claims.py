@@ -0,0 +1,175 @@
+# work_claims.py
+"""
+Lease-based claims so several hosts can drain one shared source directory.
+
+Every host walks the same tree and claims each file before transcribing it by
+creating a lease file with O_CREAT|O_EXCL in CLAIMS_DIR (on the shared
+filesystem). A background thread refreshes the mtime of held leases; a lease
+not refreshed for CLAIM_LEASE_SECONDS belongs to a crashed host and can be
+taken over. Finished files get a done marker and are never claimed again.
+
+Only plain POSIX file operations are used (exclusive create, rename, utime),
+no broker or lock daemon. Lease age is measured against the filesystem's own
+clock, so hosts with skewed clocks still agree on expiry.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+import threading
+
+CLAIM_LEASE_SECONDS = float(os.getenv('CLAIM_LEASE_SECONDS', '300'))
+
+
+class LeaseManager:
+    """Claims, heartbeats and completes work items identified by a string key"""
+
+    def __init__(self, claims_dir, owner=None, lease_seconds=None, heartbeat_interval=None):
+        self.claims_dir = claims_dir
+        self.lease_dir = os.path.join(claims_dir, 'leases')
+        self.done_dir = os.path.join(claims_dir, 'done')
+        os.makedirs(self.lease_dir, exist_ok=True)
+        os.makedirs(self.done_dir, exist_ok=True)
+
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = lease_seconds if lease_seconds is not None else CLAIM_LEASE_SECONDS
+        self.heartbeat_interval = heartbeat_interval or self.lease_seconds / 3
+        # key -> lease path of leases held by this owner
+        self.held = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _name(self, key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _lease_path(self, key):
+        return os.path.join(self.lease_dir, self._name(key) + '.lease')
+
+    def _done_path(self, key):
+        return os.path.join(self.done_dir, self._name(key) + '.done')
+
+    def _fs_now(self):
+        """Current time as seen by the shared filesystem"""
+        clock_path = os.path.join(self.claims_dir, f'.clock.{self.owner.replace(":", "_")}')
+        with open(clock_path, 'w'):
+            pass
+        now = os.stat(clock_path).st_mtime
+        os.remove(clock_path)
+        return now
+
+    def _read_owner(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f).get('owner')
+        except (OSError, ValueError):
+            return None
+
+    def _create(self, key, path):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"key": key, "owner": self.owner, "claimed": time.time()}, f)
+        return True
+
+    def _steal_expired(self, path):
+        """Remove an expired lease; only one of several racing hosts wins the rename"""
+        try:
+            if self._fs_now() - os.stat(path).st_mtime < self.lease_seconds:
+                return False
+            stale_path = f"{path}.stale.{uuid.uuid4().hex}"
+            os.rename(path, stale_path)
+        except FileNotFoundError:
+            # Released or stolen by someone else in the meantime, just try to create it
+            return True
+
+        # Between our stat and rename another host may have replaced the lease
+        # with a fresh one; put that one back instead of stealing it
+        if self._fs_now() - os.stat(stale_path).st_mtime < self.lease_seconds:
+            try:
+                os.link(stale_path, path)
+            except FileExistsError:
+                pass
+            os.remove(stale_path)
+            return False
+        os.remove(stale_path)
+        return True
+
+    def is_done(self, key):
+        return os.path.exists(self._done_path(key))
+
+    def claim(self, key):
+        """Try to take the lease for key, True if this owner now holds it"""
+        if self.is_done(key):
+            return False
+
+        path = self._lease_path(key)
+        if not self._create(key, path):
+            if not self._steal_expired(path) or not self._create(key, path):
+                return False
+
+        # The previous holder may have finished right before its lease was taken over
+        if self.is_done(key):
+            os.remove(path)
+            return False
+
+        with self.lock:
+            self.held[key] = path
+        self._ensure_heartbeat()
+        return True
+
+    def owns(self, key):
+        path = self.held.get(key)
+        return path is not None and self._read_owner(path) == self.owner
+
+    def complete(self, key):
+        """Mark key as done and drop the lease, False if the lease was lost meanwhile"""
+        still_owned = self.owns(key)
+        with open(self._done_path(key), 'w', encoding='utf-8') as f:
+            json.dump({"key": key, "owner": self.owner, "completed": time.time()}, f)
+        self.release(key)
+        return still_owned
+
+    def release(self, key):
+        """Give the key back without marking it done (e.g. after a failure)"""
+        with self.lock:
+            path = self.held.pop(key, None)
+        if path and self._read_owner(path) == self.owner:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _ensure_heartbeat(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._heartbeat, daemon=True)
+            self.thread.start()
+
+    def _heartbeat(self):
+        while not self.stop_event.wait(self.heartbeat_interval):
+            with self.lock:
+                leases = list(self.held.items())
+            for key, path in leases:
+                if self._read_owner(path) != self.owner:
+                    # Expired and taken over, e.g. after a long pause of this process
+                    with self.lock:
+                        self.held.pop(key, None)
+                    continue
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        """Stop heartbeats and release all held leases"""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        for key in list(self.held):
+            self.release(key)
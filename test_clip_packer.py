@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test script for packing short clips into one window and splitting the text back
+"""
+import os
+import sys
+
+import numpy as np
+
+# Add path to src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from clip_packer import iter_packs, build_window, split_segments, transcribe_packed, segments_text
+
+# Three clips of 2, 3 and 1 s with 1.5 s gaps: 0-2, 3.5-6.5, 8-9
+SPANS = [(0.0, 2.0), (3.5, 6.5), (8.0, 9.0)]
+
+def segment(start, end, text):
+    return {"start": start, "end": end, "text": text}
+
+def test_iter_packs():
+    """Long clips come alone right away, short ones fill windows with their gaps"""
+    clips = [('a', 4), ('b', 20), ('c', 30), ('d', 5), ('e', 5)]
+    assert list(iter_packs(clips, window_seconds=28, gap=1.5, max_clip=25)) == [['c'], ['a', 'b'], ['d', 'e']]
+
+def test_build_window():
+    window, spans = build_window([np.ones(32000), np.ones(48000), np.ones(16000)], gap=1.5)
+    assert spans == SPANS
+    assert len(window) == 9 * 16000 and window[2 * 16000:int(3.5 * 16000)].max() == 0
+
+def test_split_segments_to_clips():
+    """Segments are moved to the time of their clip"""
+    clips = split_segments([segment(0.1, 1.9, "one"), segment(3.6, 5.0, "two"),
+                            segment(5.0, 6.6, "three"), segment(8.0, 9.1, "four")], SPANS)
+    assert [segments_text(clip) for clip in clips] == ["one", "two three", "four"]
+    assert (round(clips[1][0]["start"], 3), round(clips[1][0]["end"], 3)) == (0.1, 1.5)
+
+def test_split_segments_tolerates_overhang():
+    """Timestamps slightly past the middle of a gap still belong to one clip"""
+    clips = split_segments([segment(0.0, 2.85, "one"), segment(2.65, 6.5, "two"), segment(8.0, 9.0, "three")], SPANS)
+    assert [segments_text(clip) for clip in clips] == ["one", "two", "three"]
+
+def test_split_segments_marks_ambiguous_clips():
+    """A segment across a boundary and a clip without text need their own decode"""
+    clips = split_segments([segment(1.0, 5.0, "one two")], SPANS)
+    assert clips == [None, None, None]
+    clips = split_segments([segment(0.0, 2.0, "one"), segment(3.5, 6.5, "two")], SPANS)
+    assert clips[2] is None and segments_text(clips[0]) == "one"
+
+def test_transcribe_packed():
+    windows = []
+    def transcribe_segments(pcm):
+        windows.append(len(pcm))
+        return [segment(0.0, 2.0, "one"), segment(3.5, 6.5, "two"), segment(8.0, 9.0, "three")]
+    clips = transcribe_packed([np.zeros(32000), np.zeros(48000), np.zeros(16000)], transcribe_segments, gap=1.5)
+    assert windows == [9 * 16000]
+    assert [segments_text(clip) for clip in clips] == ["one", "two", "three"]
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -19,6 +19,7 @@ except ImportError:
     FASTER_WHISPER_AVAILABLE = False
 
 from src.converters.audio_converter import convert_to_wav
+from src.autotune import model_kwargs
 
 # Global model instance to avoid reloading
 _model = None
@@ -31,7 +32,7 @@ def get_faster_whisper_model():
         _model = WhisperModel(
             "small", 
             device="cpu", 
-            compute_type="int8"  # Use int8 for speed, float16 for quality
+            **model_kwargs("small", "cpu", "int8", parallel=False)  # Autotuned if available, else int8 for speed
         )
         print("Model loaded successfully!")
     return _model
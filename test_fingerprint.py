@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for fingerprint matching of repeated recordings
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add path to src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from fingerprint import FingerprintIndex, fingerprint
+
+SAMPLE_RATE = 16000
+
+def voice_like(seconds, seed):
+    """Noise with a syllable-rate envelope, different for every seed"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(2, 5) * t + rng.uniform(0, np.pi))
+    return (0.3 * envelope * rng.standard_normal(len(t))).astype(np.float32)
+
+def padded(clip, before, after, noise=0.0):
+    pad = lambda seconds: (noise * np.random.default_rng(7).standard_normal(int(seconds * SAMPLE_RATE))).astype(np.float32)
+    return np.concatenate([pad(before), clip, pad(after)])
+
+def new_index(directory):
+    return FingerprintIndex(db_path=os.path.join(directory, 'fp.db'))
+
+def test_same_audio_matches():
+    """A re-encoded copy (other gain, some noise) reuses the stored text"""
+    with tempfile.TemporaryDirectory() as directory:
+        index = new_index(directory)
+        pcm = voice_like(6, seed=1)
+        index.add(fingerprint(pcm), 6.0, "hello")
+        copy = 0.5 * pcm + 0.003 * np.random.default_rng(2).standard_normal(len(pcm)).astype(np.float32)
+        match = index.match(fingerprint(copy), 6.0)
+        assert match is not None and match["text"] == "hello", match
+
+def test_stretch_of_longer_recording_matches():
+    """A clip cut out of a stored recording reuses the segments inside it, in its own time"""
+    with tempfile.TemporaryDirectory() as directory:
+        index = new_index(directory)
+        pcm = voice_like(20, seed=3)
+        segments = [{"start": 0.0, "end": 4.8, "text": " One."}, {"start": 5.2, "end": 7.5, "text": " Two."},
+                    {"start": 7.5, "end": 9.8, "text": " Three."}, {"start": 10.2, "end": 20.0, "text": " Four."}]
+        index.add(fingerprint(pcm), 20.0, "One. Two. Three. Four.", segments)
+        # 4.992 s is a whole number of sub-fingerprints
+        start = int(4.992 * SAMPLE_RATE)
+        match = index.match(fingerprint(pcm[start:start + 5 * SAMPLE_RATE]), 5.0)
+        assert match is not None and match["text"] == "Two. Three.", match
+        assert abs(match["offset"] - 4.992) < 0.02 and abs(match["segments"][0]["start"] - 0.208) < 0.01
+        # Other audio of the same length is not a stretch of it
+        assert index.match(fingerprint(voice_like(5, seed=4)), 5.0) is None
+
+def test_silence_padded_clips_do_not_match():
+    """Different clips with the same long silence around them are different audio"""
+    for noise in (0.0, 1e-5):
+        with tempfile.TemporaryDirectory() as directory:
+            index = new_index(directory)
+            index.add(fingerprint(padded(voice_like(3, seed=1), 1, 10, noise)), 14.0, "first")
+            match = index.match(fingerprint(padded(voice_like(3, seed=2), 1, 10, noise)), 14.0)
+            assert match is None, f"noise {noise}: {match}"
+
+def test_silence_does_not_match():
+    """Silence has no fingerprint to match"""
+    with tempfile.TemporaryDirectory() as directory:
+        index = new_index(directory)
+        index.add(fingerprint(padded(voice_like(3, seed=1), 1, 10)), 14.0, "first")
+        assert index.match(fingerprint(np.zeros(14 * SAMPLE_RATE, np.float32)), 14.0) is None
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test script for the durable job queue: claims, visibility timeout and ownership
+"""
+import os
+import sys
+import time
+import tempfile
+
+# Add path to src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from job_queue import JobQueue
+
+def new_queue(directory, **kwargs):
+    return JobQueue(db_path=os.path.join(directory, 'jobs.db'), **kwargs)
+
+def upload(directory, name):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'audio')
+    return path
+
+def test_claim_order_and_exclusivity():
+    """Jobs are claimed oldest first and only once while the claim is visible"""
+    with tempfile.TemporaryDirectory() as directory:
+        queue = new_queue(directory)
+        first = queue.enqueue(upload(directory, 'a.wav'))
+        second = queue.enqueue(upload(directory, 'b.wav'))
+        job = queue.claim('w1')
+        assert job["id"] == first and job["attempts"] == 1 and job["status"] == 'running'
+        assert queue.claim('w2')["id"] == second
+        assert queue.claim('w3') is None
+
+def test_expired_claim_is_taken_over():
+    """A job whose claim expired goes to another worker, the old one loses it"""
+    with tempfile.TemporaryDirectory() as directory:
+        queue = new_queue(directory, visibility_timeout=0.2)
+        job_id = queue.enqueue(upload(directory, 'a.wav'))
+        queue.claim('w1')
+        assert queue.claim('w2') is None
+        time.sleep(0.3)
+        job = queue.claim('w2')
+        assert job["id"] == job_id and job["attempts"] == 2
+        assert not queue.complete(job_id, 'w1', 'stale text')
+        assert not queue.extend(job_id, 'w1')
+        assert queue.complete(job_id, 'w2', 'text')
+        assert queue.get(job_id)["result"] == 'text'
+
+def test_extend_keeps_claim():
+    """Heartbeats keep a long job away from other workers"""
+    with tempfile.TemporaryDirectory() as directory:
+        queue = new_queue(directory, visibility_timeout=0.3)
+        job_id = queue.enqueue(upload(directory, 'a.wav'))
+        queue.claim('w1')
+        for _ in range(3):
+            time.sleep(0.15)
+            assert queue.extend(job_id, 'w1')
+        assert queue.claim('w2') is None
+
+def test_fail_retries_then_gives_up():
+    """Failed attempts are retried until max_attempts, only by the claim holder"""
+    with tempfile.TemporaryDirectory() as directory:
+        queue = new_queue(directory, max_attempts=2, retry_delay=0.01)
+        job_id = queue.enqueue(upload(directory, 'a.wav'))
+        queue.claim('w1')
+        assert queue.fail(job_id, 'w2', 'not mine') is None
+        assert queue.fail(job_id, 'w1', 'boom') == 'queued'
+        time.sleep(0.05)
+        queue.claim('w2')
+        assert queue.fail(job_id, 'w2', 'boom again') == 'failed'
+        assert queue.get(job_id)["error"] == 'boom again'
+        assert queue.claim('w3') is None
+
+def test_dead_job_upload_is_removed():
+    """A job that expired on its last attempt fails and its upload is deleted"""
+    with tempfile.TemporaryDirectory() as directory:
+        queue = new_queue(directory, visibility_timeout=0.1, max_attempts=1)
+        path = upload(directory, 'a.wav')
+        job_id = queue.enqueue(path)
+        queue.claim('w1')
+        time.sleep(0.2)
+        assert queue.claim('w2') is None
+        assert queue.get(job_id)["status"] == 'failed'
+        assert not os.path.exists(path)
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
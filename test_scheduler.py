@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test script for duration-aware scheduling and the inference admission gate
+"""
+import os
+import sys
+import time
+import asyncio
+
+# Add path to src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from scheduler import (PriorityScheduler, AsyncAdmissionGate, classify_priority, longest_first,
+                       simulate_makespan)
+
+def test_classify_priority():
+    assert classify_priority(10) == 'interactive'
+    assert classify_priority(3600) == 'bulk'
+    assert classify_priority(10, requested='bulk') == 'bulk'
+
+def test_shortest_first_within_class():
+    scheduler = PriorityScheduler(aging_rate=0, class_offset=600)
+    scheduler.push('long bulk', 900, 'bulk')
+    scheduler.push('short bulk', 5, 'bulk')
+    scheduler.push('long interactive', 50, 'interactive')
+    scheduler.push('short interactive', 10, 'interactive')
+    assert [scheduler.pop(block=False) for _ in range(4)] == \
+        ['short interactive', 'long interactive', 'short bulk', 'long bulk']
+    assert scheduler.pop(block=False) is None
+
+def test_aging_lets_long_jobs_through():
+    scheduler = PriorityScheduler(aging_rate=1000, class_offset=600)
+    scheduler.push('waiting', 100, 'bulk')
+    time.sleep(0.8)
+    scheduler.push('new', 1, 'interactive')
+    assert scheduler.pop(block=False) == 'waiting'
+
+def test_remove():
+    scheduler = PriorityScheduler()
+    item = object()
+    scheduler.push(item, 10)
+    scheduler.push('other', 20)
+    assert scheduler.remove(item) and not scheduler.remove(item)
+    assert len(scheduler) == 1 and scheduler.queued_cost() == 20
+
+def test_longest_first_makespan():
+    costs = [1, 1, 1, 1, 4]
+    assert simulate_makespan(costs, 2) == 6
+    assert simulate_makespan(longest_first(costs, lambda cost: cost), 2) == 4
+
+def test_gate_hands_slots_in_priority_order():
+    async def run():
+        gate = AsyncAdmissionGate(slots=1, scheduler=PriorityScheduler(aging_rate=0))
+        await gate.acquire(1, 'interactive')
+        order = []
+        async def request(name, cost, priority):
+            async with gate.slot(cost, priority):
+                order.append(name)
+        tasks = [asyncio.create_task(request('bulk', 5, 'bulk')),
+                 asyncio.create_task(request('long', 30, 'interactive')),
+                 asyncio.create_task(request('short', 2, 'interactive'))]
+        await asyncio.sleep(0)
+        assert gate.depth == 3
+        gate.release()
+        await asyncio.gather(*tasks)
+        assert order == ['short', 'long', 'bulk'] and gate.free == 1
+    asyncio.run(run())
+
+def test_gate_forgets_cancelled_waiters():
+    """A cancelled request leaves the queue and its slot is not lost"""
+    async def run():
+        gate = AsyncAdmissionGate(slots=1)
+        await gate.acquire(1, 'interactive')
+        waiter = asyncio.create_task(gate.acquire(1, 'interactive'))
+        await asyncio.sleep(0)
+        assert gate.depth == 1
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert gate.depth == 0
+        gate.release()
+        assert gate.free == 1
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
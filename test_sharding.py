@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test script for sharding a batch across instances and merging their manifests
+"""
+import os
+import sys
+import json
+import tempfile
+
+# Add path to src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from sharding import (parse_shard, select_shard, assign_by_duration, shard_manifest_name,
+                      file_md5, merge_shard_manifests)
+
+def write_shard(output_dir, shard_index, shard_count, inputs, outputs, failed=()):
+    """Output files and the manifest of one shard"""
+    files = []
+    for name in outputs:
+        path = os.path.join(output_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"text of {name}")
+        files.append({"name": name, "md5": file_md5(path)})
+    with open(os.path.join(output_dir, shard_manifest_name(shard_index, shard_count)), 'w', encoding='utf-8') as f:
+        json.dump({"inputs": list(inputs), "failed": list(failed), "files": files}, f)
+
+def overwrite(output_dir, name):
+    with open(os.path.join(output_dir, name), 'w', encoding='utf-8') as f:
+        f.write('changed')
+
+def test_parse_shard():
+    assert parse_shard('1/4') == (1, 4)
+    for value in ('4/4', '-1/2', 'a/b', '3'):
+        try:
+            parse_shard(value)
+        except ValueError:
+            continue
+        raise AssertionError(f"{value} accepted")
+
+def test_shards_cover_files_once():
+    root = '/data'
+    files = [f'/data/folder{i % 3}/clip{i}.wav' for i in range(40)]
+    for strategy, duration_of in (('hash', None), ('duration', lambda path: len(path))):
+        selected = [path for index in range(3)
+                    for path in select_shard(files, root, index, 3, strategy, duration_of)]
+        assert sorted(selected) == sorted(files), strategy
+
+def test_duration_assignment_balances():
+    durations = {'a': 10, 'b': 6, 'c': 4, 'd': 1}
+    assignment = assign_by_duration(durations.items(), 2)
+    loads = [sum(duration for key, duration in durations.items() if assignment[key] == shard) for shard in range(2)]
+    assert sorted(loads) == [10, 11]
+
+def test_merge_complete_shards():
+    with tempfile.TemporaryDirectory() as output_dir:
+        write_shard(output_dir, 0, 2, ['a.wav'], ['a.txt'])
+        write_shard(output_dir, 1, 2, ['b.wav'], ['b.txt'])
+        assert merge_shard_manifests(output_dir, 2, expected_inputs=['a.wav', 'b.wav']) == []
+        with open(os.path.join(output_dir, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        assert manifest["inputs"] == 2 and len(manifest["files"]) == 2
+
+def test_merge_reports_problems():
+    """Nothing is merged with a missing shard, duplicates, failures, lost or changed outputs"""
+    cases = {
+        "Missing manifest": lambda d: write_shard(d, 0, 2, ['a.wav'], ['a.txt']),
+        "processed by shards": lambda d: (write_shard(d, 0, 2, ['a.wav'], ['a.txt']),
+                                          write_shard(d, 1, 2, ['a.wav'], ['a2.txt'])),
+        "written by shards": lambda d: (write_shard(d, 0, 2, ['x/a.wav'], ['a.txt']),
+                                        write_shard(d, 1, 2, ['y/a.wav'], ['a.txt'])),
+        "failed in shard": lambda d: (write_shard(d, 0, 2, ['a.wav'], ['a.txt']),
+                                      write_shard(d, 1, 2, ['b.wav'], [], failed=['b.wav'])),
+        "Output missing": lambda d: (write_shard(d, 0, 2, ['a.wav'], ['a.txt']),
+                                     write_shard(d, 1, 2, ['b.wav'], ['b.txt']),
+                                     os.remove(os.path.join(d, 'b.txt'))),
+        "Checksum mismatch": lambda d: (write_shard(d, 0, 2, ['a.wav'], ['a.txt']),
+                                        write_shard(d, 1, 2, ['b.wav'], ['b.txt']),
+                                        overwrite(d, 'b.txt')),
+        "Not assigned to any shard": lambda d: (write_shard(d, 0, 2, ['a.wav'], ['a.txt']),
+                                                write_shard(d, 1, 2, [], [])),
+    }
+    for problem, setup in cases.items():
+        with tempfile.TemporaryDirectory() as output_dir:
+            setup(output_dir)
+            problems = merge_shard_manifests(output_dir, 2, expected_inputs=['a.wav', 'b.wav'])
+            assert any(problem in line for line in problems), (problem, problems)
+            assert not os.path.exists(os.path.join(output_dir, 'manifest.json')), problem
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for lease-based work claims shared by several hosts
+"""
+import os
+import sys
+import time
+import tempfile
+
+# Add path to src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from work_claims import LeaseManager
+
+def test_claim_is_exclusive():
+    """Only one owner holds a key; a released key can be claimed again"""
+    with tempfile.TemporaryDirectory() as directory:
+        first = LeaseManager(directory, owner='host-a')
+        second = LeaseManager(directory, owner='host-b')
+        try:
+            assert first.claim('a.wav')
+            assert not second.claim('a.wav')
+            assert first.owns('a.wav') and not second.owns('a.wav')
+            first.release('a.wav')
+            assert second.claim('a.wav')
+        finally:
+            first.close()
+            second.close()
+
+def test_done_is_never_claimed_again():
+    with tempfile.TemporaryDirectory() as directory:
+        first = LeaseManager(directory, owner='host-a')
+        second = LeaseManager(directory, owner='host-b')
+        try:
+            assert first.claim('a.wav')
+            assert first.complete('a.wav')
+            assert second.is_done('a.wav')
+            assert not second.claim('a.wav') and not first.claim('a.wav')
+        finally:
+            first.close()
+            second.close()
+
+def test_expired_lease_is_taken_over():
+    """A lease not refreshed in time belongs to a crashed host and can be stolen"""
+    with tempfile.TemporaryDirectory() as directory:
+        # Heartbeats far apart stand in for a crashed host
+        crashed = LeaseManager(directory, owner='host-a', lease_seconds=0.3, heartbeat_interval=60)
+        other = LeaseManager(directory, owner='host-b', lease_seconds=0.3)
+        try:
+            assert crashed.claim('a.wav')
+            assert not other.claim('a.wav')
+            time.sleep(0.5)
+            assert other.claim('a.wav')
+            assert other.owns('a.wav') and not crashed.owns('a.wav')
+            # The old holder finishing late reports that it lost the lease
+            assert not crashed.complete('a.wav')
+            assert other.owns('a.wav')
+        finally:
+            crashed.close()
+            other.close()
+
+def test_heartbeat_keeps_lease():
+    with tempfile.TemporaryDirectory() as directory:
+        holder = LeaseManager(directory, owner='host-a', lease_seconds=0.3, heartbeat_interval=0.05)
+        other = LeaseManager(directory, owner='host-b', lease_seconds=0.3)
+        try:
+            assert holder.claim('a.wav')
+            time.sleep(0.6)
+            assert not other.claim('a.wav')
+        finally:
+            holder.close()
+            other.close()
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"✅ {name}")
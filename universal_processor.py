@@ -8,10 +8,30 @@ import os
 import sys
 import platform
 import subprocess
-import glob
 import time
+import shutil
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
 
+# Add path to src
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from src.file_discovery import iter_audio_files
+from src.autotune import model_kwargs, load_tuned_config
+from src.cpu_topology import pinning_enabled, plan_layout, report_layout, pin_process
+from src.clip_packer import packing_enabled, iter_packs, transcribe_packed, segments_text
+from src.run_report import RunReport, report_enabled, stage_timer, summary_lines, historical_cost, file_cost
+from src.scheduler import longest_first, simulate_makespan
+from src.converters.media_probe import probe_duration
+
+try:
+    from src.converters.audio_converter import iter_pcm_windows, needs_windows, load_pcm
+    WINDOWED_DECODING_AVAILABLE = True
+except ImportError:
+    # pydub missing - files are decoded whole by faster-whisper
+    WINDOWED_DECODING_AVAILABLE = False
+
 # Try to load .env file
 try:
     from dotenv import load_dotenv
@@ -23,11 +43,18 @@ except ImportError:
 
 # Try to import required libraries
 try:
-    from faster_whisper import WhisperModel
+    from faster_whisper import WhisperModel, decode_audio
     FASTER_WHISPER_AVAILABLE = True
 except ImportError:
     FASTER_WHISPER_AVAILABLE = False
 
+try:
+    # Batched pipeline (faster-whisper >= 1.1)
+    from faster_whisper import BatchedInferencePipeline
+    BATCHED_PIPELINE_AVAILABLE = True
+except ImportError:
+    BATCHED_PIPELINE_AVAILABLE = False
+
 try:
     import torch
     TORCH_AVAILABLE = True
@@ -35,10 +62,20 @@ except ImportError:
     TORCH_AVAILABLE = False
 
 class UniversalProcessor:
-    def __init__(self):
+    def __init__(self, batch_size=None, workers=None):
         self.model = None
+        self.batched_model = None
         self.device = None
         self.compute_type = None
+        # 0 = sequential decoding, >0 = VAD chunks decoded together in batches of this size
+        self.batch_size = int(batch_size if batch_size is not None else os.getenv('BATCH_SIZE', '0'))
+        # Files transcribed in parallel; None = autotuned value for this host, else 1
+        workers = workers if workers is not None else os.getenv('TRANSCRIBE_WORKERS')
+        self.workers = int(workers) if workers else None
+        # CTranslate2 threads, set for workers pinned to a CPU set
+        self.cpu_threads = None
+        # Per-file stage timings of the current batch (RUN_REPORT)
+        self.report = None
         self.environment = self._detect_environment()
         self._setup_optimal_config()
     
@@ -92,6 +129,12 @@ class UniversalProcessor:
         
         print(f"⚙️  Device: {self.device}")
         print(f"⚡ Compute type: {self.compute_type}")
+        
+        if self.batch_size > 0 and not BATCHED_PIPELINE_AVAILABLE:
+            print("⚠️  Batched inference needs faster-whisper >= 1.1, using sequential decoding")
+            self.batch_size = 0
+        if self.batch_size > 0:
+            print(f"📦 Batch size: {self.batch_size}")
     
     def _get_model(self, model_size="small"):
         """Get or create model (singleton pattern)"""
@@ -101,45 +144,243 @@ class UniversalProcessor:
                 return None
             
             print(f"🔄 Loading {model_size} model...")
+            kwargs = model_kwargs(model_size, self.device, self.compute_type)
+            if self.workers:
+                kwargs['num_workers'] = self.workers
+                if self.device == "cpu":
+                    # Tuned threads were for the tuned worker count
+                    kwargs['cpu_threads'] = max(1, (os.cpu_count() or 1) // self.workers)
+            if self.cpu_threads:
+                kwargs['cpu_threads'] = self.cpu_threads
             self.model = WhisperModel(
                 model_size,
                 device=self.device,
-                compute_type=self.compute_type
+                **kwargs
             )
             print("✅ Model loaded successfully!")
         
         return self.model
     
-    def transcribe_audio(self, file_path, model_size="small"):
-        """Transcribe audio file"""
-        try:
+    def _get_batched_model(self, model_size="small"):
+        """Batched pipeline around the shared model"""
+        if self.batched_model is None:
             model = self._get_model(model_size)
             if model is None:
-                return None, "Model not available"
-            
-            print(f"🎵 Processing: {os.path.basename(file_path)}")
-            
+                return None
+            self.batched_model = BatchedInferencePipeline(model=model)
+        
+        return self.batched_model
+    
+    def _decode(self, model, audio, model_size, initial_prompt=None):
+        """Text of a file path or float32 PCM array"""
+        if self.batch_size > 0:
+            # Speech chunks found by VAD are decoded batch_size at a time
+            segments, _ = self._get_batched_model(model_size).transcribe(
+                audio,
+                language=None,  # Auto detection
+                beam_size=1,
+                best_of=1,
+                temperature=0,
+                initial_prompt=initial_prompt,
+                batch_size=self.batch_size
+            )
+        else:
             # Transcribe
             segments, _ = model.transcribe(
-                file_path,
+                audio,
                 language=None,  # Auto detection
                 beam_size=1,
                 best_of=1,
-                temperature=0
+                temperature=0,
+                initial_prompt=initial_prompt
             )
+        
+        # Collect transcription
+        transcription = ""
+        for segment in segments:
+            transcription += segment.text + " "
+        
+        return transcription.strip()
+    
+    def _use_windows(self, file_path):
+        """Long recordings are streamed in windows (needs ffmpeg unless the file is a WAV)"""
+        if not WINDOWED_DECODING_AVAILABLE or not needs_windows(file_path):
+            return False
+        return file_path.lower().endswith('.wav') or shutil.which('ffmpeg') is not None
+    
+    def transcribe_audio(self, file_path, model_size="small", timings=None):
+        """Transcribe audio file
+        
+        timings (a dict) receives decode_seconds, inference_seconds and the audio duration.
+        """
+        timings = timings if timings is not None else {}
+        try:
+            model = self._get_model(model_size)
+            if model is None:
+                return None, "Model not available"
+            
+            print(f"🎵 Processing: {os.path.basename(file_path)}")
             
-            # Collect transcription
-            transcription = ""
-            for segment in segments:
-                transcription += segment.text + " "
+            if not self._use_windows(file_path):
+                with stage_timer(timings, 'decode'):
+                    # With PCM_CACHE_DIR the decoded audio is reused across runs
+                    use_cache = WINDOWED_DECODING_AVAILABLE and os.getenv('PCM_CACHE_DIR')
+                    audio = load_pcm(file_path) if use_cache else decode_audio(file_path)
+                timings["duration"] = len(audio) / 16000
+                with stage_timer(timings, 'inference'):
+                    return self._decode(model, audio, model_size), None
             
-            return transcription.strip(), None
+            # Constant memory: one window of PCM at a time, prompted with the previous text
+            texts = []
+            windows = iter_pcm_windows(file_path)
+            while True:
+                with stage_timer(timings, 'decode'):
+                    window = next(windows, None)
+                if window is None:
+                    break
+                offset, pcm = window
+                print(f"   🪟 Window at {offset / 60:.1f} min")
+                timings["duration"] = offset + len(pcm) / 16000
+                with stage_timer(timings, 'inference'):
+                    texts.append(self._decode(model, pcm, model_size, ' '.join(texts)[-200:] or None))
+            return ' '.join(text for text in texts if text), None
             
         except Exception as e:
             return None, str(e)
     
-    def process_batch(self, source_dir, output_dir=None, model_size="small"):
-        """Process batch of audio files"""
+    def transcribe_pack(self, file_paths, model_size="small", timings_list=None):
+        """[(text, error)] of short files decoded together in one window (see src/clip_packer.py)"""
+        timings_list = timings_list or [{} for _ in file_paths]
+        model = self._get_model(model_size)
+        if model is None:
+            return [(None, "Model not available")] * len(file_paths)
+        
+        def window_segments(pcm):
+            # The plain model: VAD chunking of the batched pipeline would split the window at the gaps
+            segments, _ = model.transcribe(pcm, language=None, beam_size=1, best_of=1, temperature=0)
+            return [{"start": segment.start, "end": segment.end, "text": segment.text} for segment in segments]
+        
+        print(f"🧩 Packing {len(file_paths)} short files into one window")
+        try:
+            pcms = []
+            for file_path, timings in zip(file_paths, timings_list):
+                with stage_timer(timings, 'decode'):
+                    pcms.append(load_pcm(file_path))
+                timings["duration"] = len(pcms[-1]) / 16000
+            window_timings = {}
+            with stage_timer(window_timings, 'inference'):
+                clips = transcribe_packed(pcms, window_segments)
+            # The window's inference time is shared by the clips served from it;
+            # the others are timed again when they are transcribed on their own
+            served = sum(clip is not None for clip in clips)
+            for clip, timings in zip(clips, timings_list):
+                if clip is not None:
+                    timings["inference_seconds"] = window_timings["inference_seconds"] / served
+        except Exception as e:
+            print(f"⚠️  Packed decoding failed, decoding files on their own: {e}")
+            clips = [None] * len(file_paths)
+        return [
+            (segments_text(clip), None) if clip is not None else self.transcribe_audio(file_path, model_size, timings)
+            for file_path, clip, timings in zip(file_paths, clips, timings_list)
+        ]
+    
+    def _packs(self, files):
+        """Lists of files to process together: short ones share a window with PACK_SHORT_CLIPS=1"""
+        if not (packing_enabled() and WINDOWED_DECODING_AVAILABLE):
+            return ([file_path] for file_path in files)
+        return iter_packs((file_path, probe_duration(file_path)) for file_path in files)
+    
+    def plan_batch(self, source_dir, output_dir, model_size, workers):
+        """[(files, estimated seconds)] of the batch in run order, with the runtime estimate printed
+        
+        Parallel runs go longest-processing-time-first (BATCH_ORDER=scan keeps
+        the scan order). Costs come from the run reports in output_dir.
+        """
+        start = time.time()
+        packs = [(files, [probe_duration(file_path) for file_path in files])
+                 for files in self._packs(iter_audio_files(source_dir))]
+        file_count = sum(len(files) for files, _ in packs)
+        audio_seconds = sum(sum(durations) for _, durations in packs)
+        print(f"🔎 Probed {file_count} files ({audio_seconds / 3600:.2f} audio hours) in {time.time() - start:.1f}s")
+        
+        history = historical_cost(output_dir, model_size)
+        plan = [(files, sum(file_cost(duration, history) for duration in durations)) for files, durations in packs]
+        scan_seconds = simulate_makespan([cost for _, cost in plan], workers)
+        if workers > 1 and os.getenv('BATCH_ORDER', 'lpt').lower() == 'lpt':
+            plan = longest_first(plan, lambda pack: pack[1])
+            print("📐 Order: longest first")
+        
+        if history is None:
+            print("⏳ No run reports of this model yet, no runtime estimate")
+        elif plan:
+            estimate = simulate_makespan([cost for _, cost in plan], workers)
+            print(f"⏳ Estimated time: {estimate / 60:.1f} min on {workers} worker(s) "
+                  f"(scan order: {scan_seconds / 60:.1f} min), "
+                  f"RTF {history['rtf']:.3f} + {history['per_file']:.1f}s per file from {history['files']} past files")
+        return plan
+    
+    def _worker_count(self, model_size):
+        if self.workers:
+            return self.workers
+        return (load_tuned_config(model_size, self.device) or {}).get('num_workers', 1)
+    
+    def _process_file(self, i, file_path, output_dir, model_size, result=None, timings=None):
+        """Transcribe and save one file, True on success (result: (text, error) of a packed window)"""
+        print(f"\n[{i}] ", end="")
+        
+        file_start = time.time()
+        timings = timings if timings is not None else {}
+        transcription, error = result or self.transcribe_audio(file_path, model_size, timings)
+        
+        def record(status, error=None):
+            if self.report is not None:
+                # Packed files were decoded before, their time is the sum of their stages
+                total_seconds = time.time() - file_start if result is None else None
+                self.report.add(file_path, status, timings.get("duration"), model_size, timings, total_seconds, error)
+        
+        if error:
+            print(f"❌ Error: {error}")
+            record('error', error)
+            return False
+        
+        success = False
+        if transcription:
+            # Save result
+            base_name = os.path.splitext(os.path.basename(file_path))[0]
+            output_file = os.path.join(output_dir, f"{base_name}_UNIVERSAL_transcription.txt")
+            
+            with stage_timer(timings, 'write'), open(output_file, 'w', encoding='utf-8') as f:
+                f.write(f"Source: {file_path}\n")
+                f.write(f"Environment: {self.environment}\n")
+                f.write(f"Device: {self.device}\n")
+                f.write(f"Model: {model_size}\n")
+                f.write("=" * 60 + "\n\n")
+                f.write(transcription)
+            
+            print(f"✅ Saved: {os.path.basename(output_file)}")
+            print(f"📝 Text: {transcription[:100]}...")
+            success = True
+        else:
+            print("❌ Empty transcription")
+        
+        record('ok' if success else 'empty')
+        file_end = time.time()
+        print(f"⏱️ Time: {file_end - file_start:.1f}s")
+        return success
+    
+    def _process_files(self, i, files, output_dir, model_size):
+        """_process_file for a list of files numbered from i, short ones decoded in one window"""
+        if len(files) == 1:
+            return [self._process_file(i, files[0], output_dir, model_size)]
+        timings_list = [{} for _ in files]
+        results = self.transcribe_pack(files, model_size, timings_list)
+        return [
+            self._process_file(i + n, file_path, output_dir, model_size, result, timings)
+            for n, (file_path, result, timings) in enumerate(zip(files, results, timings_list))
+        ]
+    
+    def process_batch(self, source_dir, output_dir=None, model_size="small", dry_run=False):
+        """Process batch of audio files (dry_run: only print the plan and runtime estimate)"""
         if output_dir is None:
             output_dir = os.path.join(os.path.dirname(__file__), 'output')
         
@@ -154,61 +395,72 @@ class UniversalProcessor:
         print(f"📁 Output: {output_dir}")
         print(f"🧠 Model: {model_size}")
         print(f"⚙️  Device: {self.device}")
+        print(f"📦 Decoding: {f'batched ({self.batch_size})' if self.batch_size > 0 else 'sequential'}")
+        workers = self._worker_count(model_size)
+        print(f"🧵 Parallel files: {workers}")
         print("=" * 80)
         
-        # Find audio files
-        audio_extensions = ['*.m4a', '*.ogg', '*.wav', '*.mp3', '*.flac', '*.aac']
-        audio_files = []
-        
-        for ext in audio_extensions:
-            pattern = os.path.join(source_dir, '**', ext)
-            files = glob.glob(pattern, recursive=True)
-            audio_files.extend(files)
+        plan = None
+        if workers > 1 or dry_run:
+            # Parallel runs need the whole listing to put the long files first
+            plan = self.plan_batch(source_dir, output_dir, model_size, workers)
+            if dry_run:
+                return
         
-        if not audio_files:
-            print(f"❌ No audio files found in {source_dir}")
-            return
-        
-        print(f"📊 Found {len(audio_files)} audio files")
-        
-        # Process files
+        # Process audio files as they are found
         success_count = 0
         error_count = 0
+        total_files = 0
         start_time = time.time()
+        self.report = RunReport(output_dir) if report_enabled() else None
         
-        for i, file_path in enumerate(audio_files, 1):
-            print(f"\n[{i}/{len(audio_files)}] ", end="")
-            
-            file_start = time.time()
-            transcription, error = self.transcribe_audio(file_path, model_size)
-            
-            if error:
-                print(f"❌ Error: {error}")
-                error_count += 1
-                continue
-            
-            if transcription:
-                # Save result
-                base_name = os.path.splitext(os.path.basename(file_path))[0]
-                output_file = os.path.join(output_dir, f"{base_name}_UNIVERSAL_transcription.txt")
-                
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    f.write(f"Source: {file_path}\n")
-                    f.write(f"Environment: {self.environment}\n")
-                    f.write(f"Device: {self.device}\n")
-                    f.write(f"Model: {model_size}\n")
-                    f.write("=" * 60 + "\n\n")
-                    f.write(transcription)
-                
-                print(f"✅ Saved: {os.path.basename(output_file)}")
-                print(f"📝 Text: {transcription[:100]}...")
-                success_count += 1
-            else:
-                print("❌ Empty transcription")
-                error_count += 1
-            
-            file_end = time.time()
-            print(f"⏱️ Time: {file_end - file_start:.1f}s")
+        if workers > 1 and self.device == "cpu" and pinning_enabled():
+            # One process and model per CPU set, pinned before the model is loaded
+            layout = plan_layout(workers)
+            report_layout(layout)
+            context = multiprocessing.get_context('spawn')
+            slots = context.Queue()
+            for slot in layout:
+                slots.put(slot)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_pinned_worker,
+                                     initargs=(slots, self.batch_size, model_size)) as pool:
+                futures = [
+                    pool.submit(_process_files_pinned, i, files, output_dir, model_size)
+                    for i, files in _numbered(files for files, _ in plan)
+                ]
+                results = []
+                for future in futures:
+                    file_results, rows = future.result()
+                    results.extend(file_results)
+                    if self.report is not None:
+                        self.report.extend(rows)
+                total_files = len(results)
+                success_count = sum(results)
+                error_count = total_files - success_count
+        elif workers > 1:
+            # One model with num_workers=workers: CTranslate2 decodes the files in parallel threads
+            self._get_model(model_size)
+            if self.batch_size > 0:
+                self._get_batched_model(model_size)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(self._process_files, i, files, output_dir, model_size)
+                    for i, files in _numbered(files for files, _ in plan)
+                ]
+                results = [result for future in futures for result in future.result()]
+                total_files = len(results)
+                success_count = sum(results)
+                error_count = total_files - success_count
+        else:
+            for i, files in _numbered(self._packs(iter_audio_files(source_dir))):
+                results = self._process_files(i, files, output_dir, model_size)
+                total_files += len(results)
+                success_count += sum(results)
+                error_count += len(results) - sum(results)
+        
+        if total_files == 0:
+            print(f"❌ No audio files found in {source_dir}")
+            return
         
         # Final stats
         end_time = time.time()
@@ -219,10 +471,44 @@ class UniversalProcessor:
         print("=" * 80)
         print(f"✅ Success: {success_count}")
         print(f"❌ Errors: {error_count}")
-        print(f"📊 Total: {len(audio_files)}")
+        print(f"📊 Total: {total_files}")
         print(f"⏱️ Total time: {total_time:.1f}s")
         if success_count > 0:
-            print(f"⚡ Avg per file: {total_time/len(audio_files):.1f}s")
+            print(f"⚡ Avg per file: {total_time/total_files:.1f}s")
+        
+        if self.report is not None:
+            report_path = self.report.write()
+            for line in summary_lines(self.report.aggregates()):
+                print(f"📊 {line}")
+            print(f"📋 Run report: {report_path}")
+            self.report = None
+
+def _numbered(packs):
+    """(number of the first file, files) for each pack, numbering files from 1"""
+    number = 1
+    for files in packs:
+        yield number, files
+        number += len(files)
+
+# Processor of a pinned worker process
+_pinned_processor = None
+
+def _init_pinned_worker(slots, batch_size, model_size):
+    """Take a CPU set from the layout, pin to it, then load the model there"""
+    global _pinned_processor
+    node, cpus = slots.get()
+    pin_process(cpus, node)
+    _pinned_processor = UniversalProcessor(batch_size=batch_size, workers=1)
+    _pinned_processor.cpu_threads = len(cpus)
+    # Rows are collected here and handed to the parent's report
+    _pinned_processor.report = RunReport()
+    _pinned_processor._get_model(model_size)
+
+def _process_files_pinned(i, files, output_dir, model_size):
+    """(results, report rows) of the files"""
+    results = _pinned_processor._process_files(i, files, output_dir, model_size)
+    rows, _pinned_processor.report.rows = _pinned_processor.report.rows, []
+    return results, rows
 
 def main():
     """Main function"""
@@ -233,12 +519,18 @@ def main():
     parser.add_argument('--output', '-o', help='Output directory (default: ./output)')
     parser.add_argument('--model', '-m', default='small', choices=['tiny', 'base', 'small', 'medium', 'large'], 
                         help='Model size (default: small)')
+    parser.add_argument('--batch-size', '-b', type=int, default=None,
+                        help='Decode VAD chunks in batches of this size, 0 = sequential (default: BATCH_SIZE or 0)')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help='Files transcribed in parallel (default: TRANSCRIBE_WORKERS or autotuned value)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Probe the files and print the runtime estimate from past run reports, without transcribing')
     
     args = parser.parse_args()
     
     # Create processor and run
-    processor = UniversalProcessor()
-    processor.process_batch(args.source, args.output, args.model)
+    processor = UniversalProcessor(batch_size=args.batch_size, workers=args.workers)
+    processor.process_batch(args.source, args.output, args.model, args.dry_run)
 
 if __name__ == "__main__":
     # Check if running with command line arguments